@@ -0,0 +1,68 @@
+"""Cart and checkout hot paths, by cart, catalog and order table size."""
+import pytest
+from django.core.cache import cache
+from django.db import transaction
+
+from store.utils import cartData, cookieCart, guestOrder
+
+from conftest import CART_SIZES, CATALOG_SIZES, ORDER_TABLE_SIZES
+
+cart_sizes = pytest.mark.parametrize('cart_size', CART_SIZES, ids=lambda n: f'cart{n}')
+catalog_sizes = pytest.mark.parametrize('catalog_size', CATALOG_SIZES, ids=lambda n: f'catalog{n}')
+order_table_sizes = pytest.mark.parametrize('order_count', ORDER_TABLE_SIZES, ids=lambda n: f'orders{n}')
+
+
+@cart_sizes
+@catalog_sizes
+def test_cookie_cart_cold(hot_path, seed, guest_request, cart_size, catalog_size):
+    """Signed cookie decoded and resolved against the catalog"""
+    request = guest_request(seed(products=catalog_size), cart_size)
+    assert hot_path(lambda: cookieCart(request), setup=cache.clear) == 1
+
+
+@cart_sizes
+@catalog_sizes
+def test_cookie_cart_cached(hot_path, seed, guest_request, cart_size, catalog_size):
+    """Unchanged cookie served from the resolved cart cache"""
+    request = guest_request(seed(products=catalog_size), cart_size)
+    cookieCart(request)
+    assert hot_path(lambda: cookieCart(request)) == 0
+
+
+@cart_sizes
+@order_table_sizes
+def test_cart_data_customer(hot_path, seed, customer_request, cart_size, order_count):
+    """Open order of a logged-in customer and its lines"""
+    make_request, order = customer_request(seed(products=200, orders=order_count), cart_size)
+    # Customer, open order, joined lines
+    assert hot_path(lambda: cartData(make_request())) == 3
+
+
+@cart_sizes
+def test_get_cart_total(hot_path, seed, customer_request, cart_size):
+    """Stored total, no query whatever the cart size"""
+    _, order = customer_request(seed(products=200), cart_size)
+    assert hot_path(lambda: order.get_cart_total) == 0
+
+
+@cart_sizes
+def test_recompute_totals(hot_path, seed, customer_request, cart_size):
+    """Aggregate of the lines written back to the order"""
+    _, order = customer_request(seed(products=200), cart_size)
+    assert hot_path(order.recompute_totals) == 2
+
+
+@cart_sizes
+@order_table_sizes
+def test_guest_order(hot_path, seed, guest_request, cart_size, order_count):
+    """Guest checkout writes: customer, order, lines and totals"""
+    request = guest_request(seed(products=200, orders=order_count), cart_size)
+    data = {'form': {'name': 'Guest Bench', 'email': 'guest@example.com'}}
+
+    def checkout():
+        # Every round starts from the same state
+        with transaction.atomic():
+            guestOrder(request, data)
+            transaction.set_rollback(True)
+
+    assert hot_path(checkout) <= 10
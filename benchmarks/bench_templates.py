@@ -0,0 +1,46 @@
+"""Rendering of the store and cart pages, views included."""
+import pytest
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import cache
+
+from store import views
+
+from conftest import CART_SIZES, CATALOG_SIZES
+
+
+def _page(view, request):
+    # RequestFactory skips the middlewares the templates rely on
+    request.session = {}
+    request._messages = FallbackStorage(request)
+    response = view(request)
+    assert response.status_code == 200
+    return response
+
+
+@pytest.mark.parametrize('catalog_size', CATALOG_SIZES, ids=lambda n: f'catalog{n}')
+def test_store_page_cold(hot_path, seed, guest_request, catalog_size):
+    """Store page with the catalog cache empty: first page query and grid rendering"""
+    request = guest_request(seed(products=catalog_size), 0)
+    assert hot_path(lambda: _page(views.store, request), setup=cache.clear) <= 2
+
+
+@pytest.mark.parametrize('catalog_size', CATALOG_SIZES, ids=lambda n: f'catalog{n}')
+def test_store_page_cached(hot_path, seed, guest_request, catalog_size):
+    """Store page with the cached grid"""
+    request = guest_request(seed(products=catalog_size), 0)
+    _page(views.store, request)
+    assert hot_path(lambda: _page(views.store, request)) == 0
+
+
+@pytest.mark.parametrize('cart_size', CART_SIZES, ids=lambda n: f'cart{n}')
+def test_cart_page_guest(hot_path, seed, guest_request, cart_size):
+    """Cart page of a guest, resolved cart cached"""
+    request = guest_request(seed(products=200), cart_size)
+    assert hot_path(lambda: _page(views.cart, request)) <= 1
+
+
+@pytest.mark.parametrize('cart_size', CART_SIZES, ids=lambda n: f'cart{n}')
+def test_cart_page_customer(hot_path, seed, customer_request, cart_size):
+    """Cart page of a logged-in customer"""
+    make_request, _ = customer_request(seed(products=200), cart_size)
+    assert hot_path(lambda: _page(views.cart, make_request())) == 3
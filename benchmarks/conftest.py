@@ -0,0 +1,187 @@
+"""Fixtures and baseline checks of the hot path benchmarks.
+
+Every benchmark goes through the `hot_path` fixture: the function is timed
+by pytest-benchmark, its SQL queries are counted on one extra call (as by QueryProfilerMiddleware), and
+both are compared with benchmarks/baselines.json:
+- more queries than the baseline always fails;
+- the fastest round is only reported against the baseline, in the
+  terminal summary: wall time on shared runners varies too much to gate
+  on. --baseline-tolerance makes a slowdown beyond it fail, for runs on a
+  quiet machine. The minimum is compared, not the median: it is the least
+  sensitive to a busy machine. Times are scaled by a pure-Python
+  calibration loop measured on both machines.
+
+`pytest benchmarks --update-baselines` rewrites the file from the current run.
+"""
+import json
+import os
+import time
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+
+from store.middleware import QueryProfile
+from store.models import Customer, Order, OrderItem, Product
+from store.utils import CART_COOKIE, encodeCartCookie
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+CART_SIZES = [1, 20, 100]
+CATALOG_SIZES = [200, 5000]
+ORDER_TABLE_SIZES = [0, 5000]
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('baselines')
+    group.addoption('--update-baselines', action='store_true', help='Rewrite benchmarks/baselines.json')
+    group.addoption('--baseline-tolerance', type=float, default=None,
+                    help='Fail when the fastest round is slower by more than this (1.0: twice as slow); '
+                         'timings are only reported otherwise')
+
+
+def _calibrate():
+    """Fastest run of a fixed pure-Python workload, the speed unit of this machine"""
+    samples = []
+    for _ in range(30):
+        start = time.perf_counter()
+        sorted(str(i) for i in range(5000))
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+class Baselines:
+    def __init__(self, config):
+        self.update = config.getoption('--update-baselines')
+        self.tolerance = config.getoption('--baseline-tolerance')
+        try:
+            with open(BASELINES) as f:
+                self.reference = json.load(f)
+        except FileNotFoundError:
+            self.reference = {}
+        self.results = {}
+        self.timings = []
+
+    def check(self, name, queries, fastest):
+        # Measured right after the benchmark, under the same machine load
+        calibration = _calibrate()
+        self.results[name] = {
+            'queries': queries,
+            'min_us': round(fastest * 1e6, 1) if fastest else None,
+            'calibration_us': round(calibration * 1e6, 1),
+        }
+        expected = self.reference.get(name)
+        if self.update or expected is None:
+            return
+        if queries > expected['queries']:
+            pytest.fail(f"{name}: {queries} queries, baseline {expected['queries']} (+{queries - expected['queries']})")
+        if fastest and expected['min_us']:
+            # Time this run would have taken on the machine of the baseline
+            speed = expected['calibration_us'] / (calibration * 1e6)
+            scaled = fastest * 1e6 * speed
+            delta = scaled / expected['min_us'] - 1
+            report = (
+                f"{name}: {scaled:.1f}us (measured {fastest * 1e6:.1f}us, scaled x{speed:.2f}), "
+                f"baseline {expected['min_us']:.1f}us ({delta:+.0%})"
+            )
+            self.timings.append(report)
+            if self.tolerance is not None and delta > self.tolerance:
+                pytest.fail(f"{report}, tolerance {self.tolerance:.0%}")
+
+    def save(self):
+        with open(BASELINES, 'w') as f:
+            json.dump(dict(sorted({**self.reference, **self.results}.items())), f, indent=2)
+            f.write('\n')
+
+
+def pytest_configure(config):
+    config._baselines = Baselines(config)
+
+
+def pytest_terminal_summary(terminalreporter):
+    baselines = terminalreporter.config._baselines
+    if baselines.timings:
+        terminalreporter.section('fastest round vs baseline')
+        for line in baselines.timings:
+            terminalreporter.write_line(line)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    baselines = session.config._baselines
+    if baselines.update and baselines.results:
+        baselines.save()
+
+
+@pytest.fixture
+def hot_path(request, benchmark):
+    """Time fn, count its queries and compare both with the baseline"""
+    baselines = request.config._baselines
+    name = request.node.name
+
+    def run(fn, setup=None):
+        if setup:
+            setup()
+        # Counted like the request profiler: savepoints are not queries
+        queries = QueryProfile()
+        with connection.execute_wrapper(queries):
+            fn()
+        if setup:
+            # pedantic() calls setup before every round, e.g. to clear a cache
+            benchmark.pedantic(fn, setup=setup, rounds=30, warmup_rounds=1)
+        else:
+            benchmark(fn)
+        stats = benchmark.stats.stats if benchmark.stats else None
+        baselines.check(name, queries.count, stats.min if stats else None)
+        return queries.count
+
+    return run
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+@pytest.fixture
+def seed(db):
+    """Fill the catalog and the order table with the load test generator"""
+    def run(products=0, orders=0, customers=20):
+        call_command('seed_loadtest', products=products, customers=customers if orders else 0,
+                     orders=orders, stdout=StringIO())
+        return list(Product.objects.order_by('id'))
+    return run
+
+
+@pytest.fixture
+def guest_request(rf):
+    def build(products, cart_size):
+        lines = {product.id: 2 for product in products[:cart_size]}
+        request = rf.get('/')
+        request.COOKIES[CART_COOKIE] = encodeCartCookie(lines)
+        request.user = AnonymousUser()
+        return request
+    return build
+
+
+@pytest.fixture
+def customer_request(rf):
+    """Returns a factory of requests of a customer with an open cart, and the order"""
+    def build(products, cart_size):
+        user = User.objects.create_user(username='bench', password='bench')
+        customer = Customer.objects.create(user=user, name='Bench', email='bench@example.com')
+        order = Order.objects.create(customer=customer)
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, product=product, quantity=2) for product in products[:cart_size]]
+        )
+        order.recompute_totals()
+
+        def make():
+            # A fresh user per request, as AuthenticationMiddleware loads it: nothing cached
+            request = rf.get('/')
+            request.user = User(pk=user.pk, username=user.username)
+            return request
+        return make, order
+    return build
@@ -5,10 +5,20 @@ set -e
 mkdir -p /app/db
 chmod 777 /app/db 2>/dev/null || true
 
-echo "Running migrations..."
-python manage.py migrate --noinput
+# Prometheus multiprocess files of a previous run would be aggregated again
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
 
-echo "Collecting static files..."
-python manage.py collectstatic --noinput --clear
+# Only one container migrates: the others (the job worker) set SKIP_MIGRATIONS
+# and wait for it, see docker-compose.yml
+if [ "$SKIP_MIGRATIONS" != "1" ]; then
+    echo "Running migrations..."
+    python manage.py migrate --noinput
+
+    echo "Collecting static files..."
+    python manage.py collectstatic --noinput --clear
+fi
 
 exec "$@"
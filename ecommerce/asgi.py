@@ -2,9 +2,11 @@
 ASGI config for ecommerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Served by gunicorn with uvicorn workers (docker-compose.asgi.yml),
+it routes the page and cart views to store.async_views.
 
 For more information on this file, see
-https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
@@ -12,5 +14,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', 'True')
+# Each request runs its queries on a new thread, where a persistent
+# connection would never be reused (PostgreSQL: pool with pgbouncer)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -5,6 +5,8 @@ Generated by 'django-admin startproject' using Django 3.0.2.
 """
 
 import os
+import sys
+import tempfile
 from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -55,6 +57,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # First, so every log record and query of the request is covered
+    'store.middleware.RequestContextMiddleware',
+    'store.middleware.QueryProfilerMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -82,9 +87,39 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'ecommerce.wsgi.application'
+ASGI_APPLICATION = 'ecommerce.asgi.application'
+
+# Route the page and cart views to their async versions (store.async_views).
+# Set by ecommerce/asgi.py: under WSGI an async view runs in its own event loop.
+ASYNC_VIEWS = get_env_variable('DJANGO_ASYNC_VIEWS', 'False') == 'True'
+
+
+# Under `manage.py test` or pytest
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
 
 
 # Database
+# SQLite production profile. Every new connection gets:
+# - WAL: readers no longer block the writer nor the writer the readers;
+# - synchronous=NORMAL: no fsync per commit in WAL mode, a power loss may
+#   lose the last transactions but never corrupts the file;
+# - memory-mapped reads and a larger page cache (negative: in KiB), kept
+#   across requests by CONN_MAX_AGE;
+# - writers wait up to `timeout` seconds for the lock instead of failing
+#   with "database is locked", and take it when the transaction starts
+#   (IMMEDIATE): a transaction that read first could not wait for it.
+SQLITE_TUNING = {
+    'CONN_MAX_AGE': int(get_env_variable('DB_CONN_MAX_AGE', '60')),
+    'OPTIONS': {
+        'init_command': (
+            'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; '
+            'PRAGMA mmap_size=268435456; PRAGMA cache_size=-32768'
+        ),
+        'timeout': int(get_env_variable('DB_SQLITE_BUSY_TIMEOUT', '20')),
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
+
 if os.environ.get('DATABASE') == 'postgresql':
     DATABASES = {
         'default': {
@@ -94,12 +129,28 @@ if os.environ.get('DATABASE') == 'postgresql':
             'PASSWORD': os.environ.get('DB_PASSWORD', 'django_pass'),
             'HOST': os.environ.get('DB_HOST', 'localhost'),
             'PORT': os.environ.get('DB_PORT', '5432'),
+            # Reused by the following requests of the same worker thread
+            # instead of a new TCP connection and authentication each time,
+            # checked before reuse. ecommerce/asgi.py sets 0: async requests
+            # never run twice on the same thread.
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
             'OPTIONS': {
                 'connect_timeout': 10,
                 'options': '-c timezone=UTC'
             },
         }
     }
+    if os.environ.get('DB_POOLER') == 'pgbouncer':
+        # pgbouncer in transaction mode (docker-compose.postgres.yml): each
+        # transaction may run on another server connection, so no cursor
+        # may outlive one, and startup options are rejected.
+        DATABASES['default'].update(
+            HOST=os.environ.get('DB_POOLER_HOST', 'pgbouncer'),
+            PORT=os.environ.get('DB_POOLER_PORT', '6432'),
+            DISABLE_SERVER_SIDE_CURSORS=True,
+        )
+        del DATABASES['default']['OPTIONS']['options']
 else:
     if os.path.exists('/app/db'):
         db_path = os.path.join('/app/db', 'db.sqlite3')
@@ -111,6 +162,110 @@ else:
             'NAME': db_path,
         }
     }
+    # Production profile, on by default in the container (/app/db), where
+    # gunicorn workers and the job worker write to the same file. Off for
+    # the development database, which WAL mode would rewrite.
+    if get_env_variable('DB_SQLITE_TUNING', str(os.path.exists('/app/db'))) == 'True':
+        DATABASES['default'].update(SQLITE_TUNING)
+    if TESTING:
+        # A file rather than shared memory, where SQLite locks whole tables
+        # across threads: the concurrency tests get one connection per
+        # thread with the usual file locks
+        DATABASES['default']['TEST'] = {'NAME': os.path.join(tempfile.gettempdir(), f'test_ecommerce_{os.getpid()}.sqlite3')}
+
+# Read replica: DB_REPLICA_HOST (PostgreSQL) or DB_REPLICA_NAME (SQLite
+# file, copied from the primary by `manage.py sync_replica`) adds a
+# 'replica' database. store.routers sends the catalog reads and the admin
+# reports there; a client that wrote reads from the primary for
+# REPLICA_STICKY_SECONDS. Under tests the alias is a second test
+# database, routed by the tests that use it.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DB_REPLICA = os.environ.get('DB_REPLICA_HOST')
+    _replica = {'HOST': DB_REPLICA, 'PORT': os.environ.get('DB_REPLICA_PORT', '5432')}
+else:
+    DB_REPLICA = os.environ.get('DB_REPLICA_NAME')
+    _replica = {'NAME': DB_REPLICA}
+if TESTING:
+    DATABASES['replica'] = {**DATABASES['default'], 'NAME': f"{DATABASES['default']['NAME']}_replica"}
+    if 'TEST' in DATABASES['default']:
+        DATABASES['replica']['TEST'] = {'NAME': f"{DATABASES['default']['TEST']['NAME']}_replica"}
+elif DB_REPLICA:
+    DATABASES['replica'] = {**DATABASES['default'], **_replica}
+    DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.contrib.sessions.middleware.SessionMiddleware'),
+                      'store.middleware.ReplicaStickinessMiddleware')
+REPLICA_STICKY_SECONDS = int(get_env_variable('DB_REPLICA_STICKY_SECONDS', '5'))
+
+# Existing tables use 32-bit integer keys
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+
+# Cache
+# Local memory by default; docker-compose.yml points CACHE_BACKEND and
+# CACHE_LOCATION at Redis (django.core.cache.backends.redis.RedisCache,
+# redis://redis:6379/1) so all gunicorn workers share one catalog cache.
+CACHES = {
+    'default': {
+        'BACKEND': get_env_variable('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': get_env_variable('CACHE_LOCATION', 'ecommerce'),
+    }
+}
+# A per-process cache only sees the catalog version bumps of its own process
+CACHE_SHARED = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Catalog entries are invalidated by version bumps on Product changes: with
+# a shared cache the timeout only bounds memory use; with a per-process one
+# it bounds how long the other workers serve a stale catalog
+CATALOG_CACHE_TIMEOUT = int(get_env_variable('CATALOG_CACHE_TIMEOUT', '86400' if CACHE_SHARED else '60'))
+
+# Resolved guest carts, keyed by the cart cookie digest and the catalog version
+CART_CACHE_TIMEOUT = int(get_env_variable('CART_CACHE_TIMEOUT', '3600' if CACHE_SHARED else '60'))
+
+# Stored responses of Idempotency-Key requests are replayed for this many
+# seconds, then deleted by the run_jobs worker (prune_idempotency_keys)
+IDEMPOTENCY_KEY_TTL = int(get_env_variable('IDEMPOTENCY_KEY_TTL', '86400'))
+
+# /metrics answers scrapers on these networks (loopback and the private
+# ranges of the docker networks), or any client sending
+# "Authorization: Bearer <METRICS_TOKEN>" when a token is set
+METRICS_ALLOWED_NETWORKS = get_env_variable(
+    'METRICS_ALLOWED_NETWORKS',
+    '127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16'
+).split(',')
+METRICS_TOKEN = get_env_variable('METRICS_TOKEN', '')
+
+
+# Query budgets per view name, enforced by store.middleware.QueryProfilerMiddleware.
+# Exceeding one logs a warning, or fails the request when strict (always
+# under the test runner). Keys: queries, duplicates, db_time_ms.
+QUERY_BUDGET_STRICT = TESTING or get_env_variable('QUERY_BUDGET_STRICT', 'False') == 'True'
+QUERY_BUDGET_DEFAULT = {'queries': 20, 'duplicates': 2}
+QUERY_BUDGETS = {
+    # Page views: session, user, customer, open order and its lines
+    'store': {'queries': 6, 'duplicates': 0},
+    'cart': {'queries': 6, 'duplicates': 0},
+    'checkout': {'queries': 6, 'duplicates': 0},
+    'payment': {'queries': 6, 'duplicates': 0},
+    'product_list': {'queries': 3, 'duplicates': 0},
+    'search_products': {'queries': 3, 'duplicates': 0},
+    # Cart writes are constant in the number of lines (see store.utils)
+    'update_item': {'queries': 12, 'duplicates': 1},
+    'update_cart': {'queries': 16},
+    # Guest checkout with its Idempotency-Key: 13 for a new guest, 17 when
+    # the guest's previous open cart is overwritten (a dropped line
+    # recomputes the totals once more)
+    'process_order': {'queries': 17, 'duplicates': 2},
+    'login': {'queries': 16, 'duplicates': 1},
+    # Open carts and job queue gauges
+    'metrics': {'queries': 2, 'duplicates': 0},
+}
+
+if TESTING:
+    # Hashing cost is not what the tests measure
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
 
 
 # Password validation
@@ -126,7 +281,6 @@ AUTH_PASSWORD_VALIDATORS = [
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
-USE_L10N = True
 USE_TZ = True
 
 
@@ -156,6 +310,33 @@ if not DEBUG:
     SECURE_HSTS_PRELOAD = True
 
 # Logging Configuration
+# Logging: JSON lines (store.log.JsonFormatter) with the request id, view,
+# latency and query counts. With LOGSTASH_HOST set, records are shipped to
+# the Logstash tcp/json_lines input by a non-blocking queue-backed handler
+# and app.log only receives what could not be delivered.
+LOG_DIR = get_env_variable('LOG_DIR', '/app/logs')
+LOGSTASH_HOST = get_env_variable('LOGSTASH_HOST', '')
+LOGSTASH_PORT = int(get_env_variable('LOGSTASH_PORT', '5000'))
+
+if LOGSTASH_HOST:
+    APP_LOG_HANDLER = {
+        'level': 'INFO',
+        'class': 'store.log.LogstashHandler',
+        'formatter': 'json',
+        'host': LOGSTASH_HOST,
+        'port': LOGSTASH_PORT,
+        'fallback_filename': os.path.join(LOG_DIR, 'app.log'),
+    }
+else:
+    APP_LOG_HANDLER = {
+        'level': 'INFO',
+        'class': 'logging.handlers.RotatingFileHandler',
+        'formatter': 'json',
+        'filename': os.path.join(LOG_DIR, 'app.log'),
+        'maxBytes': 10485760,
+        'backupCount': 5,
+    }
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -164,6 +345,10 @@ LOGGING = {
             'format': '{levelname} {asctime} {module} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'store.log.JsonFormatter',
+            'static_fields': {'service': get_env_variable('SERVICE_NAME', 'ecommerce-web')},
+        },
     },
     'handlers': {
         'console': {
@@ -171,14 +356,7 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
         },
-        'file': {
-            'level': 'INFO',
-            'class': 'logging.handlers.RotatingFileHandler',
-            'formatter': 'verbose',
-            'filename': '/app/logs/app.log',
-            'maxBytes': 10485760,
-            'backupCount': 5,
-        },
+        'file': APP_LOG_HANDLER,
     },
     'loggers': {
         'django': {
@@ -191,5 +369,13 @@ LOGGING = {
             'level': 'WARNING',
             'propagate': True,
         },
+        # Per-request query profiles, budget overruns are warnings
+        'store.middleware': {
+            'level': get_env_variable('QUERY_PROFILER_LOG_LEVEL', 'WARNING' if TESTING else 'INFO'),
+        },
+        # Worker sizing, lifecycle and request stats (gunicorn.conf.py)
+        'store.server': {
+            'level': 'INFO',
+        },
     },
-}
\ No newline at end of file
+}
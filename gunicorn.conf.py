@@ -0,0 +1,202 @@
+"""Gunicorn settings, loaded automatically from the working directory.
+
+Workers and threads are sized from the CPUs and the memory the container
+may use (cgroup limits, else the host):
+- workers: 2 x CPUs + 1, fewer if GUNICORN_WORKER_MEMORY_MB each would not
+  fit in GUNICORN_MEMORY_SHARE of the memory;
+- threads: enough to keep 4 requests per CPU in flight, so a worker
+  waiting on the database does not leave its CPU idle (gthread workers).
+The application is loaded once in the master (preload_app) and shared
+copy-on-write by the workers, which are recycled after max_requests
+requests, with jitter so they do not all restart at once.
+
+Every setting can be forced with a GUNICORN_* variable, e.g.
+GUNICORN_WORKERS=4 or GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker
+(docker-compose.asgi.yml). The hooks below log the sizing, the lifecycle
+of the workers and, every GUNICORN_STATS_INTERVAL seconds, the request
+count and latency percentiles of each worker through the store.server
+logger (JSON, shipped to Logstash like the rest of the application logs).
+"""
+import logging
+import math
+import os
+import threading
+import time
+
+from prometheus_client import multiprocess
+
+MB = 1024 * 1024
+MAX_THREADS = 8
+_CGROUP = '/sys/fs/cgroup'
+
+logger = logging.getLogger('store.server')
+
+
+def _env(name, default, cast=int):
+    value = os.environ.get(f'GUNICORN_{name}')
+    return default if value in (None, '') else cast(value)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit(cgroup=_CGROUP):
+    """CPUs the container may use: cgroup quota, else the affinity mask"""
+    quota = _read(os.path.join(cgroup, 'cpu.max'))
+    if quota:
+        limit, period = quota.split()
+        if limit != 'max':
+            return max(1, math.ceil(int(limit) / int(period)))
+    limit = _read(os.path.join(cgroup, 'cpu', 'cpu.cfs_quota_us'))
+    period = _read(os.path.join(cgroup, 'cpu', 'cpu.cfs_period_us'))
+    if limit and period and int(limit) > 0:
+        return max(1, math.ceil(int(limit) / int(period)))
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def memory_limit_mb(cgroup=_CGROUP, meminfo='/proc/meminfo'):
+    """Memory the container may use in MB: cgroup limit, else the host's"""
+    host = None
+    for line in (_read(meminfo) or '').splitlines():
+        if line.startswith('MemTotal:'):
+            host = int(line.split()[1]) * 1024
+    for path in (os.path.join(cgroup, 'memory.max'), os.path.join(cgroup, 'memory', 'memory.limit_in_bytes')):
+        limit = _read(path)
+        # cgroup v1 reports no limit as a huge number
+        if limit and limit != 'max' and (host is None or int(limit) < host):
+            return int(limit) // MB
+    return host // MB if host else None
+
+
+def size(cpus, memory_mb, worker_memory_mb=80, memory_share=0.75):
+    """(workers, threads) for the given CPUs and memory"""
+    workers = 2 * cpus + 1
+    if memory_mb:
+        workers = max(1, min(workers, int(memory_mb * memory_share // worker_memory_mb)))
+    threads = min(MAX_THREADS, max(1, math.ceil(4 * cpus / workers)))
+    return workers, threads
+
+
+CPUS = cpu_limit()
+MEMORY_MB = memory_limit_mb()
+_workers, _threads = size(
+    CPUS, MEMORY_MB, _env('WORKER_MEMORY_MB', 80), _env('MEMORY_SHARE', 0.75, float)
+)
+
+bind = _env('BIND', '0.0.0.0:8000', str)
+workers = _env('WORKERS', _workers)
+threads = _env('THREADS', _threads)
+worker_class = _env('WORKER_CLASS', 'gthread' if threads > 1 else 'sync', str)
+if worker_class not in ('sync', 'gthread'):
+    # Async workers serve their connections from one event loop
+    threads = 1
+timeout = _env('TIMEOUT', 120)
+graceful_timeout = _env('GRACEFUL_TIMEOUT', 30)
+keepalive = _env('KEEPALIVE', 5)
+preload_app = _env('PRELOAD', 'True', str) == 'True'
+max_requests = _env('MAX_REQUESTS', 1000)
+max_requests_jitter = _env('MAX_REQUESTS_JITTER', 100)
+
+STATS_INTERVAL = _env('STATS_INTERVAL', 60.0, float)
+
+
+class WorkerStats:
+    """Requests and latencies of one worker since the last report"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0
+        self.reset()
+
+    def reset(self):
+        self.latencies = []
+        self.errors = 0
+        self.since = time.monotonic()
+
+    def add(self, latency, status):
+        with self.lock:
+            self.total += 1
+            self.latencies.append(latency)
+            if status >= 500:
+                self.errors += 1
+            if time.monotonic() - self.since >= STATS_INTERVAL:
+                return self.report()
+
+    def report(self):
+        """Fields of the interval, the counters restart"""
+        latencies = sorted(self.latencies)
+        elapsed = max(time.monotonic() - self.since, 1e-9)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1) if latencies else None
+
+        fields = {
+            'requests': len(latencies),
+            'requests_total': self.total,
+            'errors_5xx': self.errors,
+            'rps': round(len(latencies) / elapsed, 2),
+            'latency_p50_ms': percentile(0.50),
+            'latency_p95_ms': percentile(0.95),
+            'latency_p99_ms': percentile(0.99),
+            'latency_max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+        }
+        self.reset()
+        return fields
+
+
+_stats = WorkerStats()
+
+
+def _log_stats(worker, fields, message='Worker stats'):
+    logger.info(
+        f"{message} pid={worker.pid} requests={fields['requests']} rps={fields['rps']} "
+        f"p50={fields['latency_p50_ms']}ms p95={fields['latency_p95_ms']}ms",
+        extra={'worker_pid': worker.pid, **fields},
+    )
+
+
+def when_ready(server):
+    logger.info(
+        f"Gunicorn ready: {server.cfg.workers} {server.cfg.worker_class_str} workers x {server.cfg.threads} threads "
+        f"(cpus={CPUS}, memory={MEMORY_MB}MB, preload={server.cfg.preload_app})",
+        extra={'workers': server.cfg.workers, 'threads': server.cfg.threads, 'cpus': CPUS, 'memory_mb': MEMORY_MB},
+    )
+
+
+def post_fork(server, worker):
+    # Connections opened by the master while loading the app are not shared
+    if server.cfg.preload_app:
+        from django.db import connections
+        connections.close_all()
+
+
+def pre_request(worker, req):
+    req.started = time.perf_counter()
+
+
+def post_request(worker, req, environ, resp):
+    fields = _stats.add(time.perf_counter() - req.started, resp.status_code or 0)
+    if fields:
+        _log_stats(worker, fields)
+
+
+def worker_exit(server, worker):
+    # Recycled after max_requests, or stopped
+    _log_stats(worker, _stats.report(), 'Worker exiting')
+
+
+def worker_abort(worker):
+    logger.warning(f"Worker pid={worker.pid} timed out after {worker.timeout}s", extra={'worker_pid': worker.pid})
+
+
+def child_exit(server, worker):
+    # Live gauges of a dead worker must not be aggregated any more
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
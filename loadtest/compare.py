@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Compare two load test results saved by run.py.
+
+    python loadtest/compare.py loadtest/results/<before> loadtest/results/<after>
+"""
+import json
+import os
+import sys
+
+
+def load_summary(path):
+    if os.path.isdir(path):
+        path = os.path.join(path, 'summary.json')
+    with open(path) as f:
+        return json.load(f)
+
+
+def _endpoints(summary):
+    # Aggregated last, endpoints in alphabetical order
+    return sorted(summary['endpoints'], key=lambda name: (name == 'Aggregated', name))
+
+
+def print_summary(summary):
+    print(f"{summary['commit']} {summary['host']} users={summary['users']} run_time={summary['run_time']}")
+    print(f"{'endpoint':<28} {'req':>7} {'fail':>5} {'req/s':>8} {'p50':>7} {'p95':>7} {'p99':>7}")
+    for name in _endpoints(summary):
+        e = summary['endpoints'][name]
+        print(f"{name:<28} {e['requests']:>7} {e['failures']:>5} {e['rps']:>8.1f} "
+              f"{e['p50']:>7.0f} {e['p95']:>7.0f} {e['p99']:>7.0f}")
+
+
+def _delta(before, after):
+    if not before:
+        return '    n/a'
+    return f'{(after - before) / before * 100:>+6.0f}%'
+
+
+def print_comparison(before, after):
+    print(f"{before['commit']} -> {after['commit']} (latences en ms, variation relative)")
+    print(f"{'endpoint':<28} {'req/s':>17} {'p50':>15} {'p95':>15} {'p99':>15}")
+    for name in _endpoints(after):
+        new = after['endpoints'][name]
+        old = before['endpoints'].get(name)
+        if old is None:
+            print(f"{name:<28} (nouveau)")
+            continue
+        print(f"{name:<28} {new['rps']:>9.1f} {_delta(old['rps'], new['rps'])}"
+              + ''.join(f" {new[p]:>7.0f} {_delta(old[p], new[p])}" for p in ('p50', 'p95', 'p99')))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(__doc__.strip())
+    print_comparison(load_summary(sys.argv[1]), load_summary(sys.argv[2]))
@@ -0,0 +1,32 @@
+"""Settings of `serving.py --db-latency`: a remote database, simulated.
+
+The settings of LOADTEST_BASE_SETTINGS (ecommerce.settings by default)
+plus a sleep of LOADTEST_DB_LATENCY_MS before every SQL query, the round
+trip a database on another host adds. The sleep releases the GIL like a
+socket wait does, so it only holds the thread that runs the query.
+"""
+import importlib
+import os
+import time
+
+from django.db.backends.signals import connection_created
+
+_base = importlib.import_module(os.environ.get('LOADTEST_BASE_SETTINGS', 'ecommerce.settings'))
+globals().update({name: value for name, value in vars(_base).items() if name.isupper()})
+
+_DELAY = float(os.environ.get('LOADTEST_DB_LATENCY_MS', '0')) / 1000
+
+
+def _round_trip(execute, sql, params, many, context):
+    time.sleep(_DELAY)
+    return execute(sql, params, many, context)
+
+
+def _add_round_trip(sender, connection, **kwargs):
+    # Sent again each time the same wrapper reconnects
+    if _round_trip not in connection.execute_wrappers:
+        # First, under the wrappers of an execute_wrapper() block that may be open
+        connection.execute_wrappers.insert(0, _round_trip)
+
+
+connection_created.connect(_add_round_trip)
@@ -0,0 +1,129 @@
+"""Shopping scenarios for Locust.
+
+GuestShopper and CustomerShopper walk the full purchase funnel
+(browse -> search -> add to cart -> cart -> checkout -> pay) the way the
+templates and static/js/cart.js do: CSRF token from the csrftoken cookie,
+batched cart operations on /update_cart/ and an Idempotency-Key on
+/process_order/. Customers log in as the loadtest_NNNNN accounts created
+by `manage.py seed_loadtest`.
+
+Environment:
+    LOADTEST_CUSTOMERS   number of seeded customer accounts (200)
+    LOADTEST_PASSWORD    their password (loadtest123)
+    LOADTEST_WAIT        max think time between steps in seconds (1.0, 0 = none)
+"""
+import itertools
+import json
+import os
+import random
+import uuid
+
+from locust import HttpUser, SequentialTaskSet, between, constant, task
+
+CUSTOMERS = int(os.environ.get('LOADTEST_CUSTOMERS', 200))
+PASSWORD = os.environ.get('LOADTEST_PASSWORD', 'loadtest123')
+WAIT = float(os.environ.get('LOADTEST_WAIT', 1.0))
+SEARCH_TERMS = ['casque', 'clavier pro', 'souris', 'ecran max', 'formation', 'montre sport', 'cable']
+SHIPPING = {'address': '1 rue de la Charge', 'city': 'Paris', 'state': 'IDF', 'zipcode': '75001'}
+
+_accounts = itertools.count()
+
+
+class Funnel(SequentialTaskSet):
+    """Steps shared by both shoppers, run in declaration order"""
+
+    def on_start(self):
+        self.product_ids = self.user.catalog()
+
+    def post_json(self, url, payload, headers=None, **kwargs):
+        return self.client.post(
+            url, data=json.dumps(payload), name=url,
+            headers={'Content-Type': 'application/json', 'X-CSRFToken': self.user.csrf_token(), **(headers or {})},
+            **kwargs
+        )
+
+    @task
+    def browse(self):
+        self.client.get('/', name='/')
+        self.client.get('/api/products/?sort=price-asc&limit=24', name='/api/products/')
+
+    @task
+    def search(self):
+        self.client.get(f'/api/search/?q={random.choice(SEARCH_TERMS)}', name='/api/search/')
+
+    @task
+    def add_to_cart(self):
+        # One flush of the debounced cart.js queue: a few products, some clicked twice
+        picked = random.sample(self.product_ids, min(len(self.product_ids), random.randint(1, 4)))
+        operations = [{'productId': pk, 'delta': random.randint(1, 2)} for pk in picked]
+        with self.post_json('/update_cart/', {'operations': operations}, catch_response=True) as response:
+            if response.status_code != 200 or not response.json().get('cartItems'):
+                response.failure(f'cart not updated: {response.status_code}')
+
+    @task
+    def view_cart(self):
+        self.client.get('/cart/', name='/cart/')
+        self.client.get('/checkout/', name='/checkout/')
+
+
+class GuestFunnel(Funnel):
+    @task
+    def process_order(self):
+        payload = {
+            'form': {'name': 'Invité Charge', 'email': f'guest-{uuid.uuid4().hex[:12]}@example.com', 'total': 0},
+            'shipping': SHIPPING,
+        }
+        self.post_json('/process_order/', payload, headers={'Idempotency-Key': uuid.uuid4().hex})
+        self.interrupt()
+
+
+class CustomerFunnel(Funnel):
+    @task
+    def pay(self):
+        self.client.get('/payment/', name='/payment/')
+        # The redirect to /order-success/ is followed and timed with this request
+        self.client.post('/process_payment/', name='/process_payment/', data={
+            'card_number': '4242 4242 4242 4242', 'card_holder': 'Client Charge', 'expiry': '12/30', 'cvv': '123',
+            'csrfmiddlewaretoken': self.user.csrf_token(),
+        }, headers={'Referer': f'{self.user.host}/payment/'})
+        self.interrupt()
+
+
+class Shopper(HttpUser):
+    abstract = True
+    wait_time = between(0, WAIT) if WAIT else constant(0)
+    product_ids = None
+
+    def on_start(self):
+        # The login form sets the csrftoken cookie the cart and checkout calls need
+        self.client.get('/login/', name='/login/')
+
+    def csrf_token(self):
+        return self.client.cookies.get('csrftoken', '')
+
+    def catalog(self):
+        if Shopper.product_ids is None:
+            response = self.client.get('/api/products/?limit=100', name='/api/products/')
+            Shopper.product_ids = [product['id'] for product in response.json()['products']]
+        return Shopper.product_ids
+
+
+class GuestShopper(Shopper):
+    """Anonymous visitor, cart in the signed cookie, guest checkout"""
+    weight = 3
+    tasks = [GuestFunnel]
+
+
+class CustomerShopper(Shopper):
+    """Logged-in customer, cart in the database, card payment"""
+    weight = 1
+    tasks = [CustomerFunnel]
+
+    def on_start(self):
+        super().on_start()
+        self.username = f'loadtest_{next(_accounts) % CUSTOMERS:05d}'
+        with self.client.post('/login/', name='/login/', catch_response=True, data={
+            'username': self.username, 'password': PASSWORD, 'csrfmiddlewaretoken': self.csrf_token(),
+        }, allow_redirects=False) as response:
+            if response.status_code != 302:
+                response.failure(f'login failed for {self.username}, run manage.py seed_loadtest first')
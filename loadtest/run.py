@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""Run the Locust scenarios headless and save the results of this commit.
+
+Each run writes loadtest/results/<date>-<commit>/ with the raw Locust CSV
+files, the HTML report and summary.json (throughput and p50/p95/p99 per
+endpoint), then prints the summary, compared with --compare if given.
+
+    python loadtest/run.py --host http://localhost              # docker compose stack
+    python loadtest/run.py --runserver --users 20 --run-time 30s  # Django development server
+    python loadtest/run.py --host http://localhost --compare loadtest/results/<previous run>
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from compare import load_summary, print_comparison, print_summary
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+RESULTS = os.path.join(HERE, 'results')
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD'], cwd=ROOT).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+
+def wait_for_port(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"Le serveur n'a pas démarré sur {host}:{port}")
+
+
+def start_runserver(port):
+    server = subprocess.Popen(
+        [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload', '--insecure'],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    wait_for_port('127.0.0.1', port)
+    return server
+
+
+def read_stats(prefix):
+    """Per-endpoint figures from the <prefix>_stats.csv file written by Locust"""
+    endpoints = {}
+    with open(f'{prefix}_stats.csv', newline='') as f:
+        for row in csv.DictReader(f):
+            name = 'Aggregated' if row['Name'] == 'Aggregated' else f"{row['Type']} {row['Name']}"
+            endpoints[name] = {
+                'requests': int(row['Request Count']),
+                'failures': int(row['Failure Count']),
+                'rps': round(float(row['Requests/s']), 2),
+                'p50': float(row['50%']),
+                'p95': float(row['95%']),
+                'p99': float(row['99%']),
+                'avg': round(float(row['Average Response Time']), 1),
+            }
+    return endpoints
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Test de charge Locust des parcours d\'achat')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--host', default='http://localhost', help='URL de la stack à tester')
+    target.add_argument('--runserver', action='store_true', help='Démarre manage.py runserver pour le test')
+    parser.add_argument('--port', type=int, default=8089, help='Port du serveur de développement')
+    parser.add_argument('--users', type=int, default=50, help='Utilisateurs simultanés')
+    parser.add_argument('--spawn-rate', type=float, default=10, help='Utilisateurs démarrés par seconde')
+    parser.add_argument('--run-time', default='1m', help='Durée (30s, 5m, ...)')
+    parser.add_argument('--wait', type=float, default=1.0, help='Temps de réflexion maximal entre deux étapes')
+    parser.add_argument('--customers', type=int, default=200, help='Comptes créés par seed_loadtest')
+    parser.add_argument('--label', default='', help='Suffixe du répertoire de résultats')
+    parser.add_argument('--compare', help='Résultat précédent (répertoire ou summary.json)')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    name = '-'.join(filter(None, [datetime.datetime.now().strftime('%Y%m%d-%H%M%S'), commit, args.label]))
+    output = os.path.join(RESULTS, name)
+    os.makedirs(output)
+
+    server = start_runserver(args.port) if args.runserver else None
+    host = f'http://127.0.0.1:{args.port}' if server else args.host
+    env = dict(os.environ, LOADTEST_WAIT=str(args.wait), LOADTEST_CUSTOMERS=str(args.customers))
+    try:
+        subprocess.run([
+            'locust', '-f', os.path.join(HERE, 'locustfile.py'), '--headless', '--only-summary',
+            '--host', host, '--users', str(args.users), '--spawn-rate', str(args.spawn_rate),
+            '--run-time', args.run_time, '--csv', os.path.join(output, 'locust'),
+            '--html', os.path.join(output, 'report.html'),
+        ], env=env, check=False)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    summary = {
+        'commit': commit,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'host': 'runserver' if server else host,
+        'users': args.users,
+        'run_time': args.run_time,
+        'wait': args.wait,
+        'endpoints': read_stats(os.path.join(output, 'locust')),
+    }
+    with open(os.path.join(output, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\nRésultats : {os.path.relpath(output, ROOT)}")
+    if args.compare:
+        print_comparison(load_summary(args.compare), summary)
+    else:
+        print_summary(summary)
+
+
+if __name__ == '__main__':
+    main()
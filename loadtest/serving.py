@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""Compare gunicorn serving modes under many keep-alive clients.
+
+Starts gunicorn in each mode in turn, with the environment of this shell
+(database, settings):
+- wsgi: --workers sync workers on ecommerce.wsgi, app loaded by each
+  worker (the former fixed command line);
+- asgi: --workers uvicorn workers on ecommerce.asgi;
+- tuned: gunicorn.conf.py sizing on ecommerce.wsgi (gthread workers,
+  preload_app).
+With DATABASE=postgresql, three more modes run the wsgi mode with each
+way of reaching the database (not run by default):
+- close: a new connection per request (DB_CONN_MAX_AGE=0, the former
+  settings);
+- persistent: connections reused by the following requests (the default);
+- pgbouncer: a new connection per request to pgbouncer, which keeps the
+  server connections open (DB_POOLER, DB_POOLER_HOST of this shell).
+Each run opens
+--clients concurrent HTTP/1.1 keep-alive connections that request the
+--path pages back to back for --duration seconds; a connection closed by
+the server is reopened, its connect time counted in the next request.
+Prints throughput, latency percentiles and the memory of gunicorn (PSS of
+the master and its workers at the end of the run) and writes
+loadtest/results/<date>-<commit>-serving/summary.json.
+
+--customers N sends the session cookies of the first N accounts created by
+`manage.py seed_loadtest` (sessions created here, in the same database),
+so the pages load the user and the open order instead of a guest cart.
+--db-latency MS adds MS before every query (latency_settings.py), the
+case where sync workers wait on the database while clients queue.
+
+    python loadtest/serving.py                                   # 500 clients, 30s per mode
+    python loadtest/serving.py --clients 100 --duration 10 --path /cart/
+    python loadtest/serving.py --customers 200 --db-latency 5
+    python loadtest/serving.py --modes wsgi tuned                # gunicorn.conf.py sizing
+    python loadtest/serving.py --modes close persistent --workers 3 --clients 3
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+
+from run import RESULTS, ROOT, git_commit, wait_for_port
+
+# Application and gunicorn.conf.py overrides of each mode, None: --workers
+MODES = {
+    'wsgi': ('ecommerce.wsgi:application', {
+        'GUNICORN_WORKERS': None, 'GUNICORN_THREADS': '1', 'GUNICORN_PRELOAD': 'False',
+        'GUNICORN_MAX_REQUESTS': '0', 'GUNICORN_KEEPALIVE': '2',
+    }),
+    'asgi': ('ecommerce.asgi:application', {
+        'GUNICORN_WORKERS': None, 'GUNICORN_WORKER_CLASS': 'uvicorn.workers.UvicornWorker',
+    }),
+    'tuned': ('ecommerce.wsgi:application', {}),
+}
+_SYNC = {'GUNICORN_WORKERS': None, 'GUNICORN_THREADS': '1', 'GUNICORN_PRELOAD': 'False'}
+DATABASE_MODES = {
+    'close': ('ecommerce.wsgi:application', {**_SYNC, 'DB_CONN_MAX_AGE': '0'}),
+    'persistent': ('ecommerce.wsgi:application', {**_SYNC, 'DB_CONN_MAX_AGE': '60'}),
+    'pgbouncer': ('ecommerce.wsgi:application', {**_SYNC, 'DB_CONN_MAX_AGE': '0', 'DB_POOLER': 'pgbouncer'}),
+}
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.failures = 0
+        self.errors = 0
+        self.connections = 0
+
+    def summary(self, duration):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1) if latencies else None
+
+        return {
+            'requests': len(latencies),
+            'failures': self.failures,
+            'errors': self.errors,
+            'connections': self.connections,
+            'rps': round(len(latencies) / duration, 1),
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99),
+        }
+
+
+async def read_response(reader):
+    """Status and keep-alive flag of one response, its body read and dropped"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    version, status = lines[0].split(' ', 2)[:2]
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    keep_alive = headers.get('connection') != 'close' and version == 'HTTP/1.1'
+    return int(status), keep_alive
+
+
+async def client(host, port, paths, cookie, offset, deadline, stats):
+    reader = writer = None
+    sent = offset
+    extra = f'Cookie: {cookie}\r\n' if cookie else ''
+    while time.monotonic() < deadline:
+        path = paths[sent % len(paths)]
+        sent += 1
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+                stats.connections += 1
+            writer.write(
+                f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n{extra}Connection: keep-alive\r\n\r\n'.encode()
+            )
+            status, keep_alive = await asyncio.wait_for(read_response(reader), timeout=60)
+        except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            stats.errors += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+            continue
+        stats.latencies.append(time.perf_counter() - start)
+        if status >= 400:
+            stats.failures += 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def drive(host, port, paths, cookies, clients, duration):
+    stats = Stats()
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(
+        client(host, port, paths, cookies[i % len(cookies)] if cookies else None, i, deadline, stats)
+        for i in range(clients)
+    ))
+    return stats
+
+
+def customer_cookies(count):
+    """Session cookies of the first seeded load test customers"""
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.auth.models import User
+    from django.contrib.sessions.backends.db import SessionStore
+
+    cookies = []
+    for user in User.objects.filter(username__startswith='loadtest_', customer__isnull=False).order_by('id')[:count]:
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        cookies.append(f'{settings.SESSION_COOKIE_NAME}={session.session_key}')
+    if not cookies:
+        raise SystemExit('Aucun compte loadtest_* : lancer `python manage.py seed_loadtest` avant --customers')
+    return cookies
+
+
+def memory_mb(pid):
+    """PSS of a process and its children: shared pages are split between them"""
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids = [pid] + [int(child) for child in f.read().split()]
+    except OSError:
+        return None
+    total = 0
+    for process in pids:
+        try:
+            with open(f'/proc/{process}/smaps_rollup') as f:
+                total += sum(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+        except OSError:
+            pass
+    return round(total / 1024, 1)
+
+
+def start_gunicorn(mode, port, workers, db_latency):
+    app, overrides = {**MODES, **DATABASE_MODES}[mode]
+    env = dict(os.environ, GUNICORN_BIND=f'127.0.0.1:{port}')
+    env.update({name: str(workers) if value is None else value for name, value in overrides.items()})
+    if db_latency:
+        env.update(
+            DJANGO_SETTINGS_MODULE='loadtest.latency_settings',
+            LOADTEST_BASE_SETTINGS=os.environ.get('DJANGO_SETTINGS_MODULE', 'ecommerce.settings'),
+            LOADTEST_DB_LATENCY_MS=str(db_latency),
+        )
+    server = subprocess.Popen(
+        ['gunicorn', '--backlog', '2048', app],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    wait_for_port('127.0.0.1', port)
+    return server
+
+
+def measure(mode, args, cookies):
+    server = start_gunicorn(mode, args.port, args.workers, args.db_latency)
+    try:
+        # Fills the per-worker caches and opens the database connections
+        asyncio.run(drive('127.0.0.1', args.port, args.path, cookies, 20, args.warmup))
+        stats = asyncio.run(drive('127.0.0.1', args.port, args.path, cookies, args.clients, args.duration))
+        memory = memory_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    return {**stats.summary(args.duration), 'memory_mb': memory}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Débit et mémoire de gunicorn selon le mode de service')
+    parser.add_argument('--clients', type=int, default=500, help='Connexions keep-alive simultanées')
+    parser.add_argument('--duration', type=float, default=30, help='Durée de mesure par mode, en secondes')
+    parser.add_argument('--warmup', type=float, default=3, help='Préchauffage par mode, en secondes')
+    parser.add_argument('--workers', type=int, default=3, help='Workers gunicorn des modes autres que tuned')
+    parser.add_argument('--port', type=int, default=8090, help='Port local de gunicorn')
+    parser.add_argument('--path', action='append', help='Page demandée, répétable (/, /cart/, /checkout/)')
+    parser.add_argument('--customers', type=int, default=0, help='Clients connectés avec les comptes seed_loadtest')
+    parser.add_argument('--db-latency', type=float, default=0, help='Latence ajoutée à chaque requête SQL, en ms')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES) + list(DATABASE_MODES), default=list(MODES))
+    args = parser.parse_args()
+    args.path = args.path or ['/', '/cart/', '/checkout/']
+    cookies = customer_cookies(args.customers) if args.customers else []
+
+    # Enough descriptors for the client side of every connection
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.clients * 2 + 256)), hard))
+    except (ImportError, ValueError):
+        pass
+
+    results = {}
+    for mode in args.modes:
+        print(f"{mode}: {args.clients} clients, {args.duration:g}s ...", file=sys.stderr)
+        results[mode] = measure(mode, args, cookies)
+
+    commit = git_commit()
+    summary = {
+        'commit': commit,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'clients': args.clients,
+        'duration': args.duration,
+        'workers': args.workers,
+        'paths': args.path,
+        'customers': len(cookies),
+        'db_latency_ms': args.db_latency,
+        'modes': results,
+    }
+    name = '-'.join([datetime.datetime.now().strftime('%Y%m%d-%H%M%S'), commit, 'serving'])
+    output = os.path.join(RESULTS, name)
+    os.makedirs(output)
+    with open(os.path.join(output, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\nRésultats : {os.path.relpath(output, ROOT)} (latences en ms)")
+    print(f"{'mode':<10} {'req':>8} {'fail':>6} {'err':>6} {'conn':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'Mo':>7}")
+    for mode, r in results.items():
+        print(f"{mode:<10} {r['requests']:>8} {r['failures']:>6} {r['errors']:>6} {r['connections']:>7} "
+              f"{r['rps']:>8.1f} {r['p50'] or 0:>8.1f} {r['p95'] or 0:>8.1f} {r['p99'] or 0:>8.1f} {r['memory_mb'] or 0:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+#!/bin/sh
+# Run once, when the primary's volume is initialized: the postgres-replica
+# service (profile replica of docker-compose.postgres.yml) streams its WAL
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -1,62 +1,147 @@
-var updateBtns = document.getElementsByClassName("update-cart");
-
-for (i = 0; i < updateBtns.length; i++) {
-    updateBtns[i].addEventListener("click", function () {
-        var productId = this.dataset.product;
-        var action = this.dataset.action;
-        console.log("productId:", productId, "Action:", action);
-        console.log("USER:", user);
-
-        if (user == "AnonymousUser") {
-            addCookieItem(productId, action);
-        } else {
-            updateUserOrder(productId, action);
-        }
-    });
+// Delegated so buttons of product cards loaded later by filter.js work too
+document.addEventListener("click", function (event) {
+    var button = event.target.closest(".update-cart");
+    if (!button) {
+        return;
+    }
+    var productId = button.dataset.product;
+    var action = button.dataset.action;
+    console.log("productId:", productId, "Action:", action);
+    console.log("USER:", user);
+
+    // Guests too: their cart cookie is signed and written by the server
+    queueCartChange(productId, action);
+});
+
+// Clicks are accumulated per product and sent as one batch once they stop
+var CART_URL = "/update_cart/";
+var CART_DEBOUNCE_MS = 300;
+var pendingDeltas = {};
+var flushTimer = null;
+var inFlight = false;
+
+function queueCartChange(productId, action) {
+    var delta = action == "add" ? 1 : -1;
+    pendingDeltas[productId] = (pendingDeltas[productId] || 0) + delta;
+    showPendingChange(productId, delta);
+
+    clearTimeout(flushTimer);
+    flushTimer = setTimeout(flushCart, CART_DEBOUNCE_MS);
 }
 
-function updateUserOrder(productId, action) {
-    console.log("User is authenticated, sending data...");
+function takePendingOperations() {
+    var operations = Object.keys(pendingDeltas)
+        .filter(function (productId) { return pendingDeltas[productId] != 0; })
+        .map(function (productId) {
+            return { productId: productId, delta: pendingDeltas[productId] };
+        });
+    pendingDeltas = {};
+    return operations;
+}
 
-    var url = "/update_item/";
+function flushCart() {
+    // One batch at a time so the server applies them in click order
+    if (inFlight) {
+        flushTimer = setTimeout(flushCart, CART_DEBOUNCE_MS);
+        return;
+    }
+    var operations = takePendingOperations();
+    if (operations.length == 0) {
+        return;
+    }
+    inFlight = true;
 
-    fetch(url, {
+    fetch(CART_URL, {
         method: "POST",
         headers: {
             "Content-Type": "application/json",
             "X-CSRFToken": csrftoken,
         },
-        body: JSON.stringify({ productId: productId, action: action }),
+        body: JSON.stringify({ operations: operations }),
     })
         .then((response) => {
+            if (!response.ok) {
+                throw new Error("Cart update failed: " + response.status);
+            }
             return response.json();
         })
         .then((data) => {
+            renderCart(data);
+        })
+        .catch((error) => {
+            console.log(error);
+            // The page is the only safe source of truth after a failed batch
             location.reload();
+        })
+        .finally(() => {
+            inFlight = false;
         });
 }
 
-function addCookieItem(productId, action) {
-    console.log("User is not authenticated");
+// Clicks still waiting for the debounce are not lost when leaving the page
+window.addEventListener("pagehide", function () {
+    var operations = takePendingOperations();
+    if (operations.length == 0) {
+        return;
+    }
+    fetch(CART_URL, {
+        method: "POST",
+        keepalive: true,
+        headers: {
+            "Content-Type": "application/json",
+            "X-CSRFToken": csrftoken,
+        },
+        body: JSON.stringify({ operations: operations }),
+    });
+});
+
+function formatPrice(value) {
+    return "$" + Number(value).toFixed(2);
+}
 
-    if (action == "add") {
-        if (cart[productId] == undefined) {
-            cart[productId] = { quantity: 1 };
-        } else {
-            cart[productId]["quantity"] += 1;
-        }
+// Optimistic feedback until the server answers
+function showPendingChange(productId, delta) {
+    var counter = document.getElementById("cart-total");
+    if (counter) {
+        counter.textContent = Math.max(0, parseInt(counter.textContent || "0", 10) + delta);
     }
+    var row = document.querySelector('.cart-item-row[data-product="' + productId + '"]');
+    if (row) {
+        var display = row.querySelector(".quantity-display");
+        display.textContent = Math.max(0, parseInt(display.textContent, 10) + delta);
+    }
+}
 
-    if (action == "remove") {
-        cart[productId]["quantity"] -= 1;
+function renderCart(data) {
+    // Later clicks still pending are kept on top of the server state
+    var pendingTotal = Object.values(pendingDeltas).reduce(function (sum, delta) { return sum + delta; }, 0);
+    document.getElementById("cart-total").textContent = Math.max(0, data.cartItems + pendingTotal);
 
-        if (cart[productId]["quantity"] <= 0) {
-            console.log("Item should be deleted");
-            delete cart[productId];
-        }
+    var summaryItems = document.getElementById("cart-summary-items");
+    if (!summaryItems) {
+        return;
+    }
+    if (data.items.length == 0) {
+        // The empty cart has its own layout
+        location.reload();
+        return;
     }
-    console.log("CART:", cart);
-    document.cookie = "cart=" + JSON.stringify(cart) + ";domain=;path=/";
+    summaryItems.textContent = data.cartItems;
+    document.getElementById("cart-summary-subtotal").textContent = formatPrice(data.cartTotal);
+    document.getElementById("cart-summary-total").textContent = formatPrice(data.cartTotal);
 
-    location.reload();
+    var lines = {};
+    data.items.forEach(function (item) {
+        lines[item.productId] = item;
+    });
+    document.querySelectorAll(".cart-item-row").forEach(function (row) {
+        var line = lines[row.dataset.product];
+        if (!line) {
+            row.remove();
+            return;
+        }
+        var pending = pendingDeltas[row.dataset.product] || 0;
+        row.querySelector(".quantity-display").textContent = Math.max(0, line.quantity + pending);
+        row.querySelector(".cart-total").textContent = formatPrice(line.total);
+    });
 }
@@ -1,4 +1,4 @@
-// Filter and Search Functionality
+// Filter, Search and incremental loading backed by /api/products/
 document.addEventListener('DOMContentLoaded', function() {
     const searchInput = document.getElementById('searchInput');
     const clearSearch = document.getElementById('clearSearch');
@@ -8,24 +8,45 @@ document.addEventListener('DOMContentLoaded', function() {
     const resetFilters = document.getElementById('resetFilters');
     const productsGrid = document.getElementById('productsGrid');
     const resultsCount = document.getElementById('resultsCount');
-    
-    let allProducts = Array.from(document.querySelectorAll('.product-card'));
-    
+    const loadMore = document.getElementById('loadMore');
+    const sentinel = document.getElementById('loadMoreSentinel');
+
+    const API_URL = '/api/products/';
+    const SEARCH_URL = '/api/search/';
+    const PRICE_RANGES = {
+        all: {},
+        low: { max_price: '19.99' },
+        medium: { min_price: '20', max_price: '50' },
+        high: { min_price: '50.01' },
+    };
+
+    // The first page is rendered server-side
+    let nextCursor = productsGrid.dataset.nextCursor || null;
+    let loadedCount = productsGrid.querySelectorAll('.product-card').length;
+    let loading = false;
+    let requestId = 0;
+    let searchTimer = null;
+
     // Search functionality
     if (searchInput) {
         searchInput.addEventListener('input', function(e) {
-            const searchTerm = e.target.value.toLowerCase();
-            
+            const searchTerm = e.target.value;
+
             if (searchTerm.length > 0) {
                 clearSearch.classList.add('active');
             } else {
                 clearSearch.classList.remove('active');
             }
-            
-            applyFilters();
+
+            // Debounce keystrokes into a single request
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(function() {
+                applyFilters();
+                updateSuggestions(searchTerm);
+            }, 250);
         });
     }
-    
+
     // Clear search
     if (clearSearch) {
         clearSearch.addEventListener('click', function() {
@@ -34,31 +55,16 @@ document.addEventListener('DOMContentLoaded', function() {
             applyFilters();
         });
     }
-    
-    // Category filter
-    if (categoryFilter) {
-        categoryFilter.addEventListener('change', function() {
-            applyFilters();
-            updateFilterState();
-        });
-    }
-    
-    // Price filter
-    if (priceFilter) {
-        priceFilter.addEventListener('change', function() {
-            applyFilters();
-            updateFilterState();
-        });
-    }
-    
-    // Sort filter
-    if (sortFilter) {
-        sortFilter.addEventListener('change', function() {
-            applyFilters();
-            updateFilterState();
-        });
-    }
-    
+
+    [categoryFilter, priceFilter, sortFilter].forEach(filter => {
+        if (filter) {
+            filter.addEventListener('change', function() {
+                applyFilters();
+                updateFilterState();
+            });
+        }
+    });
+
     // Reset all filters
     if (resetFilters) {
         resetFilters.addEventListener('click', function() {
@@ -71,107 +77,175 @@ document.addEventListener('DOMContentLoaded', function() {
             applyFilters();
         });
     }
-    
-    function applyFilters() {
-        const searchTerm = searchInput.value.toLowerCase();
-        const category = categoryFilter.value;
-        const priceRange = priceFilter.value;
-        const sortBy = sortFilter.value;
-        
-        let visibleProducts = [];
-        
-        allProducts.forEach(product => {
-            let isVisible = true;
-            
-            // Search filter
-            if (searchTerm) {
-                const productName = product.querySelector('h6').textContent.toLowerCase();
-                const productDesc = product.querySelector('.product-description').textContent.toLowerCase();
-                isVisible = productName.includes(searchTerm) || productDesc.includes(searchTerm);
+
+    if (loadMore) {
+        loadMore.addEventListener('click', function() {
+            fetchPage(false);
+        });
+    }
+
+    // Load the next page as the end of the grid scrolls into view
+    if (sentinel && 'IntersectionObserver' in window) {
+        new IntersectionObserver(entries => {
+            if (entries[0].isIntersecting && nextCursor) {
+                fetchPage(false);
             }
-            
-            // Category filter
-            if (isVisible && category !== 'all') {
-                const badges = product.querySelectorAll('.badge');
-                let hasCategory = false;
-                badges.forEach(badge => {
-                    if (category === 'digital' && badge.textContent.includes('Numérique')) {
-                        hasCategory = true;
-                    }
-                    if (category === 'physical' && badge.textContent.includes('Physique')) {
-                        hasCategory = true;
-                    }
+        }, { rootMargin: '400px' }).observe(sentinel);
+    }
+
+    // Typeahead suggestions from the ranked search endpoint
+    const suggestions = document.getElementById('searchSuggestions');
+
+    function updateSuggestions(searchTerm) {
+        if (!suggestions || searchTerm.trim().length < 2) {
+            return;
+        }
+        fetch(SEARCH_URL + '?' + new URLSearchParams({ q: searchTerm }))
+            .then(response => response.json())
+            .then(data => {
+                suggestions.innerHTML = '';
+                (data.results || []).forEach(product => {
+                    const option = document.createElement('option');
+                    option.value = product.name;
+                    suggestions.appendChild(option);
                 });
-                isVisible = hasCategory;
-            }
-            
-            // Price filter
-            if (isVisible && priceRange !== 'all') {
-                const priceText = product.querySelector('.product-price').textContent;
-                const price = parseFloat(priceText.replace('$', ''));
-                
-                if (priceRange === 'low') {
-                    isVisible = price < 20;
-                } else if (priceRange === 'medium') {
-                    isVisible = price >= 20 && price <= 50;
-                } else if (priceRange === 'high') {
-                    isVisible = price > 50;
-                }
-            }
-            
-            if (isVisible) {
-                product.classList.remove('hidden-filter');
-                visibleProducts.push(product);
-            } else {
-                product.classList.add('hidden-filter');
-            }
+            });
+    }
+
+    function buildQuery(cursor) {
+        const params = new URLSearchParams();
+        const searchTerm = searchInput.value.trim();
+        if (searchTerm) {
+            params.set('q', searchTerm);
+        }
+        if (categoryFilter.value !== 'all') {
+            params.set('type', categoryFilter.value);
+        }
+        Object.entries(PRICE_RANGES[priceFilter.value] || {}).forEach(([key, value]) => {
+            params.set(key, value);
         });
-        
-        // Sort products
-        if (sortBy !== 'default') {
-            visibleProducts.sort((a, b) => {
-                if (sortBy === 'name-asc') {
-                    const nameA = a.querySelector('h6').textContent;
-                    const nameB = b.querySelector('h6').textContent;
-                    return nameA.localeCompare(nameB);
-                } else if (sortBy === 'name-desc') {
-                    const nameA = a.querySelector('h6').textContent;
-                    const nameB = b.querySelector('h6').textContent;
-                    return nameB.localeCompare(nameA);
-                } else if (sortBy === 'price-asc') {
-                    const priceA = parseFloat(a.querySelector('.product-price').textContent.replace('$', ''));
-                    const priceB = parseFloat(b.querySelector('.product-price').textContent.replace('$', ''));
-                    return priceA - priceB;
-                } else if (sortBy === 'price-desc') {
-                    const priceA = parseFloat(a.querySelector('.product-price').textContent.replace('$', ''));
-                    const priceB = parseFloat(b.querySelector('.product-price').textContent.replace('$', ''));
-                    return priceB - priceA;
+        params.set('sort', sortFilter.value);
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        return params.toString();
+    }
+
+    function applyFilters() {
+        fetchPage(true);
+    }
+
+    function fetchPage(reset) {
+        if (loading && !reset) {
+            return;
+        }
+        if (!reset && !nextCursor) {
+            return;
+        }
+        loading = true;
+        // Responses of superseded requests are dropped
+        const currentRequest = ++requestId;
+
+        fetch(API_URL + '?' + buildQuery(reset ? null : nextCursor))
+            .then(response => response.json())
+            .then(data => {
+                if (currentRequest !== requestId) {
+                    return;
+                }
+                if (data.error) {
+                    console.log('Listing error:', data.error);
+                    return;
+                }
+                if (reset) {
+                    productsGrid.innerHTML = '';
+                    loadedCount = 0;
+                }
+                const fragment = document.createDocumentFragment();
+                data.products.forEach(product => fragment.appendChild(renderCard(product)));
+                productsGrid.appendChild(fragment);
+
+                loadedCount += data.products.length;
+                nextCursor = data.next_cursor;
+                loadMore.style.display = nextCursor ? '' : 'none';
+                updateResultsCount();
+            })
+            .finally(() => {
+                if (currentRequest === requestId) {
+                    loading = false;
                 }
             });
-            
-            // Reorder products in the grid
-            visibleProducts.forEach(product => {
-                productsGrid.appendChild(product.parentElement);
-            });
+    }
+
+    function escapeHtml(value) {
+        const div = document.createElement('div');
+        div.textContent = value;
+        return div.innerHTML.replace(/"/g, '&quot;');
+    }
+
+    // Mirrors store/templates/store/product_grid.html
+    function renderCard(product) {
+        const column = document.createElement('div');
+        column.className = 'col-lg-4';
+        const typeBadge = product.digital
+            ? '<span class="badge badge-digital">✨ Numérique</span>'
+            : '<span class="badge badge-physical">📦 Physique</span>';
+        let description = product.digital
+            ? '📚 Formation numérique téléchargeable instantanément. Accès illimité à vie.'
+            : '📦 Produit physique de haute qualité. Livraison rapide et gratuite dès 50€.';
+        if (product.description) {
+            const text = product.description;
+            description = escapeHtml(text.length > 140 ? text.slice(0, 139) + '…' : text);
         }
-        
-        // Update results count
-        updateResultsCount(visibleProducts.length);
+        column.innerHTML = `
+            <div class="product-card">
+                <div class="product-badges">
+                    ${typeBadge}
+                    <span class="badge badge-new">🆕 Nouveau</span>
+                </div>
+                <img class="thumbnail" src="${escapeHtml(product.imageURL)}">
+                <div class="box-element product">
+                    <h6><strong>${escapeHtml(product.name)}</strong></h6>
+                    <div class="product-rating">
+                        <span class="stars">★★★★★</span>
+                        <span class="rating-count">(4.8/5)</span>
+                    </div>
+                    <hr>
+                    <p class="product-description">${description}</p>
+                    <ul class="product-features">
+                        <li>✓ Garantie satisfaction</li>
+                        <li>✓ Support client 24/7</li>
+                        ${product.digital ? '' : '<li>✓ Retour gratuit sous 30j</li>'}
+                    </ul>
+                    <div class="product-footer">
+                        <div class="price-section">
+                            <span class="price-label">Prix:</span>
+                            <h4 class="product-price">$${product.price}</h4>
+                        </div>
+                        <div class="product-actions">
+                            <button data-product="${product.id}" data-action="add" class="btn btn-primary add-btn update-cart">
+                                <i class="fas fa-cart-plus"></i> Ajouter
+                            </button>
+                            <button class="btn btn-outline-info btn-view" title="Voir les détails">
+                                <i class="fas fa-eye"></i>
+                            </button>
+                        </div>
+                    </div>
+                </div>
+            </div>`;
+        return column;
     }
-    
-    function updateResultsCount(count) {
-        const totalProducts = allProducts.length;
-        if (count === totalProducts) {
-            resultsCount.textContent = `Affichage de tous les produits (${totalProducts})`;
-        } else if (count === 0) {
+
+    function updateResultsCount() {
+        if (loadedCount === 0) {
             resultsCount.textContent = 'Aucun produit trouvé';
             resultsCount.style.color = '#e53e3e';
         } else {
-            resultsCount.textContent = `${count} produit${count > 1 ? 's' : ''} trouvé${count > 1 ? 's' : ''}`;
+            const more = nextCursor ? '+' : '';
+            resultsCount.textContent = `${loadedCount}${more} produit${loadedCount > 1 ? 's' : ''} trouvé${loadedCount > 1 ? 's' : ''}`;
             resultsCount.style.color = '#48bb78';
         }
     }
-    
+
     function updateFilterState() {
         // Add visual feedback to active filters
         [categoryFilter, priceFilter, sortFilter].forEach(filter => {
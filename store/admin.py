@@ -1,9 +1,27 @@
 from django.contrib import admin
 
 from .models import *
+from .routers import replica_reads
+
+
+class ReportAdmin(admin.ModelAdmin):
+    """Changelists read from the read replica when there is one, forms from the primary"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            # Actions and list_editable write
+            return super().changelist_view(request, extra_context)
+        with replica_reads():
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render'):
+                # Rendered here: the template evaluates the result list
+                response.render()
+        return response
+
 
 admin.site.register(Customer)
 admin.site.register(Product)
-admin.site.register(Order)
-admin.site.register(OrderItem)
-admin.site.register(ShippingAddress)
\ No newline at end of file
+admin.site.register(Order, ReportAdmin)
+admin.site.register(OrderItem, ReportAdmin)
+admin.site.register(ShippingAddress, ReportAdmin)
+admin.site.register(Job)
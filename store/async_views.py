@@ -0,0 +1,73 @@
+"""Async versions of the page and cart views, routed under ASGI.
+
+Django has no async database driver: its async ORM runs every query
+through sync_to_async. These views therefore make one executor call per
+request around the sync code of store.views (queries, transaction and
+all) and do the rest in the event loop: body parsing, validation and
+template rendering. The user is loaded by that call too, so the templates
+read request.user without touching the database from the loop.
+"""
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.views.decorators.csrf import csrf_protect
+from django.views.decorators.http import require_http_methods
+
+from . import views
+from .idempotency import idempotent
+from .metrics import record_checkout
+from .utils import parseItemUpdate
+
+
+async def store(request):
+    """View to display the main product store"""
+    context = await sync_to_async(views.storeContext)(request)
+    return render(request, 'store/store.html', context)
+
+async def cart(request):
+    """View to display the shopping cart"""
+    context = await sync_to_async(views.cartContext)(request)
+    return render(request, 'store/cart.html', context)
+
+async def checkout(request):
+    """View to display the checkout page"""
+    context = await sync_to_async(views.cartContext)(request)
+    context['idempotency_key'] = uuid.uuid4().hex
+    return render(request, 'store/checkout.html', context)
+
+@require_http_methods(["POST"])
+@csrf_protect
+@login_required
+async def updateItem(request):
+    """Update cart item with proper validation and error handling"""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    try:
+        productId, delta = parseItemUpdate(data)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
+
+    # Loaded by login_required already
+    user = await request.auser()
+    return await sync_to_async(views.itemUpdateResponse)(user, productId, delta)
+
+@require_http_methods(["POST"])
+@csrf_protect
+@idempotent
+async def processOrder(request):
+    """Validate and complete the open order in a single transaction"""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        record_checkout('order', 'rejected')
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    return await sync_to_async(views.orderResponse)(request, data)
@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .listing import product_page
+from .metrics import CATALOG_CACHE
+from .routers import use_primary
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _record(hit):
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+    CATALOG_CACHE.labels('hit' if hit else 'miss').inc()
+
+
+def catalog_cache_stats():
+    """Return the hit/miss counters of this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_catalog_cache_stats():
+    with _stats_lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
+
+
+def get_catalog_version():
+    """Current catalog version, used as a namespace for every cached entry"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Start from a time-based value so entries cached before the
+        # version key was evicted can never be served again
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog entry"""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def _cached(name, build):
+    key = f'catalog:{name}:{get_catalog_version()}'
+    value = cache.get(key)
+    if value is not None:
+        _record(hit=True)
+        return value
+    _record(hit=False)
+    # Cached past any replication lag: built from the primary
+    with use_primary():
+        value = build()
+    cache.set(key, value, settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def get_first_page():
+    """First page of the default product listing and the cursor of the next one"""
+    return _cached('first_page', lambda: product_page({}))
+
+
+def get_product_grid():
+    """Rendered first page of the store grid, later pages come from the listing API"""
+    html = _cached('grid', lambda: render_to_string(
+        'store/product_grid.html', {'products': get_first_page()['products']}
+    ))
+    return mark_safe(html)
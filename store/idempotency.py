@@ -0,0 +1,148 @@
+"""Idempotency-Key support for POST endpoints.
+
+The first request with a given key runs the view inside one transaction
+that also claims the key; its successful response is stored with it. A
+retry with the same key and the same request replays the stored response,
+with the headers and cookies the view set, with a single lookup instead of
+running the view again. A concurrent
+retry blocks on the unique key until the first request commits, then
+replays it. Error responses are not stored, so a corrected retry runs.
+Keys are deleted IDEMPOTENCY_KEY_TTL seconds after their first request
+(prune_keys, run by the run_jobs worker).
+
+An async view runs through async_to_sync inside the sync_to_async call
+that holds the transaction: its own thread-sensitive calls come back to
+that thread, so its writes and the key claim still commit together.
+"""
+import hashlib
+import json
+import logging
+import re
+from datetime import timedelta
+from functools import partial, wraps
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+_KEY_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+# Set again by the framework on every response
+_UNSTORED_HEADERS = {'content-type', 'content-length'}
+
+
+class _Discard(Exception):
+    """Roll back the key claim along with a view that did not succeed"""
+
+    def __init__(self, response):
+        self.response = response
+
+
+def request_fingerprint(request):
+    """Hash of what a retry must repeat exactly: user, path and body"""
+    digest = hashlib.sha256()
+    digest.update(f'{request.user.pk}:{request.path}:'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored.fingerprint != fingerprint:
+        return JsonResponse({'error': f'{HEADER} reused with a different request'}, status=422)
+    response = HttpResponse(stored.response, status=stored.status_code, content_type=stored.content_type)
+    for name, value in json.loads(stored.headers).items():
+        response[name] = value
+    for name, attributes in json.loads(stored.cookies).items():
+        response.cookies[name] = attributes.pop('value')
+        response.cookies[name].update(attributes)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _store(claim, response):
+    claim.status_code = response.status_code
+    claim.content_type = response['Content-Type']
+    claim.response = response.content.decode(response.charset)
+    claim.headers = json.dumps({
+        name: value for name, value in response.items() if name.lower() not in _UNSTORED_HEADERS
+    })
+    # A retried checkout must still drop the guest cart cookie, for instance
+    claim.cookies = json.dumps({
+        name: {'value': morsel.value, **{key: value for key, value in morsel.items() if value != ''}}
+        for name, morsel in response.cookies.items()
+    })
+    claim.save(update_fields=['status_code', 'content_type', 'response', 'headers', 'cookies'])
+
+
+def _run_once(request, key, run_view):
+    fingerprint = request_fingerprint(request)
+    stored = IdempotencyKey.objects.filter(key=key).first()
+    if stored is not None:
+        return _replay(stored, fingerprint)
+
+    try:
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    # Waits for a concurrent request holding the same key
+                    claim = IdempotencyKey.objects.create(
+                        key=key, fingerprint=fingerprint, status_code=0, content_type='', response=''
+                    )
+            except IntegrityError:
+                logger.info(f"Replaying concurrent request for idempotency key {key}")
+                return _replay(IdempotencyKey.objects.get(key=key), fingerprint)
+
+            response = run_view()
+            if response.status_code >= 400:
+                raise _Discard(response)
+
+            _store(claim, response)
+    except _Discard as discarded:
+        return discarded.response
+    return response
+
+
+def prune_keys():
+    """Delete the keys older than IDEMPOTENCY_KEY_TTL, returns how many"""
+    cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    deleted, _ = IdempotencyKey.objects.filter(created__lt=cutoff).delete()
+    return deleted
+
+
+def _invalid_key(key):
+    return None if _KEY_RE.match(key) else JsonResponse({'error': f'Invalid {HEADER}'}, status=400)
+
+
+def idempotent(view):
+    """Run the view at most once per Idempotency-Key header"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return await view(request, *args, **kwargs)
+            invalid = _invalid_key(key)
+            if invalid:
+                return invalid
+            run_view = partial(async_to_sync(view), request, *args, **kwargs)
+            return await sync_to_async(_run_once)(request, key, run_view)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        invalid = _invalid_key(key)
+        if invalid:
+            return invalid
+        return _run_once(request, key, partial(view, request, *args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,123 @@
+"""Durable database-backed job queue.
+
+Jobs are rows of the Job table, written in the same transaction as the
+change that triggers them, so an order is never completed without its
+follow-up work being recorded. The run_jobs command claims pending jobs
+in batches under a time-limited lease, retries failures with exponential
+backoff and marks a job dead after its last attempt.
+"""
+import json
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job, Order
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 300
+MAX_BACKOFF_SECONDS = 3600
+
+_handlers = {}
+
+
+def job(name):
+    """Register a handler; it is called with the job payload as keyword arguments"""
+    def register(handler):
+        _handlers[name] = handler
+        return handler
+    return register
+
+
+def enqueue(name, **payload):
+    """Record a job in the current transaction, it runs once that commits"""
+    if name not in _handlers:
+        raise ValueError(f"Unknown job {name}")
+    return Job.objects.create(name=name, payload=json.dumps(payload))
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_jobs(limit, worker=None):
+    """Lease up to limit due jobs to this worker"""
+    worker = worker or worker_id()
+    now = timezone.now()
+    lease = now + timedelta(seconds=LEASE_SECONDS)
+    with transaction.atomic():
+        due = Job.objects.filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+            status=Job.PENDING,
+            run_at__lte=now,
+        )
+        candidates = due.order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers take disjoint batches instead of waiting
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('id', flat=True)[:limit])
+        # Conditions are repeated so two workers can never lease the same job
+        due.filter(id__in=ids).update(locked_by=worker, locked_until=lease, attempts=F('attempts') + 1)
+    return list(Job.objects.filter(id__in=ids, locked_by=worker, locked_until=lease).order_by('run_at', 'id'))
+
+
+def _backoff(attempts):
+    return timedelta(seconds=min(2 ** attempts, MAX_BACKOFF_SECONDS))
+
+
+def run_job(job):
+    """Run one claimed job, returns True when it succeeded"""
+    handler = _handlers.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for {job.name}")
+        with transaction.atomic():
+            handler(**json.loads(job.payload))
+    except Exception as e:
+        job.last_error = f'{type(e).__name__}: {e}'
+        job.locked_by, job.locked_until = '', None
+        if job.attempts >= job.max_attempts:
+            job.status = Job.DEAD
+            logger.error(f"Job {job} dead after {job.attempts} attempts: {job.last_error}")
+        else:
+            job.run_at = timezone.now() + _backoff(job.attempts)
+            logger.warning(f"Job {job} failed (attempt {job.attempts}), retrying at {job.run_at}: {job.last_error}")
+        job.save(update_fields=['status', 'run_at', 'locked_by', 'locked_until', 'last_error'])
+        return False
+
+    job.status = Job.DONE
+    job.locked_by, job.locked_until = '', None
+    job.save(update_fields=['status', 'locked_by', 'locked_until'])
+    return True
+
+
+def run_batch(limit=50, worker=None):
+    """Claim and run one batch, returns the number of jobs processed"""
+    jobs = claim_jobs(limit, worker)
+    for claimed in jobs:
+        run_job(claimed)
+    return len(jobs)
+
+
+def requeue_dead(name=None):
+    """Give dead jobs a fresh set of attempts"""
+    dead = Job.objects.filter(status=Job.DEAD)
+    if name:
+        dead = dead.filter(name=name)
+    return dead.update(status=Job.PENDING, attempts=0, run_at=timezone.now(), last_error='')
+
+
+@job('finalize_order')
+def finalize_order(order_id):
+    """Follow-up work of a completed order (confirmation, stock, exports)"""
+    order = Order.objects.select_related('customer').get(pk=order_id, complete=True)
+    customer = order.customer.email if order.customer else 'unknown'
+    logger.info(
+        f"Order {order.id} finalized: transaction={order.transaction_id} "
+        f"items={order.item_count} total={order.total:.2f} customer={customer}"
+    )
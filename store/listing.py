@@ -0,0 +1,152 @@
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from .models import Product
+from .search import search_ids
+
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# sort key -> (field, descending); ties are broken on id in the same direction
+SORTS = {
+    'default': ('id', False),
+    'name-asc': ('name', False),
+    'name-desc': ('name', True),
+    'price-asc': ('price', False),
+    'price-desc': ('price', True),
+}
+
+CURSOR_SALT = 'store.listing.cursor'
+
+
+def serialize_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'digital': bool(product.digital),
+        'imageURL': product.imageURL,
+        'description': product.description,
+    }
+
+
+def _parse_price(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f'Invalid {name}')
+
+
+def _parse_limit(params):
+    try:
+        limit = int(params.get('limit', PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValidationError('Invalid limit')
+    return min(max(1, limit), MAX_PAGE_SIZE)
+
+
+def filter_products(params):
+    """Apply the price range and product type filters"""
+    products = Product.objects.all()
+
+    min_price = _parse_price(params, 'min_price')
+    max_price = _parse_price(params, 'max_price')
+    if min_price is not None:
+        products = products.filter(price__gte=min_price)
+    if max_price is not None:
+        products = products.filter(price__lte=max_price)
+
+    product_type = params.get('type', 'all')
+    if product_type == 'digital':
+        products = products.filter(digital=True)
+    elif product_type == 'physical':
+        products = products.filter(Q(digital=False) | Q(digital__isnull=True))
+    elif product_type != 'all':
+        raise ValidationError('Invalid type')
+
+    return products
+
+
+def _read_cursor(params, sort):
+    """(sort value, last id) of the cursor parameter, None on the first page"""
+    cursor = params.get('cursor')
+    if not cursor:
+        return None
+    try:
+        cursor_sort, value, last_id = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise ValidationError('Invalid cursor')
+    if cursor_sort != sort:
+        raise ValidationError('Cursor does not match sort')
+    return value, last_id
+
+
+def _ranked_page(products, ids, position, limit):
+    """One page of search results in relevance order, the cursor holds the rank of the last product"""
+    start = 0
+    if position:
+        rank, last_id = position
+        # The rank of the last product moves when the catalog changes between pages
+        start = ids.index(last_id) + 1 if last_id in ids else rank + 1
+    candidates = ids[start:]
+    matched = set(products.filter(id__in=candidates).values_list('id', flat=True))
+    ranked = [(rank, pk) for rank, pk in enumerate(candidates, start) if pk in matched][:limit + 1]
+    rows = Product.objects.in_bulk([pk for _, pk in ranked])
+    page = [rows[pk] for _, pk in ranked if pk in rows]
+
+    next_cursor = None
+    if len(ranked) > limit:
+        page = page[:limit]
+        rank, last_id = ranked[limit - 1]
+        next_cursor = signing.dumps(['relevance', rank, last_id], salt=CURSOR_SALT)
+
+    return {'products': page, 'next_cursor': next_cursor}
+
+
+def product_page(params):
+    """Return one keyset-paginated page of products and the cursor of the next one
+
+    With a text query, results are sorted by relevance unless another sort is
+    asked for; either way they come from the MAX_RESULTS best matches.
+    """
+    query = params.get('q', '').strip()
+    sort = params.get('sort', 'default')
+    if query and sort in ('default', 'relevance'):
+        sort = 'relevance'
+    elif sort not in SORTS:
+        raise ValidationError('Invalid sort')
+    limit = _parse_limit(params)
+
+    products = filter_products(params)
+    position = _read_cursor(params, sort)
+    if query:
+        ids = search_ids(query)
+        if sort == 'relevance':
+            return _ranked_page(products, ids, position, limit)
+        products = products.filter(id__in=ids)
+
+    field, descending = SORTS[sort]
+    if position:
+        value, last_id = position
+        op = 'lt' if descending else 'gt'
+        if field == 'id':
+            products = products.filter(**{f'id__{op}': last_id})
+        else:
+            products = products.filter(
+                Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': last_id})
+            )
+
+    prefix = '-' if descending else ''
+    page = list(products.order_by(f'{prefix}{field}', f'{prefix}id')[:limit + 1])
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last = page[-1]
+        next_cursor = signing.dumps([sort, getattr(last, field), last.id], salt=CURSOR_SALT)
+
+    return {'products': page, 'next_cursor': next_cursor}
@@ -0,0 +1,178 @@
+"""Structured JSON logging and non-blocking shipping to Logstash.
+
+JsonFormatter renders a record as one JSON object, with the current
+request id and view name (set by RequestContextMiddleware) and every
+field passed with extra=. LogstashHandler formats records in the calling
+thread, queues them and returns; a background thread per process sends
+them in batches to the Logstash tcp/json_lines input and writes them to a
+rotating fallback file while Logstash is unreachable.
+"""
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import socket
+import threading
+import time
+
+# Attributes of every LogRecord, anything else was passed with extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_request_context = contextvars.ContextVar('request_context', default={})
+
+
+def bind_request(**fields):
+    """Attach fields to the log records of the current request, returns a reset token"""
+    return _request_context.set({**_request_context.get(), **fields})
+
+
+def unbind_request(token):
+    _request_context.reset(token)
+
+
+def request_context():
+    return _request_context.get()
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, *args, static_fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.static_fields = static_fields or {}
+
+    def format(self, record):
+        entry = {
+            '@timestamp': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'process': record.process,
+            **self.static_fields,
+            **request_context(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _Sender(threading.Thread):
+    """Drains the queue of one process into Logstash, or the fallback file"""
+
+    def __init__(self, handler, records):
+        super().__init__(name='logstash-sender', daemon=True)
+        self.handler = handler
+        self.records = records
+        self.sock = None
+        self.retry_at = 0.0
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not (self.stopping.is_set() and self.records.empty()):
+            try:
+                batch = [self.records.get(timeout=self.handler.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.handler.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            self.send(batch)
+        self.close()
+
+    def send(self, batch):
+        payload = ('\n'.join(batch) + '\n').encode()
+        if time.monotonic() >= self.retry_at:
+            try:
+                if self.sock is None:
+                    self.sock = socket.create_connection(
+                        (self.handler.host, self.handler.port), timeout=self.handler.timeout
+                    )
+                self.sock.sendall(payload)
+                return
+            except OSError:
+                self.close()
+                # Do not pay the connection timeout for every batch while Logstash is down
+                self.retry_at = time.monotonic() + self.handler.retry_interval
+        self.handler.write_fallback(batch)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def stop(self, timeout=5.0):
+        self.stopping.set()
+        self.join(timeout)
+
+
+class LogstashHandler(logging.handlers.QueueHandler):
+    """Queue-backed handler shipping JSON lines to the Logstash TCP input
+
+    Logging calls never wait on the network: a full queue drops the record
+    and counts it in `dropped`. The sender thread is started lazily and
+    again after a fork, so it works with gunicorn's pre-forked workers.
+    """
+
+    def __init__(self, host, port, fallback_filename, queue_size=10000, batch_size=200,
+                 flush_interval=1.0, timeout=2.0, retry_interval=30.0, max_bytes=10485760, backup_count=5):
+        super().__init__(queue.Queue(queue_size))
+        self.host = host
+        self.port = int(port)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.dropped = 0
+        self.fallback = logging.handlers.RotatingFileHandler(
+            fallback_filename, maxBytes=max_bytes, backupCount=backup_count, delay=True
+        )
+        self.fallback.setFormatter(logging.Formatter('%(message)s'))
+        self._pid = None
+        self._sender = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_sender(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # The queue and thread of a parent process do not survive a fork
+            self.queue = queue.Queue(self.queue_size)
+            self._sender = _Sender(self, self.queue)
+            self._sender.start()
+            self._pid = os.getpid()
+            atexit.register(self._sender.stop)
+
+    def prepare(self, record):
+        # Formatted here: the request context only exists in the calling thread
+        return self.format(record)
+
+    def enqueue(self, line):
+        self._ensure_sender()
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def write_fallback(self, lines):
+        for line in lines:
+            self.fallback.emit(logging.makeLogRecord({'msg': line}))
+
+    def close(self):
+        if self._sender is not None and self._pid == os.getpid():
+            self._sender.stop()
+        self.fallback.close()
+        super().close()
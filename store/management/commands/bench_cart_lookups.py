@@ -0,0 +1,87 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from store.models import Customer, Order
+
+# Indexes added for the cart lookups, dropped for the "before" measurement
+CART_INDEXES = ['unique_open_order_per_customer', 'order_customer_complete_idx']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mesure la latence de la recherche du panier ouvert sur une grande table de commandes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000000, help='Nombre de commandes générées')
+        parser.add_argument('--customers', type=int, default=1000, help='Nombre de clients')
+        parser.add_argument('--lookups', type=int, default=2000, help='Nombre de recherches mesurées')
+
+    def handle(self, *args, **options):
+        try:
+            # Everything generated here, including dropped indexes, is rolled back
+            with transaction.atomic():
+                customer_ids = self.seed(options['orders'], options['customers'])
+                after = self.measure(customer_ids, options['lookups'])
+                self.drop_indexes()
+                before = self.measure(customer_ids, options['lookups'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"{'':>14} {'p50 (µs)':>10} {'p99 (µs)':>10}")
+        self.stdout.write(f"{'sans index':>14} {before[0]:>10.1f} {before[1]:>10.1f}")
+        self.stdout.write(f"{'avec index':>14} {after[0]:>10.1f} {after[1]:>10.1f}")
+        self.stdout.write(self.style.SUCCESS(f"Gain p50: {before[0] / after[0]:.1f}x"))
+
+    def seed(self, orders, customers):
+        self.stdout.write(f"Génération de {customers} clients et {orders} commandes...")
+        Customer.objects.bulk_create(
+            [Customer(name=f'Bench {i}', email=f'bench{i}@example.com') for i in range(customers)]
+        )
+        customer_ids = list(
+            Customer.objects.filter(email__startswith='bench').values_list('id', flat=True)
+        )
+
+        now = timezone.now()
+        chunk = 50000
+        for start in range(0, orders, chunk):
+            batch = []
+            for i in range(start, min(start + chunk, orders)):
+                customer_id = customer_ids[i % len(customer_ids)]
+                # The last order of each customer is the open cart
+                batch.append(Order(
+                    customer_id=customer_id,
+                    date_ordered=now,
+                    complete=i < orders - len(customer_ids),
+                ))
+            Order.objects.bulk_create(batch)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE store_order')
+            else:
+                cursor.execute('ANALYZE')
+        return customer_ids
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for name in CART_INDEXES:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+
+    def measure(self, customer_ids, lookups):
+        samples = []
+        for _ in range(lookups):
+            customer_id = random.choice(customer_ids)
+            start = time.perf_counter()
+            order = Order.objects.filter(customer_id=customer_id, complete=False).first()
+            samples.append((time.perf_counter() - start) * 1e6)
+            assert order is not None
+        samples.sort()
+        return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from store.catalog import bump_catalog_version, catalog_cache_stats, reset_catalog_cache_stats
+from store.models import Product
+
+UNCACHED = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+CACHED = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-catalog'}}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Mesure les requêtes/seconde de la page boutique avec et sans cache du catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, nargs='+', default=[1000, 50000],
+                            help='Tailles de catalogue à mesurer')
+        parser.add_argument('--requests', type=int, default=20,
+                            help='Nombre de requêtes par mesure')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'produits':>10} {'sans cache':>14} {'avec cache':>14} {'gain':>8}")
+        for size in options['products']:
+            try:
+                # Seeded products are rolled back once the size is measured
+                with transaction.atomic():
+                    self.seed(size)
+                    before = self.measure(UNCACHED, options['requests'])
+                    after = self.measure(CACHED, options['requests'])
+                    raise Rollback
+            except Rollback:
+                pass
+            self.stdout.write(f"{size:>10} {before:>10.1f} r/s {after:>10.1f} r/s {after / before:>7.1f}x")
+
+    def seed(self, size):
+        Product.objects.all().delete()
+        Product.objects.bulk_create(
+            [Product(name=f'Produit {i}', price=float(i % 500) + 0.99, digital=(i % 4 == 0)) for i in range(size)]
+        )
+
+    def measure(self, caches, requests):
+        client = Client(HTTP_HOST='localhost')
+        url = reverse('store')
+        with override_settings(CACHES=caches):
+            bump_catalog_version()
+            reset_catalog_cache_stats()
+            client.get(url)  # warm-up, fills the cache when enabled
+            start = time.perf_counter()
+            for _ in range(requests):
+                response = client.get(url)
+                assert response.status_code == 200, response.status_code
+            elapsed = time.perf_counter() - start
+            stats = catalog_cache_stats()
+        self.stdout.write(self.style.NOTICE(f"   cache hits={stats['hits']} misses={stats['misses']}"), ending='\n')
+        return requests / elapsed
@@ -0,0 +1,152 @@
+import json
+import logging
+import multiprocessing
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from store.models import Customer, Job, Order, Product
+
+# Connection settings of each measured profile
+PROFILES = {
+    'default': {'CONN_MAX_AGE': 0, 'OPTIONS': {}},
+    'tuned': settings.SQLITE_TUNING,
+}
+SHIPPING = {'address': '1 rue du Test', 'city': 'Paris', 'state': 'IDF', 'zipcode': '75001'}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0
+
+
+def work(user_id, product_ids, duration, checkout_every, start, results):
+    """One process: cart updates, and a checkout every checkout_every requests"""
+    # Failures are counted, requests are not logged one by one
+    logging.disable(logging.ERROR)
+    client = Client(HTTP_HOST='localhost')
+    client.force_login(User.objects.get(pk=user_id))
+    latencies = {'update_item': [], 'process_order': []}
+    errors = Counter()
+    sent = 0
+    start.wait()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        sent += 1
+        if sent % checkout_every:
+            name, payload = 'update_item', {'productId': product_ids[sent % len(product_ids)], 'action': 'add'}
+        else:
+            name, payload = 'process_order', {'form': {'total': 0}, 'shipping': SHIPPING}
+        began = time.perf_counter()
+        response = client.post(reverse(name), data=json.dumps(payload), content_type='application/json')
+        if response.status_code == 200:
+            latencies[name].append(time.perf_counter() - began)
+        else:
+            errors[f'{name} {response.status_code}'] += 1
+    connection.close()
+    results.put((latencies, errors))
+
+
+class Command(BaseCommand):
+    help = ("Processus concurrents qui modifient leur panier et valident leur commande : "
+            "débit et erreurs 'database is locked' de SQLite selon le profil de connexion")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=6, help='Processus concurrents (workers gunicorn)')
+        parser.add_argument('--duration', type=float, default=10, help='Durée de mesure par profil, en secondes')
+        parser.add_argument('--checkout-every', type=int, default=5,
+                            help='Une validation de commande toutes les N requêtes')
+        parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Ce benchmark mesure les profils de connexion SQLite')
+
+        # Dedicated fixtures, removed at the end
+        suffix = uuid.uuid4().hex[:8]
+        last_job = Job.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        products = Product.objects.bulk_create(
+            [Product(name=f'Contention {suffix} {i}', price=9.99) for i in range(20)]
+        )
+        users = []
+        for i in range(options['processes']):
+            user = User.objects.create_user(username=f'contention-{suffix}-{i}', password=uuid.uuid4().hex)
+            Customer.objects.create(user=user, name='Contention', email=f'contention-{suffix}-{i}@example.com')
+            users.append(user)
+
+        original = {key: connection.settings_dict[key] for key in ('CONN_MAX_AGE', 'OPTIONS')}
+        results = {}
+        try:
+            for profile in options['profiles']:
+                self.use_profile(PROFILES[profile])
+                results[profile] = self.measure(users, [p.id for p in products], options)
+        finally:
+            self.use_profile(original)
+            Order.objects.filter(customer__user__in=users).delete()
+            Job.objects.filter(id__gt=last_job, name='finalize_order').delete()
+            Product.objects.filter(id__in=[p.id for p in products]).delete()
+            User.objects.filter(id__in=[u.id for u in users]).delete()
+
+        self.stdout.write(
+            f"{'profil':<8} {'req/s':>8} {'erreurs':>8} {'update p50':>11} {'update p95':>11} "
+            f"{'order p50':>10} {'order p95':>10}"
+        )
+        for profile, r in results.items():
+            self.stdout.write(
+                f"{profile:<8} {r['rps']:>8.1f} {r['errors']:>8} {r['update_p50']:>9.1f}ms {r['update_p95']:>9.1f}ms "
+                f"{r['order_p50']:>8.1f}ms {r['order_p95']:>8.1f}ms"
+            )
+        for profile, r in results.items():
+            if r['failures']:
+                self.stdout.write(self.style.WARNING(f"{profile}: {dict(r['failures'])}"))
+
+    def use_profile(self, profile):
+        """Connection settings of the next connections, journal mode of the file"""
+        connections.close_all()
+        connection.settings_dict.update(profile)
+        if 'init_command' not in profile['OPTIONS']:
+            # The journal mode is stored in the file: back to the rollback journal
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=DELETE')
+        # Not inherited by the processes
+        connection.close()
+
+    def measure(self, users, product_ids, options):
+        context = multiprocessing.get_context('fork')
+        start = context.Barrier(len(users))
+        queue = context.Queue()
+        processes = [
+            context.Process(target=work, args=(
+                user.id, product_ids, options['duration'], options['checkout_every'], start, queue,
+            ))
+            for user in users
+        ]
+        for process in processes:
+            process.start()
+        latencies = {'update_item': [], 'process_order': []}
+        failures = Counter()
+        for _ in processes:
+            process_latencies, process_errors = queue.get()
+            for name, values in process_latencies.items():
+                latencies[name] += values
+            failures.update(process_errors)
+        for process in processes:
+            process.join()
+
+        done = len(latencies['update_item']) + len(latencies['process_order'])
+        return {
+            'rps': done / options['duration'],
+            'errors': sum(failures.values()),
+            'failures': failures,
+            'update_p50': percentile(latencies['update_item'], 0.50),
+            'update_p95': percentile(latencies['update_item'], 0.95),
+            'order_p50': percentile(latencies['process_order'], 0.50),
+            'order_p95': percentile(latencies['process_order'], 0.95),
+        }
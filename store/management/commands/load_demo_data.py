@@ -36,72 +36,84 @@ class Command(BaseCommand):
                 'price': 2499.99,
                 'digital': False,
                 'image': 'placeholder.png',
+                'description': 'Ordinateur portable haute performance avec puce M3 Pro, 16GB RAM, 512GB SSD. Parfait pour le développement et la création de contenu.',
             },
             {
                 'name': 'iPhone 15 Pro',
                 'price': 1199.99,
                 'digital': False,
                 'image': 'placeholder.png',
+                'description': 'Smartphone dernière génération avec puce A17 Pro, appareil photo 48MP, écran ProMotion 120Hz. Disponible en 256GB.',
             },
             {
                 'name': 'AirPods Pro (2ème gen)',
                 'price': 249.99,
                 'digital': False,
                 'image': 'headphones.jpg',
+                'description': 'Écouteurs sans fil avec réduction de bruit active, son spatial personnalisé, résistance à l\'eau IPX4. Boîtier MagSafe inclus.',
             },
             {
                 'name': 'iPad Air 11"',
                 'price': 699.99,
                 'digital': False,
                 'image': 'placeholder.png',
+                'description': 'Tablette polyvalente avec puce M2, écran Liquid Retina, compatible Apple Pencil. Idéale pour le travail et le divertissement.',
             },
             {
                 'name': 'Apple Watch Series 9',
                 'price': 429.99,
                 'digital': False,
                 'image': 'watch.jpg',
+                'description': 'Montre connectée avec suivi santé avancé, GPS, écran always-on, résistance à l\'eau 50m. Boîtier 45mm en aluminium.',
             },
             {
                 'name': 'Formation Python Complète',
                 'price': 89.99,
                 'digital': True,
                 'image': 'sourcecode.jpg',
+                'description': 'Cours vidéo complet pour maîtriser Python : bases, POO, Django, Flask, data science. 40h de contenu + exercices pratiques.',
             },
             {
                 'name': 'Formation Docker & Kubernetes',
                 'price': 129.99,
                 'digital': True,
                 'image': 'book.jpg',
+                'description': 'Apprenez la conteneurisation et l\'orchestration : Docker, Docker Compose, Kubernetes, CI/CD. Certificat inclus.',
             },
             {
                 'name': 'Formation Web Full Stack',
                 'price': 199.99,
                 'digital': True,
                 'image': 'sourcecode.jpg',
+                'description': 'Formation complète : HTML/CSS, JavaScript, React, Node.js, MongoDB, déploiement. Projets réels + portfolio.',
             },
             {
                 'name': 'Magic Keyboard',
                 'price': 99.99,
                 'digital': False,
                 'image': 'placeholder.png',
+                'description': 'Clavier sans fil rechargeable avec pavé numérique, connexion Bluetooth, compatible Mac et iPad. Batterie longue durée.',
             },
             {
                 'name': 'Magic Mouse',
                 'price': 79.99,
                 'digital': False,
                 'image': 'placeholder.png',
+                'description': 'Souris sans fil avec surface tactile Multi-Touch, rechargeable, design ergonomique. Compatible macOS et iPadOS.',
             },
             {
                 'name': 'T-Shirt Developer',
                 'price': 29.99,
                 'digital': False,
                 'image': 'shirt.jpg',
+                'description': 'T-shirt 100% coton bio avec design humoristique "I speak fluent Python". Tailles S à XXL disponibles.',
             },
             {
                 'name': 'Sneakers Tech',
                 'price': 149.99,
                 'digital': False,
                 'image': 'shoes.jpg',
+                'description': 'Baskets confortables avec semelle memory foam, design moderne, matériaux respirants. Parfaites pour le quotidien.',
             },
         ]
         
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.idempotency import prune_keys
+
+
+class Command(BaseCommand):
+    help = ("Supprime les clés Idempotency-Key plus anciennes que IDEMPOTENCY_KEY_TTL "
+            "(le worker run_jobs le fait aussi périodiquement)")
+
+    def handle(self, *args, **options):
+        count = prune_keys()
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} clé(s) de plus de {settings.IDEMPOTENCY_KEY_TTL} s supprimée(s)"
+        ))
@@ -0,0 +1,57 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.idempotency import prune_keys
+from store.jobs import requeue_dead, run_batch, worker_id
+
+
+class Command(BaseCommand):
+    help = "Exécute les tâches en attente de la file de tâches (finalisation des commandes, ...)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Nombre de tâches réservées par lot')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help="Pause en secondes quand la file est vide")
+        parser.add_argument('--once', action='store_true', help='Traite les tâches dues puis s\'arrête')
+        parser.add_argument('--requeue-dead', action='store_true',
+                            help='Remet en file les tâches mortes puis s\'arrête')
+        parser.add_argument('--prune-interval', type=float, default=3600,
+                            help='Supprime les clés Idempotency-Key expirées toutes les N secondes, 0 : jamais')
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            count = requeue_dead()
+            self.stdout.write(self.style.SUCCESS(f"{count} tâche(s) remise(s) en file"))
+            return
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        worker = worker_id()
+        self.stdout.write(f"Worker {worker} démarré (lots de {options['batch_size']})")
+        total = 0
+        next_prune = time.monotonic()
+        while self.running:
+            # The worker is long-lived: drop connections past CONN_MAX_AGE or broken
+            close_old_connections()
+            if options['prune_interval'] and time.monotonic() >= next_prune:
+                pruned = prune_keys()
+                if pruned:
+                    self.stdout.write(f"{pruned} clé(s) Idempotency-Key expirée(s) supprimée(s)")
+                next_prune = time.monotonic() + options['prune_interval']
+            processed = run_batch(options['batch_size'], worker)
+            total += processed
+            if not processed:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        close_old_connections()
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker} arrêté, {total} tâche(s) traitée(s)"))
+
+    def stop(self, signum, frame):
+        # The current batch is finished before exiting
+        self.running = False
@@ -0,0 +1,135 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.catalog import bump_catalog_version
+from store.models import Customer, Order, OrderItem, Product
+from store.search import index_products
+
+USERNAME_PREFIX = 'loadtest_'
+TRANSACTION_PREFIX = 'loadtest-'
+DESCRIPTION_PREFIX = 'Produit synthétique'
+DEFAULT_PASSWORD = 'loadtest123'
+
+NOUNS = ['Casque', 'Clavier', 'Souris', 'Écran', 'Chargeur', 'Enceinte', 'Montre', 'Tablette',
+         'Formation', 'Livre', 'Câble', 'Webcam', 'Microphone', 'Sacoche', 'Station']
+QUALIFIERS = ['Pro', 'Air', 'Mini', 'Max', 'Lite', 'Plus', 'Ultra', 'Sport', 'Studio', 'Nomade']
+DIGITAL_NOUNS = {'Formation', 'Livre'}
+
+
+class Command(BaseCommand):
+    help = ("Génère un jeu de données synthétique pour les tests de charge "
+            "(catalogue, clients loadtest_NNNNN et historique de commandes)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Nombre de produits')
+        parser.add_argument('--customers', type=int, default=200,
+                            help='Nombre de clients (loadtest_00000, loadtest_00001, ...)')
+        parser.add_argument('--orders', type=int, default=5000, help='Commandes passées à générer')
+        parser.add_argument('--lines', type=int, default=3, help='Lignes par commande (au plus)')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help='Mot de passe des clients')
+        parser.add_argument('--seed', type=int, default=42, help='Graine du générateur aléatoire')
+        parser.add_argument('--reset', action='store_true',
+                            help='Supprime les données synthétiques existantes avant de générer')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Taille des lots bulk_create (500 au plus sous SQLite)')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        start = time.perf_counter()
+        with transaction.atomic():
+            if options['reset']:
+                self.reset()
+            products = self.create_products(options['products'])
+            customers = self.create_customers(options['customers'], options['password'])
+            orders = self.create_orders(options['orders'], options['lines'], customers, products)
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(products)} produits, {len(customers)} clients, {orders} commandes "
+            f"générés en {time.perf_counter() - start:.1f}s (mot de passe : {options['password']})"
+        ))
+
+    def reset(self):
+        # Orders go first: their lines are detached (SET_NULL), so deleting the
+        # lines below does not recompute the totals of each order
+        customers = Customer.objects.filter(user__username__startswith=USERNAME_PREFIX)
+        Order.objects.filter(transaction_id__startswith=TRANSACTION_PREFIX).delete()
+        Order.objects.filter(customer__in=customers).delete()
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        products = Product.objects.filter(description__startswith=DESCRIPTION_PREFIX)
+        OrderItem.objects.filter(order__isnull=True, product__in=products).delete()
+        deleted = products.count()
+        products.delete()
+        self.stdout.write(f"Données synthétiques précédentes supprimées ({deleted} produits)")
+
+    def create_products(self, count):
+        first = Product.objects.filter(description__startswith=DESCRIPTION_PREFIX).count()
+        new = []
+        for i in range(first, first + count):
+            noun, qualifier = self.rng.choice(NOUNS), self.rng.choice(QUALIFIERS)
+            new.append(Product(
+                name=f'{noun} {qualifier} {i}',
+                price=round(self.rng.uniform(5, 2500), 2),
+                digital=noun in DIGITAL_NOUNS,
+                description=f'{DESCRIPTION_PREFIX} : {noun.lower()} {qualifier.lower()}, série {i % 97}',
+            ))
+        Product.objects.bulk_create(new, batch_size=self.batch_size)
+        # bulk_create sends no signal: index the rows for the search API
+        products = list(Product.objects.filter(description__startswith=DESCRIPTION_PREFIX))
+        index_products(products)
+        return products
+
+    def create_customers(self, count, password):
+        # Hashing is the slow part: every synthetic user shares one hash
+        hashed = make_password(password)
+        existing = set(User.objects.filter(username__startswith=USERNAME_PREFIX).values_list('username', flat=True))
+        names = [f'{USERNAME_PREFIX}{i:05d}' for i in range(count)]
+        User.objects.bulk_create(
+            [User(username=name, password=hashed, email=f'{name}@example.com') for name in names if name not in existing],
+            batch_size=self.batch_size,
+        )
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX, customer__isnull=True)
+        Customer.objects.bulk_create(
+            [Customer(user=user, name=user.username, email=user.email) for user in users],
+            batch_size=self.batch_size,
+        )
+        return list(Customer.objects.filter(user__username__startswith=USERNAME_PREFIX))
+
+    def create_orders(self, count, max_lines, customers, products):
+        if not count or not customers or not products:
+            return 0
+        first = Order.objects.filter(transaction_id__startswith=TRANSACTION_PREFIX).count()
+        lines = {}
+        orders = []
+        for i in range(first, first + count):
+            transaction_id = f'{TRANSACTION_PREFIX}{i}'
+            picked = self.rng.sample(products, min(len(products), self.rng.randint(1, max_lines)))
+            lines[transaction_id] = [(product, self.rng.randint(1, 5)) for product in picked]
+            orders.append(Order(
+                customer=self.rng.choice(customers),
+                complete=True,
+                transaction_id=transaction_id,
+                total=round(sum(product.price * quantity for product, quantity in lines[transaction_id]), 2),
+                item_count=sum(quantity for _, quantity in lines[transaction_id]),
+                requires_shipping=any(not product.digital for product, _ in lines[transaction_id]),
+            ))
+        Order.objects.bulk_create(orders, batch_size=self.batch_size)
+
+        # Primary keys are not returned by bulk_create on every backend
+        ids = dict(
+            Order.objects.filter(transaction_id__startswith=TRANSACTION_PREFIX).values_list('transaction_id', 'id')
+        )
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(order_id=ids[transaction_id], product=product, quantity=quantity)
+                for transaction_id, order_lines in lines.items()
+                for product, quantity in order_lines
+            ],
+            batch_size=self.batch_size,
+        )
+        return count
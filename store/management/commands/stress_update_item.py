@@ -0,0 +1,81 @@
+import json
+import threading
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from store.models import Customer, Order, OrderItem, Product
+
+
+class Command(BaseCommand):
+    help = "Clients concurrents sur la même ligne de panier : vérifie qu'aucune mise à jour n'est perdue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=10, help='Nombre de clients concurrents')
+        parser.add_argument('--rounds', type=int, default=3,
+                            help='Séquences ajouter/ajouter/retirer par client (+1 par séquence)')
+
+    def handle(self, *args, **options):
+        clients, rounds = options['clients'], options['rounds']
+        expected = clients * rounds
+        if expected > 100:
+            raise CommandError('clients x rounds doit rester <= 100 (quantité maximale)')
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                "SQLite verrouille toute la base en écriture : des erreurs 'database is locked' sont attendues, "
+                "utilisez PostgreSQL pour un résultat significatif"
+            ))
+
+        # Dedicated fixtures, removed at the end: threads cannot share a rollback
+        suffix = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(username=f'stress-{suffix}', password=uuid.uuid4().hex)
+        customer = Customer.objects.create(user=user, name='Stress', email=f'stress-{suffix}@example.com')
+        product = Product.objects.create(name=f'Stress {suffix}', price=1.00)
+
+        errors = []
+        url = reverse('update_item')
+
+        def run():
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            try:
+                for _ in range(rounds):
+                    for action in ('add', 'add', 'remove'):
+                        response = client.post(url, data=json.dumps({'productId': product.id, 'action': action}),
+                                               content_type='application/json')
+                        if response.status_code != 200:
+                            errors.append(response.status_code)
+            finally:
+                connection.close()
+
+        try:
+            threads = [threading.Thread(target=run) for _ in range(clients)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            item = OrderItem.objects.filter(order__customer=customer, product=product).first()
+            quantity = item.quantity if item else 0
+            order = Order.objects.get(customer=customer, complete=False)
+
+            clicks = clients * rounds * 3
+            self.stdout.write(f"{clicks} clics en {elapsed:.2f}s ({clicks / elapsed:.1f} clics/s), erreurs: {len(errors)}")
+            self.stdout.write(f"Quantité finale: {quantity} (attendue {expected}), total stocké: {order.item_count}")
+            if errors:
+                self.stdout.write(self.style.WARNING(f"Requêtes en échec: {sorted(set(errors))}"))
+            elif quantity == expected and order.item_count == expected:
+                self.stdout.write(self.style.SUCCESS('Aucune mise à jour perdue'))
+            else:
+                raise CommandError('Mises à jour perdues')
+        finally:
+            Order.objects.filter(customer=customer).delete()
+            product.delete()
+            user.delete()
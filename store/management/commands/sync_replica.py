@@ -0,0 +1,38 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from store.routers import REPLICA
+
+
+class Command(BaseCommand):
+    help = ("Copie la base SQLite principale dans la réplique (DB_REPLICA_NAME) : "
+            "une réplication simulée pour tester le routage des lectures en local")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Recopie toutes les N secondes (délai de réplication simulé), 0 : une seule copie')
+
+    def handle(self, *args, **options):
+        if REPLICA not in connections:
+            raise CommandError("Pas de base 'replica' : définir DB_REPLICA_NAME")
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[REPLICA]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Copie SQLite uniquement : une réplique PostgreSQL se synchronise elle-même')
+
+        while True:
+            start = time.perf_counter()
+            source = sqlite3.connect(primary.settings_dict['NAME'])
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                # Consistent snapshot, even while the application writes
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write(f"Réplique copiée en {(time.perf_counter() - start) * 1000:.0f} ms")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
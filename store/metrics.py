@@ -0,0 +1,111 @@
+"""Prometheus metrics served at /metrics.
+
+Request and business metrics are updated in-process by
+QueryProfilerMiddleware, the checkout views and the Order signals. Under gunicorn every worker
+writes its samples to PROMETHEUS_MULTIPROC_DIR and the /metrics view
+aggregates all of them (prometheus_client multiprocess mode); dead
+workers are cleaned up by the child_exit hook of gunicorn.conf.py.
+Database-derived gauges (open carts, job queue) are computed when
+scraped, so they are identical whichever worker answers.
+
+Gunicorn's port serves /metrics too, so the view only answers the
+METRICS_ALLOWED_NETWORKS or a bearer METRICS_TOKEN (see scrape_allowed).
+"""
+import hmac
+import ipaddress
+import os
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .models import Job, Order
+
+REQUEST_DURATION = Histogram(
+    'django_http_request_duration_seconds',
+    'Request latency by URL name',
+    ['view', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+REQUEST_QUERIES = Histogram(
+    'django_db_queries_per_request',
+    'SQL queries per request by URL name',
+    ['view'],
+    buckets=(0, 1, 2, 4, 6, 8, 12, 16, 25, 50, 100),
+)
+CHECKOUTS = Counter(
+    'store_checkouts_total',
+    'Checkout attempts by channel and outcome',
+    ['channel', 'outcome'],
+)
+ORDERS = Counter(
+    'store_orders_total',
+    'Orders created (carts opened) and completed',
+    ['event'],
+)
+CATALOG_CACHE = Counter(
+    'store_catalog_cache_requests_total',
+    'Catalog cache lookups by result',
+    ['result'],
+)
+
+
+def observe_request(view, method, status, seconds, queries=None):
+    REQUEST_DURATION.labels(view, method, str(status)).observe(seconds)
+    if queries is not None:
+        REQUEST_QUERIES.labels(view).observe(queries)
+
+
+def record_checkout(channel, outcome):
+    CHECKOUTS.labels(channel, outcome).inc()
+
+
+class DatabaseCollector:
+    """Gauges read from the database at scrape time"""
+
+    def collect(self):
+        carts = Order.objects.filter(complete=False, item_count__gt=0).aggregate(
+            count=Count('id'), value=Sum('total'),
+        )
+        yield GaugeMetricFamily('store_open_carts', 'Open orders with at least one item', value=carts['count'])
+        yield GaugeMetricFamily('store_open_carts_value', 'Total value of the open carts', value=carts['value'] or 0)
+
+        jobs = GaugeMetricFamily('store_jobs', 'Jobs of the queue by status', labels=['status'])
+        counts = dict(Job.objects.exclude(status=Job.DONE).values_list('status').annotate(n=Count('id')))
+        for status in (Job.PENDING, Job.DEAD):
+            jobs.add_metric([status], counts.get(status, 0))
+        yield jobs
+
+
+def scrape_allowed(request):
+    """Whether the client may read /metrics: trusted network or bearer token"""
+    token = settings.METRICS_TOKEN
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network.strip())
+        for network in settings.METRICS_ALLOWED_NETWORKS if network.strip()
+    )
+
+
+def render_metrics():
+    """Exposition payload and content type of every metric"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        metrics = generate_latest(registry)
+    else:
+        metrics = generate_latest(REGISTRY)
+
+    database = CollectorRegistry(auto_describe=False)
+    database.register(DatabaseCollector())
+    return metrics + generate_latest(database), CONTENT_TYPE_LATEST
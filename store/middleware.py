@@ -0,0 +1,246 @@
+"""Per-request log context, SQL profiling and per-view budgets.
+
+RequestContextMiddleware binds the X-Request-ID of the request (forwarded
+by nginx, or generated) and the view name to every log record of the
+request (see store.log) and returns the id in the response.
+QueryProfilerMiddleware counts the queries and the database time of each
+request on every configured connection, and groups queries by fingerprint
+(the SQL with literals and IN lists collapsed) to expose N+1 patterns.
+The profile is logged as structured fields through the store logger and
+the latency and query count feed the Prometheus histograms (store.metrics).
+Requests over the budget of their view (settings.QUERY_BUDGETS, falling
+back to QUERY_BUDGET_DEFAULT) log a warning, or raise QueryBudgetExceeded
+when settings.QUERY_BUDGET_STRICT is set, as it is under the test runner.
+ReplicaStickinessMiddleware, installed with a read replica, keeps the
+reads of a client that just wrote on the primary (see store.routers).
+
+These middlewares are sync and async capable, so under ASGI the chain does
+not switch threads around them. Database connections are per thread:
+there the profile is attached to the connections of the thread that runs
+the sync code of the request (thread-sensitive sync_to_async calls).
+"""
+import hashlib
+import logging
+import re
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .log import bind_request, unbind_request
+from .metrics import observe_request
+from .routers import STICKY_COOKIE, request_routing
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+# Savepoints of nested atomic blocks are not queries
+_TRANSACTION_CONTROL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """Short stable id of a query shape, independent of its parameters"""
+    shape = _IN_LIST_RE.sub('(...)', sql)
+    shape = _STRING_RE.sub('?', shape)
+    shape = _NUMBER_RE.sub('?', shape)
+    return hashlib.md5(shape.encode()).hexdigest()[:12], shape
+
+
+class QueryProfile:
+    """execute_wrapper recording the queries of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.shapes = Counter()
+        self.samples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(_TRANSACTION_CONTROL):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+            key, shape = fingerprint(sql)
+            self.shapes[key] += 1
+            self.samples.setdefault(key, shape)
+
+    @property
+    def duplicates(self):
+        """Executions beyond the first of every repeated query shape"""
+        return sum(count - 1 for count in self.shapes.values())
+
+    def repeated(self, limit=3):
+        return [
+            {'fingerprint': key, 'count': count, 'sql': self.samples[key][:200]}
+            for key, count in self.shapes.most_common(limit) if count > 1
+        ]
+
+
+class HybridMiddleware:
+    """Base of the middlewares that run in the mode of the rest of the chain"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+class RequestContextMiddleware(HybridMiddleware):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(self):
+            # Called by the async handler without a thread switch
+            self.process_view = self.aprocess_view
+
+    def bind(self, request):
+        # Set by nginx (same format rule), so access and application logs share it
+        request_id = request.META.get('HTTP_X_REQUEST_ID', '')
+        request.id = request_id if _REQUEST_ID_RE.match(request_id) else uuid.uuid4().hex
+        return bind_request(request_id=request.id)
+
+    def handle(self, request):
+        token = self.bind(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            unbind_request(token)
+        response['X-Request-ID'] = request.id
+        return response
+
+    async def __acall__(self, request):
+        token = self.bind(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            unbind_request(token)
+        response['X-Request-ID'] = request.id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        bind_request(view=request.resolver_match.view_name)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        # self.process_view is this method under async
+        bind_request(view=request.resolver_match.view_name)
+
+
+def view_budget(view_name):
+    budget = dict(settings.QUERY_BUDGET_DEFAULT)
+    budget.update(settings.QUERY_BUDGETS.get(view_name, {}))
+    return budget
+
+
+def _profiled(profile):
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile))
+    return stack
+
+
+class QueryProfilerMiddleware(HybridMiddleware):
+    def handle(self, request):
+        profile = QueryProfile()
+        start = time.perf_counter()
+        with _profiled(profile):
+            response = self.get_response(request)
+        self.report(request, response, profile, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        profile = QueryProfile()
+        start = time.perf_counter()
+        stack = await sync_to_async(_profiled)(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.report(request, response, profile, time.perf_counter() - start)
+        return response
+
+    def report(self, request, response, profile, latency):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        fields = {
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'latency_ms': round(latency * 1000, 2),
+            'db_queries': profile.count,
+            'db_time_ms': round(profile.time * 1000, 2),
+            'db_duplicates': profile.duplicates,
+            'db_repeated': profile.repeated(),
+        }
+        request.query_profile = fields
+        logger.info(
+            f"{request.method} {request.path} {response.status_code} view={view_name} "
+            f"latency={fields['latency_ms']}ms queries={profile.count} "
+            f"db_time={fields['db_time_ms']}ms duplicates={profile.duplicates}",
+            extra=fields,
+        )
+        observe_request(view_name, request.method, response.status_code, latency, profile.count)
+        self.check_budget(view_name, fields)
+
+    def check_budget(self, view_name, fields):
+        budget = view_budget(view_name)
+        exceeded = [
+            f'{name}={fields[field]} > {budget[name]}'
+            for name, field in (('queries', 'db_queries'), ('db_time_ms', 'db_time_ms'), ('duplicates', 'db_duplicates'))
+            if name in budget and fields[field] > budget[name]
+        ]
+        if not exceeded:
+            return
+        message = f"Query budget exceeded by {view_name}: {', '.join(exceeded)}; repeated: {fields['db_repeated']}"
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message, extra=fields)
+
+
+class ReplicaStickinessMiddleware(HybridMiddleware):
+    def pinned(self, request):
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def stick(self, response, writes):
+        # The replica may not have the writes yet, the next requests read the primary
+        if writes:
+            response.set_cookie(
+                STICKY_COOKIE, f'{time.time() + settings.REPLICA_STICKY_SECONDS:.3f}',
+                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
+
+    def handle(self, request):
+        with request_routing(self.pinned(request)) as writes:
+            response = self.get_response(request)
+        return self.stick(response, writes)
+
+    async def __acall__(self, request):
+        with request_routing(self.pinned(request)) as writes:
+            response = await self.get_response(request)
+        return self.stick(response, writes)
@@ -0,0 +1,50 @@
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+
+    totals = (
+        OrderItem.objects.filter(order__isnull=False)
+        .values('order')
+        .annotate(
+            total=Coalesce(Sum(F('quantity') * F('product__price'), output_field=FloatField()), 0.0),
+            item_count=Coalesce(Sum('quantity'), 0),
+            physical_lines=Count('id', filter=Q(product__digital=False)),
+        )
+    )
+    for row in totals.iterator():
+        Order.objects.filter(pk=row['order']).update(
+            total=row['total'],
+            item_count=row['item_count'],
+            requires_shipping=row['physical_lines'] > 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_product_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='requires_shipping',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
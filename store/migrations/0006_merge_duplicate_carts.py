@@ -0,0 +1,61 @@
+from django.db import migrations
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    """Fold duplicate open orders and order lines so the constraints can be added"""
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+
+    touched = set()
+
+    # Keep the most recent open order of each customer, move older lines into it
+    duplicated = (
+        Order.objects.filter(complete=False, customer__isnull=False)
+        .values('customer').annotate(n=Count('id')).filter(n__gt=1)
+    )
+    for row in duplicated:
+        orders = list(Order.objects.filter(customer=row['customer'], complete=False).order_by('-id'))
+        keep, stale = orders[0], orders[1:]
+        OrderItem.objects.filter(order__in=stale).update(order=keep)
+        Order.objects.filter(pk__in=[order.pk for order in stale]).delete()
+        touched.add(keep.pk)
+
+    # Sum duplicate lines of the same product into the oldest one
+    duplicated = (
+        OrderItem.objects.filter(order__isnull=False, product__isnull=False)
+        .values('order', 'product').annotate(n=Count('id')).filter(n__gt=1)
+    )
+    for row in duplicated:
+        items = list(OrderItem.objects.filter(order=row['order'], product=row['product']).order_by('id'))
+        keep = items[0]
+        keep.quantity = min(sum(item.quantity or 0 for item in items), 100)
+        keep.save(update_fields=['quantity'])
+        OrderItem.objects.filter(pk__in=[item.pk for item in items[1:]]).delete()
+        touched.add(row['order'])
+
+    for order_id in touched:
+        totals = OrderItem.objects.filter(order=order_id).aggregate(
+            total=Coalesce(Sum(F('quantity') * F('product__price'), output_field=FloatField()), 0.0),
+            item_count=Coalesce(Sum('quantity'), 0),
+            physical_lines=Count('id', filter=Q(product__digital=False)),
+        )
+        Order.objects.filter(pk=order_id).update(
+            total=totals['total'],
+            item_count=totals['item_count'],
+            requires_shipping=totals['physical_lines'] > 0,
+        )
+
+
+# Kept apart from 0007: on PostgreSQL the deferred foreign key checks of
+# these updates would make its ALTER TABLE fail with pending trigger events
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='cookies',
+            field=models.TextField(default='{}'),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='headers',
+            field=models.TextField(default='{}'),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Q, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Create your models here.
 
@@ -17,6 +20,15 @@ class Product(models.Model):
 	price = models.FloatField()
 	digital = models.BooleanField(default=False,null=True, blank=True)
 	image = models.ImageField(null=True, blank=True)
+	description = models.TextField(blank=True, default='')
+
+	class Meta:
+		# Keyset pagination of the listing API (see store.listing)
+		indexes = [
+			models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+			models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+			models.Index(fields=['digital', 'price', 'id'], name='product_digital_price_idx'),
+		]
 
 	def __str__(self):
 		return self.name
@@ -34,30 +46,64 @@ class Order(models.Model):
 	date_ordered = models.DateTimeField(auto_now_add=True)
 	complete = models.BooleanField(default=False)
 	transaction_id = models.CharField(max_length=100, null=True)
+	# Denormalized cart totals, maintained by recompute_totals()
+	total = models.FloatField(default=0)
+	item_count = models.IntegerField(default=0)
+	requires_shipping = models.BooleanField(default=False)
+
+	class Meta:
+		constraints = [
+			# At most one open cart per customer
+			models.UniqueConstraint(
+				fields=['customer'], condition=Q(complete=False), name='unique_open_order_per_customer'
+			),
+		]
+		indexes = [
+			# SQLite cannot prove a bound complete=? matches the partial index
+			models.Index(fields=['customer', 'complete'], name='order_customer_complete_idx'),
+		]
 
 	def __str__(self):
 		return str(self.id)
+
+	def recompute_totals(self, **extra):
+		"""Recalculate the stored totals from the order lines
+
+		Extra aggregates are computed in the same query and returned with the totals.
+		"""
+		totals = self.orderitem_set.aggregate(
+			total=Coalesce(Sum(F('quantity') * F('product__price'), output_field=FloatField()), 0.0),
+			item_count=Coalesce(Sum('quantity'), 0),
+			physical_lines=Count('id', filter=Q(product__digital=False, quantity__gt=0)),
+			**extra
+		)
+		self.total = totals['total']
+		self.item_count = totals['item_count']
+		self.requires_shipping = totals['physical_lines'] > 0
+		Order.objects.filter(pk=self.pk).update(
+			total=self.total,
+			item_count=self.item_count,
+			requires_shipping=self.requires_shipping,
+		)
+		return totals
+
+	def cart_lines(self):
+		"""Order lines with their product joined and line totals computed in SQL"""
+		return self.orderitem_set.select_related('product').annotate(
+			line_total=ExpressionWrapper(F('quantity') * F('product__price'), output_field=FloatField()),
+		).order_by('date_added', 'id')
 		
 	@property
 	def shipping(self):
-		shipping = False
-		orderitems = self.orderitem_set.all()
-		for i in orderitems:
-			if i.product.digital == False:
-				shipping = True
-		return shipping
+		return self.requires_shipping
 
 	@property
 	def get_cart_total(self):
-		orderitems = self.orderitem_set.all()
-		total = sum([item.get_total for item in orderitems])
-		return total 
+		return self.total
 
 	@property
 	def get_cart_items(self):
-		orderitems = self.orderitem_set.all()
-		total = sum([item.quantity for item in orderitems])
-		return total 
+		return self.item_count
 
 class OrderItem(models.Model):
 	product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
@@ -65,8 +111,16 @@ class OrderItem(models.Model):
 	quantity = models.IntegerField(default=0, null=True, blank=True)
 	date_added = models.DateTimeField(auto_now_add=True)
 
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['order', 'product'], name='unique_order_product'),
+		]
+
 	@property
 	def get_total(self):
+		# Precomputed by Order.cart_lines() when available
+		if hasattr(self, 'line_total'):
+			return self.line_total
 		total = self.product.price * self.quantity
 		return total
 
@@ -80,4 +134,47 @@ class ShippingAddress(models.Model):
 	date_added = models.DateTimeField(auto_now_add=True)
 
 	def __str__(self):
-		return self.address
\ No newline at end of file
+		return self.address
+
+
+class IdempotencyKey(models.Model):
+	# Response of a request sent with an Idempotency-Key header, replayed on retries
+	key = models.CharField(max_length=64, unique=True)
+	fingerprint = models.CharField(max_length=64)
+	status_code = models.IntegerField()
+	content_type = models.CharField(max_length=100)
+	response = models.TextField()
+	# JSON: response headers and cookies set by the view
+	headers = models.TextField(default='{}')
+	cookies = models.TextField(default='{}')
+	created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+	def __str__(self):
+		return self.key
+
+class Job(models.Model):
+	# Deferred work run outside the request by the run_jobs worker (see store.jobs)
+	PENDING = 'pending'
+	DONE = 'done'
+	DEAD = 'dead'
+	STATUS_CHOICES = [(PENDING, 'Pending'), (DONE, 'Done'), (DEAD, 'Dead')]
+
+	name = models.CharField(max_length=100)
+	payload = models.TextField(default='{}')
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+	attempts = models.IntegerField(default=0)
+	max_attempts = models.IntegerField(default=5)
+	run_at = models.DateTimeField(default=timezone.now)
+	# Lease of the worker processing the job, expired leases are claimed again
+	locked_by = models.CharField(max_length=100, blank=True, default='')
+	locked_until = models.DateTimeField(null=True, blank=True)
+	last_error = models.TextField(blank=True, default='')
+	created = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+		]
+
+	def __str__(self):
+		return f'{self.name} #{self.id} ({self.status})'
@@ -0,0 +1,81 @@
+"""Read replica routing.
+
+With a 'replica' database configured (DB_REPLICA_HOST or DB_REPLICA_NAME,
+see settings), ReplicaRouter sends there the reads that tolerate the
+replication lag:
+- catalog reads (Product): the listing API, the search, the product admin;
+- every read of the admin changelists (reports over orders), run under
+  replica_reads().
+Other reads and every write go to the primary, as do the reads inside a
+transaction on the primary (cart updates, checkout) and under
+use_primary(), e.g. to fill caches that outlive the lag.
+
+Read-your-writes: ReplicaStickinessMiddleware pins the reads of a request
+to the primary when the client wrote less than REPLICA_STICKY_SECONDS ago
+(cookie set on the response of a request that wrote).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'db_primary_until'
+CATALOG_MODELS = {'store.product'}
+
+_primary = ContextVar('db_primary', default=False)
+_replica = ContextVar('db_replica', default=False)
+# Models written by the current request, None outside requests
+_writes = ContextVar('db_writes', default=None)
+
+
+@contextmanager
+def use_primary():
+    """Reads of the block go to the primary"""
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    """Reads of every model in the block go to the replica, unless pinned to the primary"""
+    token = _replica.set(True)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+@contextmanager
+def request_routing(primary):
+    """Routing of one request, yields the set of the models it writes"""
+    writes = set()
+    tokens = _primary.set(primary), _writes.set(writes)
+    try:
+        yield writes
+    finally:
+        _writes.reset(tokens[1])
+        _primary.reset(tokens[0])
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # A transaction must read what it writes
+        if _primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if _replica.get() or model._meta.label_lower in CATALOG_MODELS:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        writes = _writes.get()
+        if writes is not None:
+            writes.add(model._meta.label_lower)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        return True
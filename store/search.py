@@ -0,0 +1,124 @@
+"""Ranked full-text product search.
+
+SQLite uses an FTS5 table (store_product_fts) kept in sync from the
+Product signals; PostgreSQL uses tsvector and pg_trgm GIN indexes that
+the database maintains itself. Both are created by migration
+0005_product_search. Other backends fall back to icontains.
+"""
+import logging
+import re
+
+from django.db import connection, connections, router
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'store_product_fts'
+MAX_RESULTS = 1000
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Must stay identical to the indexed expression of migration 0005
+PG_DOCUMENT = "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, ''))"
+
+
+def tokenize(query):
+    return _TOKEN_RE.findall(query.lower())[:10]
+
+
+_fts_tables = {}
+
+
+def _fts_available(connection=connection):
+    if connection.vendor != 'sqlite':
+        return False
+    # Looked up once per database file, the table only appears via migrations
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[name]
+
+
+def reset_fts_cache():
+    """Forget the FTS lookups, once migrations may have created the table"""
+    _fts_tables.clear()
+
+
+def _sqlite_search(connection, tokens, limit):
+    # Every token must match, the last one as a prefix for typeahead
+    terms = [f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s",
+            [' '.join(terms), limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _postgresql_search(connection, query, tokens, limit):
+    tsquery = ' & '.join(f'{token}:*' for token in tokens)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id FROM store_product "
+            f"WHERE {PG_DOCUMENT} @@ to_tsquery('simple', %s) OR name %% %s "
+            f"ORDER BY ts_rank({PG_DOCUMENT}, to_tsquery('simple', %s)) + similarity(name, %s) DESC, id "
+            f"LIMIT %s",
+            [tsquery, query, tsquery, query, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_ids(query, limit=MAX_RESULTS):
+    """Product ids matching the query, best match first"""
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    # The replica when one is configured (store.routers)
+    database = connections[router.db_for_read(Product)]
+    if database.vendor == 'postgresql':
+        return _postgresql_search(database, query.strip(), tokens, limit)
+    if _fts_available(database):
+        return _sqlite_search(database, tokens, limit)
+
+    products = Product.objects.all()
+    for token in tokens:
+        products = products.filter(name__icontains=token) | products.filter(description__icontains=token)
+    return list(products.order_by('name', 'id').values_list('id', flat=True)[:limit])
+
+
+def search_products(query, limit=10):
+    """Ranked products matching the query"""
+    ids = search_ids(query, limit)
+    products = Product.objects.in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
+
+
+def index_product(product):
+    """Refresh the FTS row of a product (no-op where the database maintains the index)"""
+    if not _fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)",
+            [product.pk, product.name, product.description],
+        )
+
+
+def index_products(products):
+    """Index many products at once, for bulk_create callers that bypass the signals"""
+    if not _fts_available():
+        return
+    rows = [(product.pk, product.name, product.description) for product in products]
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk, _, _ in rows])
+        cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)", rows)
+
+
+def unindex_product(product_id):
+    if not _fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product_id])
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .metrics import ORDERS
+from .models import Order, OrderItem, Product
+from .search import index_product, reset_fts_cache, unindex_product
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def update_order_totals(sender, instance, **kwargs):
+    """Keep the denormalized Order totals in sync with single-row item writes"""
+    if instance.order_id is None:
+        return
+    # Deleted lines come from a query without their order: updated by id, not fetched
+    order = instance.order if OrderItem.order.is_cached(instance) else Order(pk=instance.order_id)
+    order.recompute_totals()
+
+
+@receiver(post_save, sender=Product)
+def update_open_order_totals(sender, instance, created, update_fields=None, **kwargs):
+    """Refresh the stored totals of the open carts holding a product whose price or type changed
+
+    Run once the product write commits, so the carts are priced from the saved row.
+    """
+    if created or (update_fields and not {'price', 'digital'} & set(update_fields)):
+        return
+    product_id = instance.pk
+
+    def recompute():
+        for order in Order.objects.filter(complete=False, orderitem__product_id=product_id).distinct():
+            order.recompute_totals()
+
+    transaction.on_commit(recompute)
+
+
+@receiver(post_save, sender=Order)
+def count_orders(sender, instance, created, update_fields=None, **kwargs):
+    """Count opened carts and completed orders for the store_orders_total metric
+
+    Checkouts save with update_fields=['transaction_id', 'complete']; a full
+    save() of an already completed order (admin edits) is not a completion.
+    """
+    if created:
+        ORDERS.labels('created').inc()
+    if instance.complete and (created or (update_fields and 'complete' in update_fields)):
+        ORDERS.labels('completed').inc()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog(sender, instance, **kwargs):
+    """Bump the catalog version so cached product lists and grids are rebuilt
+
+    Bumped once the write commits: a bump before it would let a concurrent
+    request cache the old rows under the new version.
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, **kwargs):
+    index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_product(instance.pk)
+
+
+@receiver(post_migrate)
+def refresh_search_backend(sender, **kwargs):
+    reset_fts_cache()
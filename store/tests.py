@@ -1,8 +1,38 @@
-from django.test import TestCase, Client
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.db.utils import ConnectionHandler
+from django.test import TestCase, TransactionTestCase, AsyncClient, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.http import HttpResponse
+from django.urls import resolve, reverse
+from django.utils import timezone
+import datetime
+from io import StringIO
 import json
-from .models import Customer, Product, Order, OrderItem, ShippingAddress
+import logging
+import os
+import re
+import runpy
+import socket
+import tempfile
+import threading
+from unittest import mock
+from . import async_views, views
+from .models import Customer, Product, Order, OrderItem, ShippingAddress, Job, IdempotencyKey
+from .log import JsonFormatter, LogstashHandler, bind_request, request_context, unbind_request
+from .middleware import QueryBudgetExceeded, QueryProfilerMiddleware, fingerprint
+from .metrics import REGISTRY
+from .jobs import claim_jobs, enqueue, job, requeue_dead, run_batch
+from .routers import REPLICA, STICKY_COOKIE, replica_reads, use_primary
+from .search import _fts_available, reset_fts_cache, search_products
+from .catalog import catalog_cache_stats, get_first_page, get_product_grid, reset_catalog_cache_stats
+from .urls import routes
+from .utils import cartData, cookieCart, decodeCartCookie, encodeCartCookie, guestOrder, updateCartLine
 
 
 class ProductModelTest(TestCase):
@@ -199,8 +229,14 @@ class OrderItemModelTest(TestCase):
     
     def test_get_total_single_item(self):
         """Test order item total for single quantity"""
+        # A product appears at most once per order
+        other_product = Product.objects.create(
+            name="Other Product",
+            price=20.00,
+            digital=False
+        )
         single_item = OrderItem.objects.create(
-            product=self.product,
+            product=other_product,
             order=self.order,
             quantity=1
         )
@@ -422,6 +458,22 @@ class UpdateItemViewTest(TestCase):
             content_type='application/json'
         )
         self.assertEqual(response.status_code, 302)  # Redirect to login
+    
+    def test_update_item_maintains_order_totals(self):
+        """Test updateItem keeps the stored order totals current"""
+        for _ in range(2):
+            self.client.post(
+                reverse('update_item'),
+                data=json.dumps({
+                    'productId': self.product.id,
+                    'action': 'add'
+                }),
+                content_type='application/json'
+            )
+        order = Order.objects.get(customer=self.customer, complete=False)
+        self.assertEqual(order.item_count, 2)
+        self.assertAlmostEqual(order.total, 59.98)
+        self.assertTrue(order.requires_shipping)
 
 
 class LoginViewTest(TestCase):
@@ -487,3 +539,1573 @@ class LoginViewTest(TestCase):
         response = self.client.get(reverse('login'))
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, reverse('store'))
+
+
+class CookieCartTest(TestCase):
+    """Tests for guest cart resolution from the cart cookie"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=10.00, digital=(i % 2 == 0))
+            for i in range(40)
+        ]
+
+    def make_request(self, cart):
+        request = self.factory.get('/')
+        request.COOKIES['cart'] = cart if isinstance(cart, str) else json.dumps(cart)
+        return request
+
+    def test_resolves_items_and_totals(self):
+        """Test cookie cart returns the expected structure"""
+        cart = {str(self.products[0].id): {'quantity': 2}, str(self.products[1].id): {'quantity': 1}}
+        data = cookieCart(self.make_request(cart))
+        self.assertEqual(data['cartItems'], 3)
+        self.assertEqual(data['order']['get_cart_total'], 30.00)
+        self.assertTrue(data['order']['shipping'])
+        self.assertEqual([item['id'] for item in data['items']], [self.products[0].id, self.products[1].id])
+        self.assertEqual(data['items'][0]['product']['name'], "Product 0")
+        self.assertEqual(data['items'][0]['get_total'], 20.00)
+
+    def test_skips_invalid_and_unknown_entries(self):
+        """Test malformed IDs, bad quantities and missing products are ignored"""
+        cart = {
+            'abc': {'quantity': 1},
+            '99999': {'quantity': 1},
+            str(self.products[0].id): {'quantity': 'x'},
+            str(self.products[1].id): {'quantity': 0},
+            str(self.products[2].id): {'quantity': 4},
+        }
+        data = cookieCart(self.make_request(cart))
+        self.assertEqual(data['cartItems'], 4)
+        self.assertEqual(len(data['items']), 1)
+
+    def test_invalid_cookie_returns_empty_cart(self):
+        """Test an unparsable cookie yields an empty cart"""
+        for raw in ['not json', '[1, 2]']:
+            data = cookieCart(self.make_request(raw))
+            self.assertEqual(data['cartItems'], 0)
+            self.assertEqual(data['items'], [])
+
+    def test_query_count_constant_in_cart_size(self):
+        """Test resolving the cart costs one query regardless of its size"""
+        for size in [1, 10, 40]:
+            cart = {str(p.id): {'quantity': 1} for p in self.products[:size]}
+            request = self.make_request(cart)
+            with self.assertNumQueries(1):
+                data = cookieCart(request)
+            self.assertEqual(len(data['items']), size)
+
+    def test_empty_cart_runs_no_queries(self):
+        """Test an empty cart does not touch the database"""
+        with self.assertNumQueries(0):
+            data = cookieCart(self.make_request({}))
+        self.assertEqual(data['cartItems'], 0)
+
+
+class OrderTotalsTest(TestCase):
+    """Tests for the denormalized totals stored on Order"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Test Customer', email='test@example.com')
+        self.physical = Product.objects.create(name="Physical Product", price=25.00, digital=False)
+        self.digital = Product.objects.create(name="Digital Product", price=15.00, digital=True)
+        self.order = Order.objects.create(customer=self.customer, complete=False)
+
+    def test_totals_persisted_on_item_write(self):
+        """Test item saves and deletes keep the stored totals in sync"""
+        item = OrderItem.objects.create(product=self.physical, order=self.order, quantity=2)
+        OrderItem.objects.create(product=self.digital, order=self.order, quantity=1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, 65.00)
+        self.assertEqual(self.order.item_count, 3)
+        self.assertTrue(self.order.requires_shipping)
+
+        item.delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, 15.00)
+        self.assertEqual(self.order.item_count, 1)
+        self.assertFalse(self.order.requires_shipping)
+
+    def test_recompute_totals_after_bulk_write(self):
+        """Test recompute_totals repairs totals after writes that bypass signals"""
+        OrderItem.objects.bulk_create([
+            OrderItem(product=self.physical, order=self.order, quantity=4),
+            OrderItem(product=self.digital, order=self.order, quantity=2),
+        ])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, 0)
+
+        self.order.recompute_totals()
+        self.assertEqual(self.order.get_cart_total, 130.00)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.get_cart_total, 130.00)
+        self.assertEqual(self.order.get_cart_items, 6)
+        self.assertTrue(self.order.shipping)
+
+    def test_totals_follow_product_changes(self):
+        """Test a price or type change reprices open carts once committed, not completed orders"""
+        OrderItem.objects.create(product=self.physical, order=self.order, quantity=2)
+        completed = Order.objects.create(customer=self.customer, complete=True)
+        OrderItem.objects.create(product=self.physical, order=completed, quantity=1)
+
+        self.physical.price = 99.00
+        self.physical.digital = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.physical.save()
+            self.order.refresh_from_db()
+            self.assertEqual(self.order.total, 50.00)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, 198.00)
+        self.assertFalse(self.order.requires_shipping)
+        completed.refresh_from_db()
+        self.assertEqual(completed.total, 25.00)
+
+    def test_properties_read_stored_values(self):
+        """Test the cart properties do not query the order lines"""
+        OrderItem.objects.create(product=self.physical, order=self.order, quantity=1)
+        order = Order.objects.get(pk=self.order.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(order.get_cart_total, 25.00)
+            self.assertEqual(order.get_cart_items, 1)
+            self.assertTrue(order.shipping)
+
+
+class AuthenticatedCartQueryTest(TestCase):
+    """Tests for the query cost of authenticated carts"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.customer = Customer.objects.create(user=self.user, name='Test Customer', email='test@example.com')
+        self.order = Order.objects.create(customer=self.customer, complete=False)
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=5.00, digital=False)
+            for i in range(20)
+        ]
+        self.client.login(username='testuser', password='testpass123')
+
+    def fill_cart(self, size):
+        self.order.orderitem_set.all().delete()
+        for product in self.products[:size]:
+            OrderItem.objects.create(product=product, order=self.order, quantity=2)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_cart_data_lines_have_products_loaded(self):
+        """Test cartData returns lines with product and totals preloaded"""
+        self.fill_cart(3)
+        request = RequestFactory().get('/')
+        request.user = self.user
+        data = cartData(request)
+        with self.assertNumQueries(0):
+            self.assertEqual(data['cartItems'], 6)
+            self.assertEqual(data['order'].get_cart_total, 30.00)
+            self.assertEqual([item.get_total for item in data['items']], [10.00] * 3)
+            self.assertEqual([item.product.name for item in data['items']], ["Product 0", "Product 1", "Product 2"])
+
+    def test_cart_pages_query_count_constant(self):
+        """Test cart and checkout render with O(1) queries in the number of lines"""
+        for url in [reverse('cart'), reverse('checkout')]:
+            self.fill_cart(1)
+            small = self.count_queries(url)
+            self.fill_cart(20)
+            large = self.count_queries(url)
+            self.assertEqual(small, large, url)
+
+
+class CatalogCacheTest(TestCase):
+    """Tests for the versioned product catalog cache"""
+
+    def setUp(self):
+        cache.clear()
+        reset_catalog_cache_stats()
+        self.product = Product.objects.create(name="Cached Product", price=12.00, digital=False)
+
+    def names(self):
+        return [p.name for p in get_first_page()['products']]
+
+    def test_second_read_served_from_cache(self):
+        """Test the first page is only queried once while unchanged"""
+        self.assertEqual(self.names(), ["Cached Product"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ["Cached Product"])
+        self.assertEqual(catalog_cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_product_save_invalidates(self):
+        """Test saving a product bumps the version once committed and rebuilds the grid"""
+        self.assertIn("Cached Product", get_product_grid())
+        self.product.name = "Renamed Product"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+            # Not bumped before the commit, the grid cannot be rebuilt from uncommitted rows
+            self.assertIn("Cached Product", get_product_grid())
+        grid = get_product_grid()
+        self.assertIn("Renamed Product", grid)
+        self.assertNotIn("Cached Product", grid)
+
+    def test_product_delete_invalidates(self):
+        """Test deleting a product removes it from the cached first page and grid"""
+        self.assertIn("Cached Product", get_product_grid())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self.names(), [])
+        self.assertNotIn("Cached Product", get_product_grid())
+
+    def test_timeouts_short_with_process_local_cache(self):
+        """Test entries expire quickly when other workers cannot see the version bumps"""
+        def load(**env):
+            with mock.patch.dict(os.environ, env):
+                loaded = runpy.run_path(os.path.join(settings.BASE_DIR, 'ecommerce', 'settings.py'))
+            return loaded['CATALOG_CACHE_TIMEOUT'], loaded['CART_CACHE_TIMEOUT']
+
+        self.assertEqual(load(CACHE_BACKEND='django.core.cache.backends.locmem.LocMemCache'), (60, 60))
+        self.assertEqual(load(CACHE_BACKEND='django.core.cache.backends.redis.RedisCache'), (86400, 3600))
+
+    def test_store_view_uses_cached_grid(self):
+        """Test a warm store page does not query the product table"""
+        self.client.get(reverse('store'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('store'))
+        self.assertContains(response, "Cached Product")
+        self.assertFalse([q for q in queries if 'store_product' in q['sql']])
+
+
+class ProductListApiTest(TestCase):
+    """Tests for the paginated product listing API"""
+
+    def setUp(self):
+        self.client = Client()
+        for i in range(7):
+            Product.objects.create(name=f"Item {chr(ord('A') + i)}", price=10.00 * (i % 3 + 1), digital=(i % 2 == 0))
+
+    def fetch_all(self, **params):
+        names, cursor = [], None
+        while True:
+            query = dict(params, limit=3)
+            if cursor:
+                query['cursor'] = cursor
+            response = self.client.get(reverse('product_list'), query)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            self.assertLessEqual(len(data['products']), 3)
+            names += [product['name'] for product in data['products']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return names
+
+    def test_pages_cover_catalog_without_duplicates(self):
+        """Test walking the cursors returns every product exactly once"""
+        names = self.fetch_all()
+        self.assertEqual(names, [f"Item {c}" for c in "ABCDEFG"])
+
+    def test_sort_by_price_with_ties(self):
+        """Test price sorting is stable across pages for equal prices"""
+        products = Product.objects.order_by('-price', '-id')
+        self.assertEqual(self.fetch_all(sort='price-desc'), [p.name for p in products])
+        self.assertEqual(self.fetch_all(sort='name-desc'), [f"Item {c}" for c in "GFEDCBA"])
+
+    def test_filters(self):
+        """Test type and price range filters"""
+        self.assertEqual(self.fetch_all(type='digital'), ["Item A", "Item C", "Item E", "Item G"])
+        self.assertEqual(self.fetch_all(type='physical', min_price=15, max_price=25), ["Item B"])
+        self.assertEqual(self.fetch_all(q='item g'), ["Item G"])
+
+    def test_invalid_parameters(self):
+        """Test invalid sort, price and cursor values are rejected"""
+        for params in [{'sort': 'random'}, {'min_price': 'abc'}, {'type': 'other'}, {'cursor': 'forged'}]:
+            response = self.client.get(reverse('product_list'), params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_cursor_bound_to_sort(self):
+        """Test a cursor cannot be replayed with another sort order"""
+        data = json.loads(self.client.get(reverse('product_list'), {'limit': 2}).content)
+        response = self.client.get(reverse('product_list'), {'cursor': data['next_cursor'], 'sort': 'name-asc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_store_page_renders_first_page_only(self):
+        """Test the store page ships one page of cards and a cursor for the rest"""
+        cache.clear()
+        for i in range(30):
+            Product.objects.create(name=f"Extra {i}", price=5.00)
+        response = self.client.get(reverse('store'))
+        self.assertEqual(response.content.decode().count('class="product-card"'), 24)
+        self.assertTrue(response.context['next_cursor'])
+
+
+class ProductSearchTest(TestCase):
+    """Tests for the indexed full-text product search"""
+
+    def setUp(self):
+        self.keyboard = Product.objects.create(
+            name="Magic Keyboard", price=99.99,
+            description="Clavier sans fil rechargeable, compatible Mac et iPad.")
+        self.ipad = Product.objects.create(
+            name="iPad Air", price=699.99,
+            description="Tablette polyvalente avec puce M2.")
+        self.course = Product.objects.create(
+            name="Formation Python", price=89.99, digital=True,
+            description="Cours vidéo complet : bases, POO, Django.")
+
+    def names(self, query):
+        return [product.name for product in search_products(query)]
+
+    def test_name_match_ranked_first(self):
+        """Test a name match outranks a description match"""
+        self.assertEqual(self.names("ipad"), ["iPad Air", "Magic Keyboard"])
+
+    def test_prefix_matching_for_typeahead(self):
+        """Test the last token matches as a prefix"""
+        self.assertEqual(self.names("pyth"), ["Formation Python"])
+        self.assertEqual(self.names("magic key"), ["Magic Keyboard"])
+        self.assertEqual(self.names("video"), ["Formation Python"])
+
+    def test_index_follows_product_changes(self):
+        """Test saves and deletes update the index incrementally"""
+        self.keyboard.name = "Wireless Keyboard"
+        self.keyboard.save()
+        self.assertEqual(self.names("wireless"), ["Wireless Keyboard"])
+        self.assertEqual(self.names("magic"), [])
+
+        self.course.delete()
+        self.assertEqual(self.names("python"), [])
+
+    def test_search_endpoint(self):
+        """Test the typeahead endpoint returns ranked JSON results"""
+        response = self.client.get(reverse('search_products'), {'q': 'tablette'})
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)['results']
+        self.assertEqual([r['name'] for r in results], ["iPad Air"])
+
+        response = self.client.get(reverse('search_products'), {'q': '  '})
+        self.assertEqual(json.loads(response.content)['results'], [])
+
+    def test_listing_api_uses_search(self):
+        """Test the listing API filters through the search index"""
+        response = self.client.get(reverse('product_list'), {'q': 'rechargeable'})
+        names = [p['name'] for p in json.loads(response.content)['products']]
+        self.assertEqual(names, ["Magic Keyboard"])
+
+    def test_listing_api_keeps_ranking(self):
+        """Test search results are listed by relevance across pages, or by the sort asked for"""
+        names, cursor = [], None
+        while True:
+            params = {'q': 'ipad', 'limit': 1, **({'cursor': cursor} if cursor else {})}
+            data = json.loads(self.client.get(reverse('product_list'), params).content)
+            names += [p['name'] for p in data['products']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(names, ["iPad Air", "Magic Keyboard"])
+
+        response = self.client.get(reverse('product_list'), {'q': 'ipad', 'sort': 'price-asc'})
+        self.assertEqual([p['name'] for p in json.loads(response.content)['products']], ["Magic Keyboard", "iPad Air"])
+        response = self.client.get(reverse('product_list'), {'sort': 'relevance'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_fts_lookup_cached(self):
+        """Test the FTS table lookup runs once per database, whether the table exists or not"""
+        database = mock.Mock(vendor='sqlite', settings_dict={'NAME': 'no-fts.sqlite3'})
+        database.introspection.table_names.return_value = []
+        self.addCleanup(reset_fts_cache)
+        self.assertFalse(_fts_available(database))
+        self.assertFalse(_fts_available(database))
+        database.introspection.table_names.assert_called_once()
+
+
+class CartConstraintTest(TestCase):
+    """Tests for the open-order and order-line uniqueness constraints"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Test Customer', email='test@example.com')
+        self.product = Product.objects.create(name="Test Product", price=10.00)
+
+    def test_one_open_order_per_customer(self):
+        """Test a second open order for the same customer is rejected"""
+        Order.objects.create(customer=self.customer, complete=False)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(customer=self.customer, complete=False)
+        # Completed orders are not limited
+        Order.objects.create(customer=self.customer, complete=True)
+        Order.objects.create(customer=self.customer, complete=True)
+        self.assertEqual(Order.objects.filter(customer=self.customer).count(), 3)
+
+    def test_one_line_per_product(self):
+        """Test a product cannot appear twice in the same order"""
+        order = Order.objects.create(customer=self.customer, complete=False)
+        OrderItem.objects.create(order=order, product=self.product, quantity=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OrderItem.objects.create(order=order, product=self.product, quantity=1)
+
+    def test_guest_checkout_reuses_open_order(self):
+        """Test a returning guest's open order is reused instead of duplicated"""
+        Customer.objects.filter(pk=self.customer.pk).update(email='guest@example.com')
+        stale = Order.objects.create(customer=self.customer, complete=False)
+        OrderItem.objects.create(order=stale, product=self.product, quantity=5)
+
+        request = RequestFactory().post('/')
+        request.COOKIES['cart'] = json.dumps({str(self.product.id): {'quantity': 2}})
+        customer, order = guestOrder(request, {'form': {'name': 'Guest', 'email': 'guest@example.com'}})
+
+        self.assertEqual(order.pk, stale.pk)
+        self.assertEqual(list(order.orderitem_set.values_list('quantity', flat=True)), [2])
+        self.assertEqual(order.get_cart_items, 2)
+
+
+class UpdateCartLineTest(TestCase):
+    """Tests for atomic, clamped cart line updates"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Test Customer', email='test@example.com')
+        self.product = Product.objects.create(name="Test Product", price=10.00)
+        self.order = Order.objects.create(customer=self.customer, complete=False)
+
+    def test_returns_quantity_and_totals(self):
+        """Test the new quantity and cart totals are returned"""
+        updateCartLine(self.order, self.product.id, 1)
+        line = updateCartLine(self.order, self.product.id, 2)
+        self.assertEqual(line, {'quantity': 3, 'cartItems': 3, 'cartTotal': 30.00, 'shipping': True})
+
+    def test_quantity_clamped(self):
+        """Test quantities are clamped to 0..100 and empty lines deleted"""
+        self.assertEqual(updateCartLine(self.order, self.product.id, 150)['quantity'], 100)
+        self.assertEqual(updateCartLine(self.order, self.product.id, 1)['quantity'], 100)
+        line = updateCartLine(self.order, self.product.id, -250)
+        self.assertEqual(line['quantity'], 0)
+        self.assertEqual(line['cartItems'], 0)
+        self.assertFalse(OrderItem.objects.filter(order=self.order).exists())
+
+    def test_stale_reader_cannot_lose_update(self):
+        """Test a change computed from a stale read is not overwritten"""
+        updateCartLine(self.order, self.product.id, 1)
+        stale = OrderItem.objects.get(order=self.order)
+        updateCartLine(self.order, self.product.id, 1)
+        updateCartLine(self.order, self.product.id, 1)
+        stale.refresh_from_db()
+        self.assertEqual(stale.quantity, 3)
+
+    def test_existing_line_update_query_count(self):
+        """Test updating an existing line is one UPDATE plus the totals refresh"""
+        updateCartLine(self.order, self.product.id, 1)
+        with CaptureQueriesContext(connection) as queries:
+            updateCartLine(self.order, self.product.id, 1)
+        statements = [q['sql'] for q in queries if 'SAVEPOINT' not in q['sql']]
+        # UPDATE line, aggregate totals, UPDATE order
+        self.assertEqual(len(statements), 3)
+        self.assertFalse([sql for sql in statements if 'FROM "store_product" WHERE' in sql])
+
+    def test_unknown_product(self):
+        """Test adding an unknown product raises DoesNotExist"""
+        with self.assertRaises(Product.DoesNotExist):
+            updateCartLine(self.order, 99999, 1)
+
+
+class UpdateItemConcurrencyTest(TransactionTestCase):
+    """Stress test: concurrent clients adding to the same cart line
+
+    Each thread opens its own connection to the test database, a file under
+    SQLite (see settings), which then waits for the write lock as the
+    production profile does.
+    """
+
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            # Connections opened by the threads get the production lock handling
+            options = connections.settings[DEFAULT_DB_ALIAS].setdefault('OPTIONS', {})
+            patcher = mock.patch.dict(options, {key: settings.SQLITE_TUNING['OPTIONS'][key] for key in ('timeout', 'transaction_mode')})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_no_lost_updates(self):
+        user = User.objects.create_user(username='stress', password='testpass123')
+        Customer.objects.create(user=user, name='Stress', email='stress@example.com')
+        product = Product.objects.create(name="Stress Product", price=1.00)
+        statuses = []
+
+        def click(clicks):
+            client = Client()
+            client.force_login(user)
+            try:
+                for _ in range(clicks):
+                    response = client.post(reverse('update_item'),
+                                           data=json.dumps({'productId': product.id, 'action': 'add'}),
+                                           content_type='application/json')
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=click, args=(10,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [200] * 80)
+        order = Order.objects.get(customer__user=user, complete=False)
+        self.assertEqual(OrderItem.objects.get(order=order).quantity, 80)
+        self.assertEqual(order.item_count, 80)
+
+
+class UpdateCartViewTest(TestCase):
+    """Tests for the batch cart mutation endpoint"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.customer = Customer.objects.create(user=self.user, name='Test Customer', email='test@example.com')
+        self.products = [
+            Product.objects.create(name=f"Product {i}", price=10.00 * (i + 1), digital=i > 0)
+            for i in range(3)
+        ]
+        self.client.login(username='testuser', password='testpass123')
+
+    def post(self, operations):
+        return self.client.post(
+            reverse('update_cart'),
+            data=json.dumps({'operations': operations}),
+            content_type='application/json'
+        )
+
+    def test_batch_returns_updated_cart(self):
+        """Test a batch is applied and the whole cart is returned"""
+        a, b, c = self.products
+        self.post([{'productId': a.id, 'delta': 2}, {'productId': c.id, 'delta': 1}])
+        response = self.post([
+            {'productId': a.id, 'delta': 1},
+            {'productId': b.id, 'delta': 1},
+            {'productId': b.id, 'delta': 1},
+            {'productId': c.id, 'delta': -1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['cartItems'], 5)
+        self.assertAlmostEqual(data['cartTotal'], 70.00)
+        self.assertTrue(data['shipping'])
+        self.assertEqual(
+            [(item['productId'], item['quantity']) for item in data['items']],
+            [(a.id, 3), (b.id, 2)],
+        )
+        order = Order.objects.get(customer=self.customer, complete=False)
+        self.assertEqual(order.get_cart_items, 5)
+
+    def test_query_count_independent_of_batch_size(self):
+        """Test the number of queries does not grow with the batch"""
+        def count(operations):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post(operations).status_code, 200)
+            return len([q for q in queries if 'SAVEPOINT' not in q['sql']])
+
+        single = count([{'productId': self.products[0].id, 'delta': 1}])
+        batch = count([{'productId': product.id, 'delta': 2} for product in self.products])
+        self.assertEqual(single, batch)
+
+    def test_unknown_product_rolls_back_batch(self):
+        """Test an unknown product rejects the whole batch"""
+        response = self.post([{'productId': self.products[0].id, 'delta': 1}, {'productId': 99999, 'delta': 1}])
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_invalid_operations(self):
+        """Test malformed batches are rejected"""
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([{'productId': 'x', 'delta': 1}]).status_code, 400)
+        self.assertEqual(self.post([{'productId': self.products[0].id, 'delta': 1000}]).status_code, 400)
+        self.assertEqual(self.post([{'productId': 1, 'delta': 1}] * 51).status_code, 400)
+
+    def test_guest_cart_stored_in_signed_cookie(self):
+        """Test a guest batch updates the signed cart cookie instead of an order"""
+        self.client.logout()
+        a, b, c = self.products
+        self.post([{'productId': a.id, 'delta': 2}, {'productId': b.id, 'delta': 1}])
+        response = self.post([{'productId': a.id, 'delta': 1}, {'productId': b.id, 'delta': -1}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item['productId'], item['quantity']) for item in response.json()['items']], [(a.id, 3)])
+        cookie = response.cookies['cart']
+        self.assertTrue(cookie['httponly'])
+        self.assertEqual(decodeCartCookie(cookie.value), {a.id: 3})
+        self.assertFalse(Order.objects.exists())
+
+        response = self.post([{'productId': a.id, 'delta': -3}])
+        self.assertEqual(response.json()['cartItems'], 0)
+        self.assertEqual(response.cookies['cart'].value, '')
+
+    def test_guest_posts_with_rendered_csrf_token(self):
+        """Test the token rendered in the page passes the CSRF check of /update_cart/"""
+        client = Client(enforce_csrf_checks=True)
+        body = json.dumps({'operations': [{'productId': self.products[0].id, 'delta': 1}]})
+        page = client.get(reverse('store'))
+        self.assertIn('csrftoken', page.cookies)
+        self.assertEqual(client.post(reverse('update_cart'), body, content_type='application/json').status_code, 403)
+
+        token = re.search(r"var csrftoken = '([^']+)'", page.content.decode()).group(1)
+        response = client.post(reverse('update_cart'), body, content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['cartItems'], 1)
+
+
+class GuestOrderTest(TestCase):
+    """Tests for the bulk guest checkout pipeline"""
+
+    def setUp(self):
+        self.products = [Product.objects.create(name=f"Product {i}", price=1.00 + i) for i in range(100)]
+        self.form = {'form': {'name': 'Guest', 'email': 'guest@example.com'}}
+
+    def checkout(self, products):
+        request = RequestFactory().post('/')
+        request.COOKIES['cart'] = json.dumps({str(product.id): {'quantity': 2} for product in products})
+        return guestOrder(request, self.form)
+
+    def test_query_count_independent_of_cart_size(self):
+        """Test guest checkout runs the same queries for 1, 10 and 100 lines"""
+        counts = []
+        for size in (1, 10, 100):
+            Customer.objects.all().delete()
+            with CaptureQueriesContext(connection) as queries:
+                customer, order = self.checkout(self.products[:size])
+            counts.append(len([q for q in queries if 'SAVEPOINT' not in q['sql']]))
+            self.assertEqual(order.orderitem_set.count(), size)
+            self.assertEqual(order.get_cart_items, 2 * size)
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(counts[0], counts[2])
+
+    def test_empty_cart_writes_nothing(self):
+        """Test an empty cart is rejected before any customer or order is written"""
+        request = RequestFactory().post('/')
+        request.COOKIES['cart'] = json.dumps({'99999': {'quantity': 1}})
+        with self.assertRaises(ValidationError):
+            guestOrder(request, self.form)
+        self.assertFalse(Customer.objects.exists())
+        self.assertFalse(Order.objects.exists())
+
+    def test_returning_guest_name_updated(self):
+        """Test an existing guest customer is updated instead of duplicated"""
+        Customer.objects.create(name='Old Name', email='guest@example.com')
+        customer, order = self.checkout(self.products[:1])
+        self.assertEqual(customer.name, 'Guest')
+        self.assertEqual(Customer.objects.filter(email='guest@example.com').count(), 1)
+
+    def test_returning_guest_cart_replaces_previous_lines(self):
+        """Test a reused open order ends up with exactly the current cart"""
+        customer, order = self.checkout(self.products[:3])
+        customer, order = self.checkout(self.products[1:5])
+        self.assertEqual(
+            sorted(order.orderitem_set.values_list('product_id', 'quantity')),
+            [(product.id, 2) for product in self.products[1:5]],
+        )
+        self.assertEqual(order.get_cart_items, 8)
+
+
+class ProcessOrderTest(TestCase):
+    """Tests for the transactional, idempotent checkout"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.customer = Customer.objects.create(user=self.user, name='Test Customer', email='test@example.com')
+        self.product = Product.objects.create(name="Test Product", price=10.00, digital=False)
+        self.order = Order.objects.create(customer=self.customer, complete=False)
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2)
+        self.client.login(username='testuser', password='testpass123')
+        self.shipping = {'address': '1 rue de Paris', 'city': 'Paris', 'state': 'IDF', 'zipcode': '75001'}
+
+    def post(self, shipping, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            reverse('process_order'),
+            data=json.dumps({'form': {'total': 20.00}, 'shipping': shipping}),
+            content_type='application/json',
+            **headers
+        )
+
+    def test_checkout_completes_order_with_address(self):
+        """Test a valid checkout completes the order and stores the address"""
+        response = self.post(self.shipping)
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.complete)
+        self.assertEqual(self.order.transaction_id, response.json()['transaction_id'])
+        self.assertEqual(ShippingAddress.objects.get().order, self.order)
+
+    def test_invalid_address_leaves_order_open(self):
+        """Test a bad address rolls back the whole checkout"""
+        response = self.post(dict(self.shipping, city='  '))
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.complete)
+        self.assertIsNone(self.order.transaction_id)
+        self.assertFalse(ShippingAddress.objects.exists())
+
+    def test_retry_replays_stored_response(self):
+        """Test a retry with the same key returns the first result without checkout queries"""
+        first = self.post(self.shipping, key='checkout-key-1')
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.post(self.shipping, key='checkout-key-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse([q for q in queries if 'store_order' in q['sql']])
+        self.assertEqual(ShippingAddress.objects.count(), 1)
+
+    def test_key_reused_with_different_request(self):
+        """Test a key cannot be replayed for a different payload"""
+        self.post(self.shipping, key='checkout-key-2')
+        response = self.post(dict(self.shipping, city='Lyon'), key='checkout-key-2')
+        self.assertEqual(response.status_code, 422)
+
+    def test_failed_request_not_stored(self):
+        """Test a rejected request does not consume its key"""
+        self.assertEqual(self.post({}, key='checkout-key-3').status_code, 400)
+        self.assertEqual(self.post(self.shipping, key='checkout-key-3').status_code, 200)
+
+    def test_guest_retry_replays_cookies(self):
+        """Test a replayed guest checkout still deletes the guest cart cookie"""
+        self.client.logout()
+        self.client.cookies['cart'] = encodeCartCookie({self.product.id: 1})
+        payload = json.dumps({'form': {'name': 'Guest', 'email': 'guest@example.com', 'total': 10.00},
+                              'shipping': self.shipping})
+        responses = [
+            self.client.post(reverse('process_order'), data=payload, content_type='application/json',
+                             HTTP_IDEMPOTENCY_KEY='guest-checkout-key')
+            for _ in range(2)
+        ]
+        first, retry = responses
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        for response in responses:
+            self.assertEqual(response.cookies['cart'].value, '')
+            self.assertEqual(response.cookies['cart']['max-age'], 0)
+        self.assertEqual(Order.objects.filter(complete=True).count(), 1)
+
+    def test_expired_keys_pruned(self):
+        """Test keys older than IDEMPOTENCY_KEY_TTL are deleted, recent ones kept"""
+        for key in ('checkout-key-old', 'checkout-key-new'):
+            IdempotencyKey.objects.create(key=key, fingerprint='', status_code=200, content_type='application/json', response='{}')
+        IdempotencyKey.objects.filter(key='checkout-key-old').update(
+            created=timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL + 60))
+        call_command('prune_idempotency_keys', stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['checkout-key-new'])
+
+    def test_guest_cannot_take_over_account_cart(self):
+        """Test a guest checkout with an account's email leaves the account's customer and cart alone"""
+        self.client.logout()
+        other = Product.objects.create(name="Other Product", price=5.00, digital=True)
+        self.client.cookies['cart'] = encodeCartCookie({other.id: 1})
+        response = self.client.post(
+            reverse('process_order'),
+            data=json.dumps({'form': {'name': 'Guest', 'email': 'test@example.com', 'total': 5.00}}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.complete)
+        self.assertEqual(list(self.order.orderitem_set.values_list('product_id', 'quantity')), [(self.product.id, 2)])
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.name, 'Test Customer')
+        guest_order = Order.objects.get(transaction_id=response.json()['transaction_id'])
+        self.assertIsNone(guest_order.customer.user)
+        self.assertEqual(list(guest_order.orderitem_set.values_list('product_id', 'quantity')), [(other.id, 1)])
+
+    def test_guest_checkout_within_query_budget(self):
+        """Test guest checkouts sent with an Idempotency-Key stay within the process_order budget"""
+        self.client.logout()
+        other = Product.objects.create(name="Other Product", price=5.00, digital=True)
+        payload = json.dumps({'form': {'name': 'Guest', 'email': 'guest@example.com', 'total': 10.00},
+                              'shipping': self.shipping})
+        for key, previous_cart in [('guest-budget-new', None), ('guest-budget-returning', [other, self.product])]:
+            if previous_cart:
+                guest = Customer.objects.get(email='guest@example.com')
+                previous = Order.objects.create(customer=guest, complete=False)
+                for product in previous_cart:
+                    OrderItem.objects.create(order=previous, product=product, quantity=3)
+            self.client.cookies['cart'] = encodeCartCookie({self.product.id: 1})
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse('process_order'), data=payload, content_type='application/json',
+                                            HTTP_IDEMPOTENCY_KEY=key)
+            # Over budget fails the request under the test runner
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['success'], True)
+            counted = [q for q in queries if 'SAVEPOINT' not in q['sql']]
+            self.assertLessEqual(len(counted), settings.QUERY_BUDGETS['process_order']['queries'])
+
+    def test_guest_empty_cart_writes_nothing(self):
+        """Test a guest checkout with an empty cart creates no order"""
+        self.client.logout()
+        response = self.client.post(
+            reverse('process_order'),
+            data=json.dumps({'form': {'name': 'Guest', 'email': 'guest@example.com'}, 'shipping': {}}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Customer.objects.filter(email='guest@example.com').exists())
+
+
+@job('test_flaky')
+def flaky_job(fail=True):
+    if fail:
+        raise RuntimeError('downstream unavailable')
+
+
+class JobQueueTest(TestCase):
+    """Tests for the database-backed job queue"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Test Customer', email='test@example.com')
+        self.product = Product.objects.create(name="Test Product", price=10.00, digital=True)
+        self.order = Order.objects.create(customer=self.customer, complete=False)
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=1)
+
+    def test_checkout_enqueues_finalization(self):
+        """Test a completed checkout records a job processed by the worker"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        Customer.objects.filter(pk=self.customer.pk).update(user=user)
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.post(reverse('process_order'), data=json.dumps({'form': {}}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        queued = Job.objects.get()
+        self.assertEqual((queued.name, json.loads(queued.payload)), ('finalize_order', {'order_id': self.order.id}))
+        self.assertEqual(run_batch(), 1)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.DONE)
+
+    def test_failed_checkout_enqueues_nothing(self):
+        """Test a rolled back checkout leaves no job behind"""
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            enqueue('finalize_order', order_id=self.order.id)
+            raise RuntimeError
+        self.assertFalse(Job.objects.exists())
+
+    def test_retry_with_backoff_then_dead(self):
+        """Test a failing job is retried later and dead-lettered after its last attempt"""
+        queued = enqueue('test_flaky')
+        Job.objects.filter(pk=queued.pk).update(max_attempts=2)
+
+        self.assertEqual(run_batch(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.PENDING, 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('downstream unavailable', queued.last_error)
+        # Not due yet
+        self.assertEqual(run_batch(), 0)
+
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        run_batch()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.DEAD, 2))
+
+        self.assertEqual(requeue_dead(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.PENDING, 0))
+
+    def test_leased_jobs_not_claimed_twice(self):
+        """Test a job leased by one worker is only reclaimed after its lease expires"""
+        queued = enqueue('test_flaky', fail=False)
+        self.assertEqual(len(claim_jobs(10, worker='worker-a')), 1)
+        self.assertEqual(claim_jobs(10, worker='worker-b'), [])
+
+        Job.objects.filter(pk=queued.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual([j.locked_by for j in claim_jobs(10, worker='worker-b')], ['worker-b'])
+
+
+class CartCookieTest(TestCase):
+    """Tests for the signed compact cart cookie and the resolved cart cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.products = [Product.objects.create(name=f"Product {i}", price=10.00) for i in range(3)]
+
+    def make_request(self, raw):
+        request = self.factory.get('/')
+        request.COOKIES['cart'] = raw
+        return request
+
+    def test_round_trip(self):
+        """Test the compact format encodes and decodes ordered lines"""
+        lines = {self.products[2].id: 3, self.products[0].id: 1}
+        raw = encodeCartCookie(lines)
+        self.assertTrue(raw.startswith(f'c1.{self.products[2].id}-3.{self.products[0].id}-1:'))
+        self.assertEqual(list(decodeCartCookie(raw).items()), list(lines.items()))
+
+    def test_tampered_cookie_rejected(self):
+        """Test a cookie with a forged payload decodes to an empty cart"""
+        raw = encodeCartCookie({self.products[0].id: 1})
+        payload, signature = raw.rsplit(':', 1)
+        self.assertEqual(decodeCartCookie(payload.replace('-1', '-99') + ':' + signature), {})
+
+    def test_legacy_json_cookie_still_decodes(self):
+        """Test carts written by the previous JSON format are kept"""
+        raw = json.dumps({str(self.products[0].id): {'quantity': 2}})
+        self.assertEqual(decodeCartCookie(raw), {self.products[0].id: 2})
+
+    def test_unchanged_cart_served_from_cache(self):
+        """Test an unchanged cookie skips parsing and the database"""
+        raw = encodeCartCookie({self.products[0].id: 2})
+        self.assertEqual(cookieCart(self.make_request(raw))['cartItems'], 2)
+        with self.assertNumQueries(0):
+            data = cookieCart(self.make_request(raw))
+        self.assertEqual(data['order']['get_cart_total'], 20.00)
+
+    def test_catalog_change_invalidates_cached_cart(self):
+        """Test a price change is reflected in a cached cart"""
+        raw = encodeCartCookie({self.products[0].id: 2})
+        cookieCart(self.make_request(raw))
+        self.products[0].price = 15.00
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].save()
+        self.assertEqual(cookieCart(self.make_request(raw))['order']['get_cart_total'], 30.00)
+
+
+class CartMergeOnLoginTest(TestCase):
+    """Tests for moving the guest cart into the order on login"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.customer = Customer.objects.create(user=self.user, name='Test Customer', email='test@example.com')
+        self.products = [Product.objects.create(name=f"Product {i}", price=10.00) for i in range(20)]
+
+    def login(self, lines):
+        self.client.cookies['cart'] = encodeCartCookie(lines)
+        return self.client.post(reverse('login'), {'username': 'testuser', 'password': 'testpass123'})
+
+    def test_cookie_cart_merged_and_cleared(self):
+        """Test cookie quantities are added to the open order, clamped, and the cookie dropped"""
+        a, b = self.products[:2]
+        order = Order.objects.create(customer=self.customer, complete=False)
+        OrderItem.objects.create(order=order, product=a, quantity=95)
+
+        response = self.login({a.id: 10, b.id: 2})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies['cart'].value, '')
+        self.assertEqual(dict(order.orderitem_set.values_list('product_id', 'quantity')), {a.id: 100, b.id: 2})
+        order.refresh_from_db()
+        self.assertEqual(order.get_cart_items, 102)
+
+    def test_merge_query_count_independent_of_cart_size(self):
+        """Test the merge is a bulk upsert, not one query per line"""
+        def count(size):
+            OrderItem.objects.all().delete()
+            Order.objects.all().delete()
+            self.client.logout()
+            with CaptureQueriesContext(connection) as queries:
+                self.login({product.id: 1 for product in self.products[:size]})
+            self.assertEqual(OrderItem.objects.count(), size)
+            return len([q for q in queries if 'SAVEPOINT' not in q['sql']])
+
+        self.assertEqual(count(1), count(20))
+
+    def test_unknown_products_dropped(self):
+        """Test products deleted since they were added are not merged"""
+        self.login({self.products[0].id: 1, 99999: 1})
+        self.assertEqual(list(OrderItem.objects.values_list('product_id', flat=True)), [self.products[0].id])
+
+    def test_user_without_customer_keeps_cookie(self):
+        """Test the cookie cart stays when there is no order to merge into"""
+        User.objects.create_user(username='nocustomer', password='testpass123')
+        self.client.cookies['cart'] = encodeCartCookie({self.products[0].id: 1})
+        response = self.client.post(reverse('login'), {'username': 'nocustomer', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('cart', response.cookies)
+        self.assertFalse(Order.objects.exists())
+
+
+class QueryProfilerMiddlewareTest(TestCase):
+    """Tests for the per-request query profiler and its budgets"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.products = [Product.objects.create(name=f"Product {i}", price=10.00) for i in range(5)]
+
+    def profile(self, view, path='/cart/'):
+        def get_response(request):
+            request.resolver_match = resolve(path)
+            view()
+            return HttpResponse()
+        request = self.factory.get(path)
+        QueryProfilerMiddleware(get_response)(request)
+        return request.query_profile
+
+    def n_plus_one(self):
+        for product in self.products:
+            Product.objects.get(pk=product.pk)
+
+    def test_profile_fields_logged(self):
+        """Test query count, time and view name are logged as structured fields"""
+        with self.assertLogs('store.middleware', level='INFO') as logs:
+            fields = self.profile(lambda: list(Product.objects.all()))
+        self.assertEqual(fields['view'], 'cart')
+        self.assertEqual(fields['db_queries'], 1)
+        self.assertEqual(logs.records[0].db_queries, 1)
+        self.assertEqual(logs.records[0].view, 'cart')
+
+    def test_repeated_queries_fingerprinted(self):
+        """Test an N+1 loop shows up as one repeated fingerprint"""
+        with self.settings(QUERY_BUDGET_STRICT=False), self.assertLogs('store.middleware', level='WARNING'):
+            fields = self.profile(self.n_plus_one)
+        self.assertEqual(fields['db_duplicates'], 4)
+        self.assertEqual(fields['db_repeated'][0]['count'], 5)
+
+    def test_budget_fails_in_strict_mode(self):
+        """Test exceeding a view budget raises under the test runner"""
+        with self.assertRaises(QueryBudgetExceeded):
+            self.profile(self.n_plus_one)
+
+    def test_budget_warns_when_not_strict(self):
+        """Test exceeding a view budget only logs a warning in production"""
+        with self.settings(QUERY_BUDGET_STRICT=False, QUERY_BUDGETS={'cart': {'queries': 2}}):
+            with self.assertLogs('store.middleware', level='WARNING') as logs:
+                self.profile(lambda: [list(Product.objects.filter(pk=p.pk)) for p in self.products[:3]])
+        self.assertIn('queries=3 > 2', logs.output[-1])
+
+    def test_fingerprint_ignores_parameters(self):
+        """Test IN lists and literals do not change a fingerprint"""
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s) AND x = 1')[0],
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND x = 'a'")[0],
+        )
+
+
+class StructuredLoggingTest(TestCase):
+    """Tests for the JSON formatter and the Logstash handler"""
+
+    def make_record(self, **extra):
+        record = logging.LogRecord('store.views', logging.WARNING, __file__, 1, 'Cart %s', ('updated',), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_includes_request_context_and_extra_fields(self):
+        """Test records carry the request id, view and extra= fields"""
+        token = bind_request(request_id='abc123', view='cart')
+        try:
+            entry = json.loads(JsonFormatter().format(self.make_record(db_queries=4)))
+        finally:
+            unbind_request(token)
+        self.assertEqual(entry['message'], 'Cart updated')
+        self.assertEqual(entry['level'], 'WARNING')
+        self.assertEqual((entry['request_id'], entry['view'], entry['db_queries']), ('abc123', 'cart', 4))
+
+    def test_request_id_bound_by_middleware(self):
+        """Test records logged during a request carry its id"""
+        # Formatted while the request runs, like the real handlers do
+        lines = []
+        handler = logging.Handler()
+        handler.setFormatter(JsonFormatter())
+        handler.emit = lambda record: lines.append(handler.format(record))
+        with self.assertLogs('store.middleware', level='INFO'):
+            logging.getLogger('store.middleware').addHandler(handler)
+            response = self.client.get(reverse('cart'))
+        entry = json.loads(lines[-1])
+        self.assertEqual(response.wsgi_request.id, entry['request_id'])
+        self.assertEqual(entry['view'], 'cart')
+        self.assertIn('latency_ms', entry)
+
+    def test_ships_json_lines_to_logstash(self):
+        """Test queued records reach the TCP input as JSON lines"""
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        server.settimeout(5)
+        with tempfile.TemporaryDirectory() as logs:
+            handler = LogstashHandler('127.0.0.1', server.getsockname()[1], os.path.join(logs, 'app.log'),
+                                      flush_interval=0.05)
+            handler.setFormatter(JsonFormatter())
+            for _ in range(3):
+                handler.handle(self.make_record())
+            conn, _ = server.accept()
+            received = b''
+            while received.count(b'\n') < 3:
+                received += conn.recv(65536)
+            handler.close()
+            conn.close()
+        server.close()
+        lines = [json.loads(line) for line in received.decode().splitlines()]
+        self.assertEqual([line['message'] for line in lines], ['Cart updated'] * 3)
+
+    def test_falls_back_to_file_when_logstash_down(self):
+        """Test records go to the rotating file while Logstash is unreachable"""
+        unused = socket.socket()
+        unused.bind(('127.0.0.1', 0))
+        port = unused.getsockname()[1]
+        unused.close()
+        with tempfile.TemporaryDirectory() as logs:
+            path = os.path.join(logs, 'app.log')
+            handler = LogstashHandler('127.0.0.1', port, path, flush_interval=0.05, timeout=0.5)
+            handler.setFormatter(JsonFormatter())
+            handler.handle(self.make_record())
+            handler.close()
+            with open(path) as fallback:
+                self.assertEqual(json.loads(fallback.readline())['message'], 'Cart updated')
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test logging never waits on a saturated queue"""
+        with tempfile.TemporaryDirectory() as logs:
+            handler = LogstashHandler('127.0.0.1', 9, os.path.join(logs, 'app.log'), queue_size=1)
+            handler._ensure_sender()
+            handler._sender.stop()
+            handler.queue.put_nowait('{}')
+            handler.handle(self.make_record())
+            self.assertEqual(handler.dropped, 1)
+            handler.fallback.close()
+
+
+class RequestIdTest(TestCase):
+    """Tests for X-Request-ID correlation with nginx"""
+
+    def test_forwarded_request_id_kept(self):
+        """Test the id set by nginx is used and returned"""
+        response = self.client.get(reverse('cart'), HTTP_X_REQUEST_ID='3f2a9c0d5e6b7a8f')
+        self.assertEqual(response['X-Request-ID'], '3f2a9c0d5e6b7a8f')
+        self.assertEqual(response.wsgi_request.id, '3f2a9c0d5e6b7a8f')
+
+    def test_request_id_generated_when_missing_or_invalid(self):
+        """Test a fresh id replaces a missing or malformed header"""
+        for headers in ({}, {'HTTP_X_REQUEST_ID': 'bad id\nwith newline'}, {'HTTP_X_REQUEST_ID': 'x' * 65}):
+            response = self.client.get(reverse('cart'), **headers)
+            self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+
+class MetricsTest(TestCase):
+    """Tests for the Prometheus /metrics endpoint and its feeds"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.customer = Customer.objects.create(user=self.user, name='Test Customer', email='test@example.com')
+        self.product = Product.objects.create(name="Test Product", price=10.00, digital=False)
+        self.order = Order.objects.create(customer=self.customer, complete=False)
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2)
+        self.client.login(username='testuser', password='testpass123')
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_request_duration_by_view(self):
+        """Test requests are observed under their URL name"""
+        before = self.sample('django_http_request_duration_seconds_count', view='cart', method='GET', status='200')
+        self.client.get(reverse('cart'))
+        after = self.sample('django_http_request_duration_seconds_count', view='cart', method='GET', status='200')
+        self.assertEqual(after, before + 1)
+        self.assertIn('django_db_queries_per_request_bucket{le="6.0",view="cart"}', self.scrape())
+
+    def test_checkout_outcomes_counted(self):
+        """Test rejected and successful checkouts are counted separately"""
+        rejected = self.sample('store_checkouts_total', channel='order', outcome='rejected')
+        success = self.sample('store_checkouts_total', channel='order', outcome='success')
+        completed = self.sample('store_orders_total', event='completed')
+        shipping = {'address': '1 rue de Paris', 'city': 'Paris', 'state': 'IDF', 'zipcode': '75001'}
+        for address in ({}, shipping):
+            self.client.post(
+                reverse('process_order'),
+                data=json.dumps({'form': {'total': 20.00}, 'shipping': address}),
+                content_type='application/json'
+            )
+        self.assertEqual(self.sample('store_checkouts_total', channel='order', outcome='rejected'), rejected + 1)
+        self.assertEqual(self.sample('store_checkouts_total', channel='order', outcome='success'), success + 1)
+        self.assertEqual(self.sample('store_orders_total', event='completed'), completed + 1)
+
+    def test_open_carts_computed_at_scrape(self):
+        """Test the open cart gauges reflect the database"""
+        # Empty and completed orders are not open carts
+        Order.objects.create(complete=False)
+        Order.objects.create(complete=True, total=50.0, item_count=5)
+        metrics = self.scrape()
+        self.assertIn('store_open_carts 1.0', metrics)
+        self.assertIn('store_open_carts_value 20.0', metrics)
+        self.assertIn('store_jobs{status="pending"} 0.0', metrics)
+
+    def test_catalog_cache_hits_counted(self):
+        """Test catalog cache lookups feed the hit/miss counter"""
+        cache.clear()
+        misses = self.sample('store_catalog_cache_requests_total', result='miss')
+        hits = self.sample('store_catalog_cache_requests_total', result='hit')
+        get_first_page()
+        get_first_page()
+        self.assertEqual(self.sample('store_catalog_cache_requests_total', result='miss'), misses + 1)
+        self.assertEqual(self.sample('store_catalog_cache_requests_total', result='hit'), hits + 1)
+
+    def test_multiprocess_mode_aggregates_directory(self):
+        """Test the endpoint reads the worker files when PROMETHEUS_MULTIPROC_DIR is set"""
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict(
+            os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}
+        ):
+            metrics = self.scrape()
+        # Only the database gauges: no worker has written samples to the directory
+        self.assertNotIn('django_http_request_duration_seconds', metrics)
+        self.assertIn('store_open_carts 1.0', metrics)
+
+    def test_scrape_restricted_to_trusted_networks(self):
+        """Test clients outside METRICS_ALLOWED_NETWORKS are refused"""
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='172.18.0.5').status_code, 200)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_scrape_allowed_with_token(self):
+        """Test a bearer METRICS_TOKEN opens /metrics from any address"""
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.7', HTTP_AUTHORIZATION='Bearer scrape-secret').status_code, 200)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.7', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+
+class SeedLoadtestTest(TestCase):
+    """Tests for the synthetic load test data generator"""
+
+    def seed(self, *args):
+        call_command('seed_loadtest', '--products', '30', '--customers', '5', '--orders', '20', *args, stdout=StringIO())
+
+    def test_generates_consistent_history(self):
+        """Test the catalog, customers and orders are created with matching totals"""
+        self.seed()
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(Customer.objects.filter(user__username__startswith='loadtest_').count(), 5)
+        orders = Order.objects.filter(transaction_id__startswith='loadtest-', complete=True)
+        self.assertEqual(orders.count(), 20)
+        for order in orders[:5]:
+            self.assertAlmostEqual(order.recompute_totals()['total'], order.total, places=2)
+
+    def test_customers_can_log_in(self):
+        """Test the scenarios can log in with the shared password"""
+        self.seed()
+        self.assertTrue(self.client.login(username='loadtest_00004', password='loadtest123'))
+
+    def test_products_searchable(self):
+        """Test bulk-created products are indexed for the search API"""
+        self.seed()
+        product = Product.objects.first()
+        self.assertIn(product, search_products(product.name))
+
+    def test_reset_replaces_previous_data(self):
+        """Test --reset removes the synthetic rows instead of adding to them"""
+        Product.objects.create(name='Vrai produit', price=10.00)
+        self.seed()
+        self.seed('--reset')
+        self.assertEqual(Product.objects.count(), 31)
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertEqual(OrderItem.objects.filter(order__isnull=True).count(), 0)
+        self.assertEqual(User.objects.count(), 5)
+
+
+class AsyncRoutes:
+    """URLconf of the ASGI serving mode"""
+    urlpatterns = routes(async_views)
+
+
+@override_settings(ROOT_URLCONF=AsyncRoutes)
+class AsyncViewsTest(TestCase):
+    """Tests for the async views through the async middleware chain"""
+
+    def setUp(self):
+        self.client = AsyncClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.customer = Customer.objects.create(user=self.user, name='Test Customer', email='test@example.com')
+        self.product = Product.objects.create(name="Test Product", price=10.00, digital=False)
+        self.order = Order.objects.create(customer=self.customer, complete=False)
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2)
+
+    def test_async_views_routed(self):
+        """Test the ASGI routes point at coroutine views"""
+        for name in ('store', 'cart', 'checkout', 'update_item', 'process_order'):
+            self.assertTrue(iscoroutinefunction(resolve(reverse(name)).func), name)
+
+    async def test_pages_render_for_guest(self):
+        """Test the pages of a guest render without loading a user from the event loop"""
+        for name in ('store', 'cart', 'checkout'):
+            response = await self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+    async def test_cart_page_of_customer(self):
+        """Test the cart page lists the open order and its queries are profiled"""
+        await self.client.aforce_login(self.user)
+        response = await self.client.get(reverse('cart'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Test Product')
+        self.assertContains(response, 'testuser')
+        profile = response.asgi_request.query_profile
+        self.assertEqual(profile['view'], 'cart')
+        # Same queries as the sync view: session, user, customer, open order and its lines
+        self.assertEqual(profile['db_queries'], 5)
+
+    async def test_request_context_bound(self):
+        """Test records logged during an async request carry its id and view"""
+        lines = []
+        handler = logging.Handler()
+        handler.setFormatter(JsonFormatter())
+        handler.emit = lambda record: lines.append(handler.format(record))
+        with self.assertLogs('store.middleware', level='INFO'):
+            logging.getLogger('store.middleware').addHandler(handler)
+            response = await self.client.get(reverse('cart'))
+        entry = json.loads(lines[-1])
+        self.assertEqual((entry['request_id'], entry['view']), (response.asgi_request.id, 'cart'))
+
+    async def test_view_bound_before_view(self):
+        """Test the code of an async view logs with the view name"""
+        seen = {}
+        cartContext = views.cartContext
+
+        def capture(request):
+            seen.update(request_context())
+            return cartContext(request)
+
+        with mock.patch.object(views, 'cartContext', capture):
+            await self.client.get(reverse('cart'))
+        self.assertEqual(seen['view'], 'cart')
+
+    async def test_update_item(self):
+        """Test the async update_item changes the open order"""
+        await self.client.aforce_login(self.user)
+        response = await self.client.post(
+            reverse('update_item'), data=json.dumps({'productId': self.product.id, 'action': 'add'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['quantity'], 3)
+        response = await self.client.post(
+            reverse('update_item'), data=json.dumps({'productId': self.product.id, 'action': 'jump'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_update_item_requires_login(self):
+        """Test an anonymous update_item is redirected to the login page"""
+        response = await self.client.post(
+            reverse('update_item'), data=json.dumps({'productId': self.product.id, 'action': 'add'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 302)
+
+    async def test_process_order_idempotent(self):
+        """Test the async checkout completes once and replays its response"""
+        await self.client.aforce_login(self.user)
+        payload = json.dumps({'form': {'total': 20.00}, 'shipping': {
+            'address': '1 rue de Paris', 'city': 'Paris', 'state': 'IDF', 'zipcode': '75001',
+        }})
+        first = await self.client.post(
+            reverse('process_order'), data=payload, content_type='application/json',
+            headers={'Idempotency-Key': 'async-key-1'}
+        )
+        retry = await self.client.post(
+            reverse('process_order'), data=payload, content_type='application/json',
+            headers={'Idempotency-Key': 'async-key-1'}
+        )
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        await self.order.arefresh_from_db()
+        self.assertTrue(self.order.complete)
+        self.assertEqual(await ShippingAddress.objects.acount(), 1)
+
+
+class GunicornConfigTest(TestCase):
+    """Tests for the worker sizing and the stats hooks of gunicorn.conf.py"""
+
+    def load(self, **env):
+        with mock.patch.dict(os.environ, env):
+            return runpy.run_path(os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'))
+
+    def cgroup(self, files):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = directory.name
+        for name, content in files.items():
+            path = os.path.join(root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+        return root
+
+    def test_sizing(self):
+        """Test workers follow the CPUs unless memory caps them, threads fill the gap"""
+        size = self.load()['size']
+        self.assertEqual(size(1, 6000), (3, 2))
+        self.assertEqual(size(4, 8000), (9, 2))
+        # 400 MB: 3 workers of 80 MB, 16 requests in flight need 6 threads each
+        self.assertEqual(size(4, 400), (3, 6))
+        self.assertEqual(size(8, 100), (1, 8))
+
+    def test_cgroup_limits(self):
+        """Test cgroup v2 and v1 limits are read, unlimited values fall back to the host"""
+        config = self.load()
+        meminfo = self.cgroup({'meminfo': 'MemTotal:        8192000 kB\n'})
+        meminfo = os.path.join(meminfo, 'meminfo')
+        self.assertEqual(config['cpu_limit'](self.cgroup({'cpu.max': '150000 100000'})), 2)
+        self.assertEqual(config['cpu_limit'](self.cgroup({'cpu/cpu.cfs_quota_us': '400000', 'cpu/cpu.cfs_period_us': '100000'})), 4)
+        self.assertEqual(config['cpu_limit'](self.cgroup({'cpu.max': 'max 100000'})), len(os.sched_getaffinity(0)))
+        self.assertEqual(config['memory_limit_mb'](self.cgroup({'memory.max': '536870912'}), meminfo), 512)
+        self.assertEqual(config['memory_limit_mb'](self.cgroup({'memory.max': 'max'}), meminfo), 8000)
+        self.assertEqual(
+            config['memory_limit_mb'](self.cgroup({'memory/memory.limit_in_bytes': '9223372036854771712'}), meminfo), 8000
+        )
+
+    def test_environment_overrides(self):
+        """Test GUNICORN_* variables win, async workers get no threads"""
+        config = self.load(GUNICORN_WORKERS='5', GUNICORN_THREADS='4', GUNICORN_MAX_REQUESTS='0')
+        self.assertEqual((config['workers'], config['threads'], config['worker_class']), (5, 4, 'gthread'))
+        self.assertEqual(config['max_requests'], 0)
+        self.assertTrue(config['preload_app'])
+        config = self.load(GUNICORN_THREADS='4', GUNICORN_WORKER_CLASS='uvicorn.workers.UvicornWorker')
+        self.assertEqual(config['threads'], 1)
+        self.assertEqual(self.load(GUNICORN_THREADS='1')['worker_class'], 'sync')
+
+    def test_request_stats_logged(self):
+        """Test the request hooks log the count and latency percentiles of the interval"""
+        config = self.load(GUNICORN_STATS_INTERVAL='3600')
+        worker = mock.Mock(pid=1234)
+        for status in (200, 200, 500):
+            request = mock.Mock()
+            config['pre_request'](worker, request)
+            config['post_request'](worker, request, {}, mock.Mock(status_code=status))
+        with self.assertLogs('store.server', level='INFO') as logs:
+            config['worker_exit'](None, worker)
+        record = logs.records[0]
+        self.assertEqual((record.worker_pid, record.requests, record.errors_5xx), (1234, 3, 1))
+        self.assertIsNotNone(record.latency_p95_ms)
+
+        # Logged by the request that closes the interval
+        config['post_request'].__globals__['STATS_INTERVAL'] = 0
+        with self.assertLogs('store.server', level='INFO') as logs:
+            config['pre_request'](worker, request)
+            config['post_request'](worker, request, {}, mock.Mock(status_code=200))
+        self.assertEqual(logs.records[0].requests, 1)
+        self.assertEqual(logs.records[0].requests_total, 4)
+
+
+class DatabaseSettingsTest(TestCase):
+    """Tests for the database connection settings of ecommerce/settings.py"""
+
+    def load(self, **env):
+        with mock.patch.dict(os.environ, {'DATABASE': 'postgresql', **env}):
+            return runpy.run_path(os.path.join(settings.BASE_DIR, 'ecommerce', 'settings.py'))['DATABASES']['default']
+
+    def test_persistent_connections(self):
+        """Test connections are kept open and checked before reuse, unless disabled"""
+        database = self.load()
+        self.assertEqual((database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS']), (60, True))
+        self.assertEqual(database['OPTIONS']['options'], '-c timezone=UTC')
+        self.assertEqual(self.load(DB_CONN_MAX_AGE='0')['CONN_MAX_AGE'], 0)
+
+    def test_pgbouncer(self):
+        """Test the pooler switch connects to pgbouncer without server-side cursors or startup options"""
+        database = self.load(DB_POOLER='pgbouncer', DB_HOST='postgres')
+        self.assertEqual((database['HOST'], database['PORT']), ('pgbouncer', '6432'))
+        self.assertTrue(database['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertNotIn('options', database['OPTIONS'])
+        database = self.load(DB_POOLER='pgbouncer', DB_POOLER_HOST='127.0.0.1', DB_POOLER_PORT='6543')
+        self.assertEqual((database['HOST'], database['PORT']), ('127.0.0.1', '6543'))
+
+    def test_sqlite_tuning(self):
+        """Test the SQLite profile is opt-in outside the container and sets its pragmas on every connection"""
+        self.assertNotIn('OPTIONS', self.load(DATABASE='', DB_SQLITE_TUNING='False'))
+        database = self.load(DATABASE='', DB_SQLITE_TUNING='True')
+        self.assertEqual(database['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        handler = ConnectionHandler({'default': {**database, 'NAME': os.path.join(directory.name, 'db.sqlite3')}})
+        tuned = handler['default']
+        self.addCleanup(tuned.close)
+        with tuned.cursor() as cursor:
+            pragmas = [cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in ('journal_mode', 'synchronous', 'cache_size')]
+        # synchronous=NORMAL is 1
+        self.assertEqual(pragmas, ['wal', 1, -32768])
+
+
+REPLICA_ROUTING = {
+    'DATABASE_ROUTERS': ['store.routers.ReplicaRouter'],
+    'MIDDLEWARE': [
+        name for middleware in settings.MIDDLEWARE
+        for name in (('store.middleware.ReplicaStickinessMiddleware', middleware)
+                     if middleware.endswith('SessionMiddleware') else (middleware,))
+    ],
+}
+
+
+@override_settings(**REPLICA_ROUTING)
+class ReplicaRoutingTest(TransactionTestCase):
+    """Tests for the read replica router, with a second test database as the replica"""
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        # Different rows on each side show where a query went
+        self.product = Product.objects.create(name='Primary product', price=10.00)
+        Product.objects.using(REPLICA).bulk_create([Product(name='Replica product', price=10.00)])
+
+    def names(self):
+        return list(Product.objects.values_list('name', flat=True))
+
+    def listed(self, client):
+        response = client.get(reverse('product_list'))
+        return [product['name'] for product in response.json()['products']], response
+
+    def test_catalog_reads_replica(self):
+        """Test catalog reads go to the replica, except in a transaction or under use_primary"""
+        self.assertEqual(self.names(), ['Replica product'])
+        with transaction.atomic():
+            self.assertEqual(self.names(), ['Primary product'])
+        with use_primary():
+            self.assertEqual(self.names(), ['Primary product'])
+        self.assertEqual(Order.objects.all().db, 'default')
+        with replica_reads():
+            self.assertEqual(Order.objects.all().db, REPLICA)
+            with use_primary():
+                self.assertEqual(Order.objects.all().db, 'default')
+        # Writes of rows read from the replica go to the primary
+        product = Product.objects.get()
+        product.name = 'Renamed'
+        product.save()
+        self.assertEqual(Product.objects.using('default').get(pk=product.pk).name, 'Renamed')
+
+    def test_reads_stick_to_primary_after_write(self):
+        """Test a client that wrote reads from the primary until the sticky cookie expires"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        Customer.objects.create(user=user, name='Test Customer', email='test@example.com')
+        client = Client()
+        client.force_login(user)
+
+        names, response = self.listed(client)
+        self.assertEqual(names, ['Replica product'])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+        response = client.post(reverse('update_item'), data=json.dumps({'productId': self.product.id, 'action': 'add'}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+        self.assertEqual(self.listed(client)[0], ['Primary product'])
+
+        client.cookies[STICKY_COOKIE] = '0'
+        self.assertEqual(self.listed(client)[0], ['Replica product'])
+
+    @override_settings(ROOT_URLCONF=AsyncRoutes)
+    async def test_async_write_sticks(self):
+        """Test writes made by the sync code of an async view set the sticky cookie"""
+        user = await User.objects.acreate_user(username='testuser', password='testpass123')
+        await Customer.objects.acreate(user=user, name='Test Customer', email='test@example.com')
+        client = AsyncClient()
+        await client.aforce_login(user)
+        response = await client.post(reverse('update_item'), data={'productId': self.product.id, 'action': 'add'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+    def test_admin_changelist_reads_replica(self):
+        """Test order changelists read the replica and change forms the primary"""
+        admin = User.objects.create_superuser(username='admin', password='adminpass123', email='admin@example.com')
+        order = Order.objects.using(REPLICA).create(transaction_id='replica-only')
+        client = Client()
+        client.force_login(admin)
+
+        response = client.get(reverse('admin:store_order_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 1)
+        # Not on the primary yet
+        response = client.get(reverse('admin:store_order_change', args=[order.id]))
+        self.assertEqual(response.status_code, 302)
@@ -1,23 +1,37 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
-urlpatterns = [
-	#Leave as empty string for base url
-	path('', views.store, name="store"),
-	path('cart/', views.cart, name="cart"),
-	path('checkout/', views.checkout, name="checkout"),
 
-	path('update_item/', views.updateItem, name="update_item"),
-	path('process_order/', views.processOrder, name="process_order"),
+def routes(pages):
+	"""URL patterns, with the page and cart views taken from pages"""
+	return [
+		#Leave as empty string for base url
+		path('', pages.store, name="store"),
+		path('cart/', pages.cart, name="cart"),
+		path('checkout/', pages.checkout, name="checkout"),
+		path('api/products/', views.productList, name="product_list"),
+		path('api/search/', views.searchProducts, name="search_products"),
+
+		path('update_item/', pages.updateItem, name="update_item"),
+		path('update_cart/', views.updateCart, name="update_cart"),
+		path('process_order/', pages.processOrder, name="process_order"),
 	
-	# Authentication
-	path('login/', views.loginPage, name="login"),
-	path('logout/', views.logoutUser, name="logout"),
+		# Authentication
+		path('login/', views.loginPage, name="login"),
+		path('logout/', views.logoutUser, name="logout"),
 	
-	# Payment
-	path('payment/', views.payment, name="payment"),
-	path('process_payment/', views.processPayment, name="process_payment"),
-	path('order-success/', views.orderSuccess, name="order_success"),
+		# Payment
+		path('payment/', views.payment, name="payment"),
+		path('process_payment/', views.processPayment, name="process_payment"),
+		path('order-success/', views.orderSuccess, name="order_success"),
+
+		# Monitoring
+		path('metrics', views.metrics, name="metrics"),
+
+	]
+
 
-]
\ No newline at end of file
+# ASGI workers serve the async versions of the page and cart views
+urlpatterns = routes(async_views if settings.ASYNC_VIEWS else views)
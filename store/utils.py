@@ -1,70 +1,163 @@
+import hashlib
 import json
 import logging
 import re
-from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.core.validators import EmailValidator
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
+from .catalog import get_catalog_version
 from .models import *
+from .routers import use_primary
 
 logger = logging.getLogger(__name__)
 
-def cookieCart(request):
-    """Parse cart from cookies with proper error handling"""
+# Upper bound of a cart line quantity
+MAX_QUANTITY = 100
+# Upper bound of the operations accepted in one cart batch
+MAX_CART_OPERATIONS = 50
+# Upper bound of the distinct products of a guest cart
+MAX_CART_LINES = 100
+
+CART_COOKIE = 'cart'
+CART_COOKIE_VERSION = 'c1'
+CART_COOKIE_SALT = 'store.cart'
+CART_COOKIE_MAX_AGE = 30 * 24 * 3600
+
+def encodeCartCookie(lines):
+    """Signed compact cookie value of a {product_id: quantity} map: c1.<id>-<qty>.<id>-<qty>:<signature>"""
+    pairs = [
+        f'{product_id}-{min(quantity, MAX_QUANTITY)}'
+        for product_id, quantity in list(lines.items())[:MAX_CART_LINES]
+        if quantity > 0
+    ]
+    return signing.Signer(salt=CART_COOKIE_SALT).sign('.'.join([CART_COOKIE_VERSION] + pairs))
+
+def _decodeLegacyCart(raw):
+    # JSON written by cart.js before the signed format: {"<id>": {"quantity": <n>}}
     try:
-        cart = json.loads(request.COOKIES.get('cart', '{}'))
+        cart = json.loads(raw)
     except (json.JSONDecodeError, KeyError) as e:
         logger.warning(f"Invalid cart cookie: {str(e)}")
         cart = {}
 
-    items = []
-    order = {'get_cart_total': 0, 'get_cart_items': 0, 'shipping': False}
-    cartItems = 0 # Fixed indentation
+    if not isinstance(cart, dict):
+        logger.warning("Invalid cart cookie: expected an object")
+        return {}
 
+    lines = {}
     for product_id_str in cart:
         try:
             # Validate product ID is an integer
             product_id = int(product_id_str)
             # Use original string key to access cart dict
             quantity = int(cart[product_id_str].get('quantity', 0))
-            
-            # Validate quantity is positive
-            if quantity <= 0:
-                continue
-            
-            try:
-                product = Product.objects.get(id=product_id)
-                total = product.price * quantity
-                
-                order['get_cart_total'] += total
-                order['get_cart_items'] += quantity
-                
-                item = {
-                    'id': product.id,
-                    'product': {
-                        'id': product.id,
-                        'name': product.name,
-                        'price': product.price,
-                        'imageURL': product.imageURL
-                    },
-                    'quantity': quantity,
-                    'digital': product.digital,
-                    'get_total': total,
-                }
-                items.append(item)
-                
-                if not product.digital:
-                    order['shipping'] = True
-                    
-            except Product.DoesNotExist:
-                logger.warning(f"Product {product_id} not found in cart")
-                continue
-                    
-        except (ValueError, TypeError, KeyError) as e:
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
             logger.warning(f"Invalid cart item {product_id_str}: {str(e)}")
             continue
-            
-    # Update cartItems based on the order aggregation
+
+        # Validate quantity is positive
+        if quantity <= 0:
+            continue
+
+        lines[product_id] = min(lines.get(product_id, 0) + quantity, MAX_QUANTITY)
+
+    return dict(list(lines.items())[:MAX_CART_LINES])
+
+def decodeCartCookie(raw):
+    """Decode a cart cookie value, signed or legacy JSON, into an ordered {product_id: quantity} map"""
+    if not raw.startswith(CART_COOKIE_VERSION + '.') and raw != CART_COOKIE_VERSION:
+        return _decodeLegacyCart(raw) if raw else {}
+    try:
+        payload = signing.Signer(salt=CART_COOKIE_SALT).unsign(raw)
+    except signing.BadSignature:
+        logger.warning("Invalid cart cookie: bad signature")
+        return {}
+
+    # Signed by the server, so already bounded and validated
+    lines = {}
+    for pair in payload.split('.')[1:]:
+        product_id, quantity = pair.split('-')
+        lines[int(product_id)] = int(quantity)
+    return lines
+
+def parseCartCookie(request):
+    """Parse the cart cookie into an ordered {product_id: quantity} map"""
+    return decodeCartCookie(request.COOKIES.get(CART_COOKIE, ''))
+
+def setCartCookie(response, lines):
+    """Store the guest cart in its signed cookie, or drop the cookie once empty"""
+    if not lines:
+        response.delete_cookie(CART_COOKIE)
+        return
+    response.set_cookie(
+        CART_COOKIE, encodeCartCookie(lines),
+        max_age=CART_COOKIE_MAX_AGE, httponly=True, samesite='Lax', secure=settings.SESSION_COOKIE_SECURE,
+    )
+
+def resolveCart(lines):
+    """Resolve {product_id: quantity} lines against the catalog with a single product query"""
+    items = []
+    order = {'get_cart_total': 0, 'get_cart_items': 0, 'shipping': False}
+
+    products = Product.objects.in_bulk(list(lines)) if lines else {}
+
+    for product_id, quantity in lines.items():
+        product = products.get(product_id)
+        if product is None:
+            logger.warning(f"Product {product_id} not found in cart")
+            continue
+
+        total = product.price * quantity
+
+        order['get_cart_total'] += total
+        order['get_cart_items'] += quantity
+
+        item = {
+            'id': product.id,
+            'product': {
+                'id': product.id,
+                'name': product.name,
+                'price': product.price,
+                'imageURL': product.imageURL
+            },
+            'quantity': quantity,
+            'digital': product.digital,
+            'get_total': total,
+        }
+        items.append(item)
+
+        if not product.digital:
+            order['shipping'] = True
+
     cartItems = order['get_cart_items']
-    return {'cartItems': cartItems, 'order': order, 'items': items} # Added missing return
+    return {'cartItems': cartItems, 'order': order, 'items': items}
+
+def _resolvedCartKey(raw):
+    digest = hashlib.sha256(raw.encode()).hexdigest()
+    return f'cart:{digest}:{get_catalog_version()}'
+
+def cachedCart(raw):
+    """Resolved cart of a cookie value, cached while the cookie and the catalog are unchanged"""
+    if not raw:
+        return resolveCart({})
+
+    key = _resolvedCartKey(raw)
+    data = cache.get(key)
+    if data is None:
+        # Cached past any replication lag: resolved on the primary
+        with use_primary():
+            data = resolveCart(decodeCartCookie(raw))
+        cache.set(key, data, settings.CART_CACHE_TIMEOUT)
+    return data
+
+def cookieCart(request):
+    """Resolve the guest cart cookie, skipping parsing and queries for an unchanged cart"""
+    return cachedCart(request.COOKIES.get(CART_COOKIE, ''))
 
 def cartData(request):
     """Get cart data for authenticated or guest user"""
@@ -72,7 +165,8 @@ def cartData(request):
         try:
             customer = request.user.customer
             order, created = Order.objects.get_or_create(customer=customer, complete=False)
-            items = order.orderitem_set.all()
+            # Totals come from the stored Order columns, lines from one joined query
+            items = list(order.cart_lines())
             cartItems = order.get_cart_items
         except AttributeError:
             cookieData = cookieCart(request)
@@ -105,29 +199,253 @@ def guestOrder(request, data):
     
     name = re.sub(r'[<>"\']', '', name)
     
-    cookieData = cookieCart(request)
-    items = cookieData['items']
+    # One product query resolves the cart; nothing is written for an empty one
+    items = cookieCart(request)['items']
+    if not items:
+        raise ValidationError('Cart is empty')
     
-    customer, created = Customer.objects.get_or_create(email=email)
-    customer.name = name
-    customer.save()
+    # Customer, order lines and Order totals commit together
+    with transaction.atomic():
+        # Only guest customers are reused: an account's name and cart are never touched by a guest
+        customer, created = Customer.objects.filter(user__isnull=True).update_or_create(email=email, defaults={'name': name})
+        
+        # A guest customer keeps at most one open order; reuse it for this cart
+        if created:
+            order = Order.objects.create(customer=customer, complete=False)
+        else:
+            order, created = Order.objects.get_or_create(customer=customer, complete=False)
+        lines = [
+            OrderItem(order=order, product_id=item['id'], quantity=min(max(1, int(item['quantity'])), MAX_QUANTITY))
+            for item in items
+        ]
+        if not created:
+            # Lines left from a previous visit are overwritten in one UPDATE,
+            # only products no longer in the cart are deleted
+            previous = OrderItem.objects.filter(order=order)
+            previous.update(quantity=Case(
+                *[When(product_id=line.product_id, then=Value(line.quantity)) for line in lines],
+                default=Value(0),
+                output_field=IntegerField(),
+            ))
+            previous.filter(quantity=0).delete()
+            kept = set(previous.values_list('product_id', flat=True))
+            lines = [line for line in lines if line.product_id not in kept]
+        
+        # bulk_create skips the per-row totals signal, totals are refreshed once
+        OrderItem.objects.bulk_create(lines)
+        order.recompute_totals()
     
-    order = Order.objects.create(customer=customer, complete=False)
+    return customer, order
+
+def parseShippingAddress(data):
+    """Validate the shipping fields of a checkout payload"""
+    shipping_data = data.get('shipping') or {}
+    required_fields = ['address', 'city', 'state', 'zipcode']
+    if not isinstance(shipping_data, dict) or not all(key in shipping_data for key in required_fields):
+        raise ValidationError('Missing shipping information')
     
-    if not items:
-        raise ValidationError('Cart is empty')
+    try:
+        address = {key: shipping_data[key].strip()[:200] for key in required_fields}
+    except AttributeError:
+        raise ValidationError('Invalid shipping information')
     
-    for item in items:
+    if not all(address.values()):
+        raise ValidationError('All shipping fields are required')
+    return address
+
+def _clampedQuantity(delta):
+    return Least(Greatest(Coalesce(F('quantity'), 0) + delta, 0), MAX_QUANTITY)
+
+def updateCartLine(order, product_id, delta):
+    """Apply a quantity change to one cart line with a single clamped UPDATE
+
+    Concurrent changes cannot be lost since the new quantity is computed by
+    the database. Lines that reach zero are deleted and the Order totals are
+    refreshed in the same transaction. Raises Product.DoesNotExist when a
+    new line would reference an unknown product.
+    """
+    lines = OrderItem.objects.filter(order=order, product_id=product_id)
+    clamped = _clampedQuantity(delta)
+
+    with transaction.atomic():
+        if not lines.update(quantity=clamped) and delta > 0:
+            if not Product.objects.filter(pk=product_id).exists():
+                raise Product.DoesNotExist(f"Product {product_id} not found")
+            try:
+                with transaction.atomic():
+                    # bulk_create skips the per-row totals signal, totals are refreshed below
+                    OrderItem.objects.bulk_create([
+                        OrderItem(order=order, product_id=product_id, quantity=min(delta, MAX_QUANTITY))
+                    ])
+            except IntegrityError:
+                # A concurrent request created the line first
+                lines.update(quantity=clamped)
+
+        totals = order.recompute_totals(
+            line_quantity=Coalesce(Sum('quantity', filter=Q(product_id=product_id)), 0)
+        )
+        if totals['line_quantity'] <= 0:
+            lines.filter(quantity__lte=0).delete()
+
+    return {
+        'quantity': totals['line_quantity'],
+        'cartItems': order.get_cart_items,
+        'cartTotal': order.get_cart_total,
+        'shipping': order.shipping,
+    }
+
+def parseItemUpdate(data):
+    """Validate an update_item payload into (product_id, delta)"""
+    productId = data.get('productId')
+    action = data.get('action')
+    if not productId or not action:
+        raise ValidationError('Missing required fields')
+    if action not in ['add', 'remove']:
+        raise ValidationError('Invalid action')
+    try:
+        productId = int(productId)
+    except (ValueError, TypeError):
+        raise ValidationError('Invalid product ID')
+    return productId, 1 if action == 'add' else -1
+
+def parseCartOperations(data):
+    """Validate a batch of cart operations into an ordered {product_id: delta} map"""
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise ValidationError('operations must be a non-empty list')
+    if len(operations) > MAX_CART_OPERATIONS:
+        raise ValidationError(f'At most {MAX_CART_OPERATIONS} operations per request')
+
+    deltas = {}
+    for operation in operations:
         try:
-            product = Product.objects.get(id=item['id'])
-            quantity = min(max(1, int(item.get('quantity', 1))), 100)
-            
-            OrderItem.objects.create(
-                product=product,
-                order=order,
-                quantity=quantity,
-            )
-        except Product.DoesNotExist:
-            continue
-    
-    return customer, order
\ No newline at end of file
+            product_id = int(operation['productId'])
+            delta = int(operation['delta'])
+        except (ValueError, TypeError, KeyError):
+            raise ValidationError('Each operation needs an integer productId and delta')
+        if abs(delta) > MAX_QUANTITY:
+            raise ValidationError('Invalid delta')
+        # Repeated clicks on the same product collapse into one change
+        deltas[product_id] = deltas.get(product_id, 0) + delta
+
+    return {product_id: delta for product_id, delta in deltas.items() if delta}
+
+def applyCartOperations(order, deltas):
+    """Apply a batch of quantity changes to an order in a constant number of queries
+
+    Existing lines are changed by one CASE UPDATE computed by the database,
+    new lines are inserted with one bulk_create, and the Order totals are
+    refreshed once. Raises Product.DoesNotExist when a new line would
+    reference an unknown product. Returns the serialized cart.
+    """
+    with transaction.atomic():
+        if deltas:
+            lines = OrderItem.objects.filter(order=order, product_id__in=list(deltas))
+            existing = set(lines.values_list('product_id', flat=True))
+
+            def updateExisting(product_ids):
+                lines.filter(product_id__in=product_ids).update(quantity=Case(
+                    *[When(product_id=product_id, then=_clampedQuantity(deltas[product_id]))
+                      for product_id in product_ids],
+                    default=F('quantity'),
+                    output_field=IntegerField(),
+                ))
+
+            if existing:
+                updateExisting(sorted(existing))
+
+            missing = [product_id for product_id in deltas if product_id not in existing and deltas[product_id] > 0]
+            if missing:
+                known = set(Product.objects.filter(pk__in=missing).values_list('pk', flat=True))
+                unknown = [product_id for product_id in missing if product_id not in known]
+                if unknown:
+                    raise Product.DoesNotExist(f"Products {unknown} not found")
+                try:
+                    with transaction.atomic():
+                        # bulk_create skips the per-row totals signal, totals are refreshed below
+                        OrderItem.objects.bulk_create([
+                            OrderItem(order=order, product_id=product_id, quantity=min(deltas[product_id], MAX_QUANTITY))
+                            for product_id in missing
+                        ])
+                except IntegrityError:
+                    # Some lines were created concurrently, apply the batch to them as updates
+                    created = set(lines.filter(product_id__in=missing).values_list('product_id', flat=True))
+                    updateExisting(sorted(created))
+                    OrderItem.objects.bulk_create([
+                        OrderItem(order=order, product_id=product_id, quantity=min(deltas[product_id], MAX_QUANTITY))
+                        for product_id in missing if product_id not in created
+                    ])
+
+            lines.filter(quantity__lte=0).delete()
+        order.recompute_totals()
+
+    return serializeCart(order)
+
+def applyCookieCartOperations(request, deltas):
+    """Apply a batch of quantity changes to the guest cart cookie
+
+    Returns the new lines, to be written with setCartCookie, and the
+    serialized cart. The resolved cart is cached under the new cookie value
+    so the next page load skips the database. Raises Product.DoesNotExist
+    when a new line would reference an unknown product.
+    """
+    lines = parseCartCookie(request)
+
+    added = [product_id for product_id, delta in deltas.items() if delta > 0 and product_id not in lines]
+    if added:
+        known = set(Product.objects.filter(pk__in=added).values_list('pk', flat=True))
+        unknown = [product_id for product_id in added if product_id not in known]
+        if unknown:
+            raise Product.DoesNotExist(f"Products {unknown} not found")
+
+    for product_id, delta in deltas.items():
+        quantity = min(max(lines.get(product_id, 0) + delta, 0), MAX_QUANTITY)
+        if quantity:
+            lines[product_id] = quantity
+        else:
+            lines.pop(product_id, None)
+    if len(lines) > MAX_CART_LINES:
+        raise ValidationError(f'A cart holds at most {MAX_CART_LINES} products')
+
+    data = cachedCart(encodeCartCookie(lines) if lines else '')
+    return lines, {
+        'cartItems': data['cartItems'],
+        'cartTotal': data['order']['get_cart_total'],
+        'shipping': data['order']['shipping'],
+        'items': [
+            {'productId': item['id'], 'quantity': item['quantity'], 'total': item['get_total']}
+            for item in data['items']
+        ],
+    }
+
+def mergeCookieCart(request, user):
+    """Move the guest cart cookie into the user's open order on login
+
+    Quantities are added to the lines already in the order and clamped like
+    cart updates, with the bulk writes of applyCartOperations. Returns False
+    when there is no customer to merge into, the cookie is then kept.
+    """
+    try:
+        customer = user.customer
+    except AttributeError:
+        return False
+
+    # Products removed from the catalog since they were added are dropped
+    lines = {item['id']: item['quantity'] for item in cookieCart(request)['items']}
+    if lines:
+        with transaction.atomic():
+            order, created = Order.objects.get_or_create(customer=customer, complete=False)
+            applyCartOperations(order, lines)
+    return True
+
+def serializeCart(order):
+    """JSON-ready cart of an order, read with one joined query"""
+    return {
+        'cartItems': order.get_cart_items,
+        'cartTotal': order.get_cart_total,
+        'shipping': order.shipping,
+        'items': [
+            {'productId': line.product_id, 'quantity': line.quantity, 'total': line.line_total}
+            for line in order.cart_lines()
+        ],
+    }
@@ -1,52 +1,78 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.http import require_http_methods
-from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.exceptions import ValidationError
+from django.db import transaction
 import json
 import datetime
 import logging
 import uuid
 
-from .models import Customer, Product, Order, OrderItem, ShippingAddress
-from .utils import cartData, guestOrder  # Added missing utility imports
+from .models import Product, Order, ShippingAddress
+from .utils import (  # Added missing utility imports
+    cartData, guestOrder, updateCartLine, parseItemUpdate, parseCartOperations, applyCartOperations, parseShippingAddress,
+    applyCookieCartOperations, setCartCookie, mergeCookieCart, CART_COOKIE,
+)
+from .catalog import get_first_page, get_product_grid
+from .idempotency import idempotent
+from .jobs import enqueue
+from .listing import product_page, serialize_product
+from .metrics import record_checkout, render_metrics, scrape_allowed
+from .search import search_products
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+def storeContext(request):
+    """Template context of the store page"""
+    return {
+        'product_grid': get_product_grid(),
+        'next_cursor': get_first_page()['next_cursor'],
+        'cartItems': cartData(request)['cartItems'],
+    }
+
 def store(request):
     """View to display the main product store"""
-    data = cartData(request)
-    cartItems = data['cartItems']
-    items = data['items']
+    return render(request, 'store/store.html', storeContext(request))
 
-    products = Product.objects.all()
-    context = {'products': products, 'cartItems': cartItems}
-    return render(request, 'store/store.html', context)
+@require_http_methods(["GET"])
+def productList(request):
+    """Keyset-paginated, filtered and sorted product listing"""
+    try:
+        page = product_page(request.GET)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
 
-def cart(request):
-    """View to display the shopping cart"""
-    data = cartData(request)
+    return JsonResponse({
+        'products': [serialize_product(product) for product in page['products']],
+        'next_cursor': page['next_cursor'],
+    })
 
-    cartItems = data['cartItems']
-    order = data['order']
-    items = data['items']
+@require_http_methods(["GET"])
+def searchProducts(request):
+    """Ranked typeahead search over product names and descriptions"""
+    query = request.GET.get('q', '')[:100]
+    results = search_products(query) if query.strip() else []
+    return JsonResponse({'results': [serialize_product(product) for product in results]})
 
-    context = {'items': items, 'order': order, 'cartItems': cartItems}
-    return render(request, 'store/cart.html', context)
+def cartContext(request):
+    """Template context of the cart and checkout pages"""
+    data = cartData(request)
+    return {'items': data['items'], 'order': data['order'], 'cartItems': data['cartItems']}
+
+def cart(request):
+    """View to display the shopping cart"""
+    return render(request, 'store/cart.html', cartContext(request))
 
 def checkout(request):
     """View to display the checkout page"""
-    data = cartData(request)
-    
-    cartItems = data['cartItems']
-    order = data['order']
-    items = data['items']
-
-    context = {'items': items, 'order': order, 'cartItems': cartItems}
+    context = cartContext(request)
+    # Sent back with the order so a retried submission is not processed twice
+    context['idempotency_key'] = uuid.uuid4().hex
     return render(request, 'store/checkout.html', context)
 
 @require_http_methods(["POST"])
@@ -59,125 +85,144 @@ def updateItem(request):
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
     
-    productId = data.get('productId')
-    action = data.get('action')
-    
-    if not productId or not action:
-        return JsonResponse({'error': 'Missing required fields'}, status=400)
-    
-    if action not in ['add', 'remove']:
-        return JsonResponse({'error': 'Invalid action'}, status=400)
-    
     try:
-        productId = int(productId)
-    except (ValueError, TypeError):
-        return JsonResponse({'error': 'Invalid product ID'}, status=400)
+        productId, delta = parseItemUpdate(data)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
     
+    return itemUpdateResponse(request.user, productId, delta)
+
+def itemUpdateResponse(user, productId, delta):
+    """Apply a validated update_item change to the open order of the user"""
     try:
-        customer = request.user.customer
+        customer = user.customer
     except AttributeError:
         return JsonResponse({'error': 'Customer profile not found'}, status=404)
     
     try:
-        product = Product.objects.get(id=productId)
+        with transaction.atomic():
+            order, created = Order.objects.get_or_create(customer=customer, complete=False)
+            line = updateCartLine(order, productId, delta)
     except Product.DoesNotExist:
         return JsonResponse({'error': 'Product not found'}, status=404)
+    except Exception as e:
+        logger.error(f"Error updating item: {str(e)}")
+        return JsonResponse({'error': 'Internal server error'}, status=500)
     
+    message = 'Item updated' if line['quantity'] > 0 else 'Item removed'
+    return JsonResponse({'success': True, 'message': message, **line}, status=200)
+
+@require_http_methods(["POST"])
+@csrf_protect
+def updateCart(request):
+    """Apply a debounced batch of cart changes and return the updated cart"""
     try:
-        order, created = Order.objects.get_or_create(customer=customer, complete=False)
-        orderItem, created = OrderItem.objects.get_or_create(order=order, product=product)
-        
-        if action == 'add':
-            orderItem.quantity += 1
-            if orderItem.quantity > 100:
-                orderItem.quantity = 100
-        elif action == 'remove':
-            orderItem.quantity -= 1
-        
-        orderItem.save()
-        
-        if orderItem.quantity <= 0:
-            orderItem.delete()
-            return JsonResponse({'success': True, 'message': 'Item removed', 'quantity': 0}, status=200)
-        
-        return JsonResponse({'success': True, 'message': 'Item updated', 'quantity': orderItem.quantity}, status=200)
-        
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    
+    try:
+        deltas = parseCartOperations(data)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
+    
+    try:
+        customer = request.user.customer if request.user.is_authenticated else None
+    except AttributeError:
+        customer = None
+    
+    if customer is None:
+        # Guest carts live in the signed cart cookie
+        try:
+            lines, cart = applyCookieCartOperations(request, deltas)
+        except Product.DoesNotExist:
+            return JsonResponse({'error': 'Product not found'}, status=404)
+        except ValidationError as e:
+            return JsonResponse({'error': e.messages[0]}, status=400)
+        response = JsonResponse({'success': True, **cart}, status=200)
+        setCartCookie(response, lines)
+        return response
+    
+    try:
+        with transaction.atomic():
+            order, created = Order.objects.get_or_create(customer=customer, complete=False)
+            cart = applyCartOperations(order, deltas)
+    except Product.DoesNotExist:
+        return JsonResponse({'error': 'Product not found'}, status=404)
     except Exception as e:
-        logger.error(f"Error updating item: {str(e)}")
+        logger.error(f"Error updating cart: {str(e)}")
         return JsonResponse({'error': 'Internal server error'}, status=500)
+    
+    return JsonResponse({'success': True, **cart}, status=200)
 
 @require_http_methods(["POST"])
 @csrf_protect
+@idempotent
 def processOrder(request):
-    """Process order with server-side price validation"""
+    """Validate and complete the open order in a single transaction"""
     try:
         data = json.loads(request.body)
     except json.JSONDecodeError:
+        record_checkout('order', 'rejected')
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
     
-    # Fixed indentation here
+    return orderResponse(request, data)
+
+def orderResponse(request, data):
+    """Complete the open order of the request from the decoded checkout payload"""
     transaction_id = str(uuid.uuid4())
     
     try:
-        if request.user.is_authenticated:
+        # Nothing is written unless the whole checkout succeeds
+        with transaction.atomic():
             try:
-                customer = request.user.customer
-                order, created = Order.objects.get_or_create(customer=customer, complete=False)
+                customer = request.user.customer if request.user.is_authenticated else None
             except AttributeError:
+                customer = None
+            
+            guest = customer is None
+            if not guest:
+                # Locked so concurrent checkouts of the same cart run one after the other
+                order = Order.objects.select_for_update().filter(customer=customer, complete=False).first()
+                if order is None or order.get_cart_total <= 0:
+                    raise ValidationError('Cart is empty')
+            else:
                 customer, order = guestOrder(request, data)
-        else:
-            customer, order = guestOrder(request, data)
+            
+            calculated_total = float(order.get_cart_total)
+            try:
+                client_total = float(data.get('form', {}).get('total', 0))
+                if abs(client_total - calculated_total) > 0.01:
+                    logger.warning(f"Price mismatch: client={client_total}, server={calculated_total}")
+            except (ValueError, TypeError):
+                pass
+            
+            address = parseShippingAddress(data) if order.shipping else None
+            
+            order.transaction_id = transaction_id
+            order.complete = True
+            order.save(update_fields=['transaction_id', 'complete'])
+            
+            if address:
+                ShippingAddress.objects.create(customer=customer, order=order, **address)
+            
+            # Follow-up work runs in the run_jobs worker, committed with the order
+            enqueue('finalize_order', order_id=order.id)
     except ValidationError as e:
-        logger.warning(f"Validation error in order: {str(e)}")
-        return JsonResponse({'error': str(e)}, status=400)
+        logger.warning(f"Validation error in order: {e.messages[0]}")
+        record_checkout('order', 'rejected')
+        return JsonResponse({'error': e.messages[0]}, status=400)
     except Exception as e:
-        logger.error(f"Error creating order: {str(e)}")
+        logger.error(f"Error processing order: {str(e)}")
+        record_checkout('order', 'error')
         return JsonResponse({'error': 'Error processing order'}, status=500)
     
-    calculated_total = float(order.get_cart_total)
-    
-    if calculated_total <= 0:
-        return JsonResponse({'error': 'Cart is empty'}, status=400)
-    
-    try:
-        client_total = float(data.get('form', {}).get('total', 0))
-        if abs(client_total - calculated_total) > 0.01:
-            logger.warning(f"Price mismatch: client={client_total}, server={calculated_total}")
-    except (ValueError, TypeError):
-        pass
-
-    order.transaction_id = transaction_id
-    order.complete = True
-    order.save()
-    
-    if order.shipping:
-        shipping_data = data.get('shipping', {})
-        required_fields = ['address', 'city', 'state', 'zipcode']
-        if not all(key in shipping_data for key in required_fields):
-            return JsonResponse({'error': 'Missing shipping information'}, status=400)
-        
-        try:
-            address = shipping_data['address'].strip()[:200]
-            city = shipping_data['city'].strip()[:200]
-            state = shipping_data['state'].strip()[:200]
-            zipcode = shipping_data['zipcode'].strip()[:200]
-            
-            if not all([address, city, state, zipcode]):
-                return JsonResponse({'error': 'All shipping fields are required'}, status=400)
-            
-            ShippingAddress.objects.create(
-                customer=customer,
-                order=order,
-                address=address,
-                city=city,
-                state=state,
-                zipcode=zipcode,
-            )
-        except Exception as e:
-            logger.error(f"Error creating shipping address: {str(e)}")
-            return JsonResponse({'error': 'Error saving shipping address'}, status=500)
-    
-    return JsonResponse({'success': True, 'message': 'Payment submitted', 'transaction_id': transaction_id}, status=200)
+    record_checkout('order', 'success')
+    response = JsonResponse({'success': True, 'message': 'Payment submitted', 'transaction_id': transaction_id}, status=200)
+    if guest:
+        # The guest cart is now an order
+        response.delete_cookie(CART_COOKIE)
+    return response
 
 def loginPage(request):
     """Handle user login"""
@@ -196,9 +241,14 @@ def loginPage(request):
         
         if user is not None:
             auth_login(request, user)
+            merged = mergeCookieCart(request, user)
             messages.success(request, f'Bienvenue {user.username} !')
             next_page = request.GET.get('next', 'store')
-            return redirect(next_page)
+            response = redirect(next_page)
+            if merged:
+                # The cart now lives in the order
+                response.delete_cookie(CART_COOKIE)
+            return response
         else:
             messages.error(request, 'Nom d\'utilisateur ou mot de passe incorrect')
     
@@ -236,10 +286,12 @@ def processPayment(request):
         
         if not all([card_number, card_holder, expiry, cvv]):
             messages.error(request, 'Veuillez remplir tous les champs')
+            record_checkout('payment', 'rejected')
             return redirect('payment')
         
         if card_number == '0000000000000000':
             messages.error(request, '❌ Paiement refusé ! Carte invalide ou fonds insuffisants.')
+            record_checkout('payment', 'declined')
             return redirect('payment')
         
         data = cartData(request)
@@ -247,12 +299,15 @@ def processPayment(request):
         
         if order.get_cart_total <= 0:
             messages.error(request, 'Votre panier est vide')
+            record_checkout('payment', 'rejected')
             return redirect('cart')
         
         transaction_id = datetime.datetime.now().timestamp()
-        order.transaction_id = str(transaction_id)
-        order.complete = True
-        order.save()
+        with transaction.atomic():
+            order.transaction_id = str(transaction_id)
+            order.complete = True
+            order.save(update_fields=['transaction_id', 'complete'])
+            enqueue('finalize_order', order_id=order.id)
         
         request.session['last_order'] = {
             'transaction_id': str(int(transaction_id)),
@@ -260,11 +315,13 @@ def processPayment(request):
             'items_count': order.get_cart_items
         }
         
+        record_checkout('payment', 'success')
         messages.success(request, '✅ Paiement réussi ! Votre commande a été confirmée.')
         return redirect('order_success')
         
     except Exception as e:
         logger.error(f"Error processing payment: {str(e)}")
+        record_checkout('payment', 'error')
         messages.error(request, 'Une erreur est survenue lors du paiement')
         return redirect('payment')
 
@@ -283,9 +340,17 @@ def orderSuccess(request):
         'date': datetime.datetime.now().strftime('%d/%m/%Y à %H:%M')
     })
     
-    response.set_cookie('cart', '{}')
+    response.delete_cookie(CART_COOKIE)
     
     if 'last_order' in request.session:
         del request.session['last_order']
     
-    return response
\ No newline at end of file
+    return response
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, aggregated over every gunicorn worker"""
+    if not scrape_allowed(request):
+        return HttpResponseForbidden()
+    payload, content_type = render_metrics()
+    return HttpResponse(payload, content_type=content_type)